@@ -537,7 +537,7 @@
 # app.py — Streamlit Cloud–ready
 import os
 from pathlib import Path
-import json, time, datetime
+import json, datetime
 import streamlit as st
 from dotenv import load_dotenv
 import re
@@ -545,8 +545,6 @@ import re
 # ------------- Streamlit setup (must be first) -------------
 st.set_page_config(page_title="AI Marketing Pipeline", page_icon="🧠", layout="wide")
 
-import re
-
 def strip_code_fences(text: str) -> str:
     """Remove ```json ... ``` or ``` ... ``` blocks & trim."""
     if not text:
@@ -609,16 +607,76 @@ if os.environ.get("GOOGLE_TOKEN_JSON"):
 load_dotenv(override=True)
 
 # ------------- Imports of local modules ---------------------
-import google_docs_client as gdocs
-import content_engine as ce
 import hubspot_client as hs
 import storage as store
 import simulate_metrics as sim
 import llm_summary as lsum
+import outbox
+import doc_publisher as publisher
+import engagement_ingest as engagement
+import jobs
+import metrics_rollup as rollup
+
+# ------------- Cached reads (invalidated by file mtime + size) -------------
+# Every widget interaction reruns this script; these make reruns skip disk reads and
+# parsing unless a file actually changed. The stamps are cheap stat() calls.
+def _stamp(path: str):
+    try:
+        st_ = os.stat(path)
+        return (st_.st_mtime_ns, st_.st_size)
+    except OSError:
+        return None
+
+def _dir_stamps(kind_dir: str):
+    # a directory's mtime changes when files are added/removed in it
+    return tuple((d, _stamp(d)) for d in [kind_dir] + store.list_partitions(kind_dir))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _read_json_cached(path: str, stamp) -> dict:
+    return store.read_json(path)
+
+def read_json_cached(path: str) -> dict:
+    return _read_json_cached(path, _stamp(path))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _list_content_cached(stamps) -> list:
+    return store.list_content_files()
+
+def list_content() -> list:
+    return _list_content_cached(_dir_stamps(store.CONTENT_DIR))
+
+def _metrics_files(start) -> list:
+    files = [f"{store.PERF_DIR}/{store.METRICS_FILE}"]
+    files += [f"{d}/{store.METRICS_FILE}" for d in store.list_partitions(store.PERF_DIR, start)]
+    return [(f, _stamp(f)) for f in files if os.path.exists(f)]
+
+# cache_resource: the raw frame is shared (not copied per rerun); treat it as read-only
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _metrics_df_cached(stamps, start):
+    import pandas as pd
+    rows = store.read_metrics(start=start)
+    return pd.DataFrame(rows) if rows else None
+
+def metrics_df(start):
+    """Raw metrics DataFrame for the window (None if empty), rebuilt only when a metrics file changes."""
+    return _metrics_df_cached(tuple(_metrics_files(start)), start)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _metric_chart_cached(stamps, start, metric, bucket, max_points):
+    return rollup.chart_frame(_metrics_df_cached(stamps, start), metric, bucket=bucket, max_points=max_points)
 
-# Best-effort HubSpot init (creates custom persona property if allowed)
+def metric_chart(start, metric: str, bucket: str, max_points):
+    """Bucketed per-persona mean/count for one metric, LTTB-capped; only this small frame reaches the browser."""
+    return _metric_chart_cached(tuple(_metrics_files(start)), start, metric, bucket, max_points)
+
+# Best-effort HubSpot init (creates custom persona property if allowed).
+# Cached per process, so reruns don't hit HubSpot again until the TTL expires.
 hs.init_crm()
 
+# Resume sends left pending/in flight by a previous process (no-op once running, or with
+# OUTBOX_EXTERNAL_WORKER=true)
+outbox.ensure_worker()
+
 st.title("AI Marketing Pipeline — Blog → Newsletters → Send → Performance")
 
 # ---------------------- Sidebar -----------------------------
@@ -636,44 +694,103 @@ with st.sidebar:
     st.markdown("**LLM Provider:** " + os.getenv("LLM_PROVIDER", "openai"))
     st.markdown("**HubSpot token set:** " + ("✅" if hs.hubspot_available() else "❌"))
     st.markdown("**Email send via API:** " + ("✅" if hs.can_send() else "❌ simulate"))
+    if st.button("Refresh HubSpot cache", key="refresh_hs_cache"):
+        hs.invalidate_cache()
+        hs.init_crm()
+        st.success("HubSpot property/list cache cleared.")
     st.divider()
     st.subheader("Helpful Docs")
     st.markdown("[Marketing Email API](https://developers.hubspot.com/docs/api-reference/marketing-marketing-emails-v3-v3/guide)")
     st.markdown("[Single-send API](https://developers.hubspot.com/docs/api-reference/marketing-single-send-v4/guide)")
     st.markdown("[Lists (Segments) API](https://developers.hubspot.com/docs/api-reference/crm-lists-v3/guide)")
 
-tab1, tab2, tab3, tab4 = st.tabs(["1) Generate Content", "2) Distribute", "3) Performance", "4) Data Browser"])
+# ---------------------- Background jobs ---------------------
+# Long work (generation, contact upserts + queueing sends) runs as jobs so reruns can't cut it
+# off; this panel polls their progress without rerunning the whole page.
+session_id = st.session_state.setdefault("session_id", os.urandom(6).hex())
+
+jobs_running = bool(jobs.active())
+
+@st.fragment(run_every=2 if jobs_running else None)
+def jobs_panel():
+    if jobs_running and not jobs.active():
+        st.rerun()  # everything finished: refresh the page once, which also stops polling
+    recent = jobs.recent(6)
+    if not recent:
+        st.caption("No background jobs yet.")
+        return
+    for j in recent:
+        mine = " (you)" if j.get("owner") == session_id else ""
+        st.progress(j["progress"] or 0.0, text=f"{j['kind']} · {j['state']}{mine} · {j.get('note') or ''}")
+        if j["state"] in ("error", "interrupted"):
+            st.error(j.get("error"))
+        elif j["state"] == "done" and j["kind"] == "send_personas":
+            by_persona = (j["result"].get("sent") or {}).values()
+            counts = {k: sum((r or {}).get(k, 0) for r in by_persona) for k in ("sent", "simulated", "pending", "failed")}
+            summary = ", ".join(f"{n} {k}" for k, n in counts.items() if n) or "nothing new"
+            st.caption(f"Outbox: {summary} across {len(by_persona)} persona(s) in {j['result'].get('wall_s', '?')}s wall time")
+    if not jobs_running:
+        st.button("Refresh jobs", key="jobs_refresh")
+
+with st.expander("Background jobs", expanded=jobs_running):
+    jobs_panel()
+
+# ------------- Views (only the selected one runs) -------------
+# st.tabs would execute every tab's body on each rerun, so views are plain functions picked
+# by a stateful selector. Streamlit drops the state of widgets that aren't rendered, so
+# view widgets keep their value under a separate key (keep()) while another view is shown.
+def _store_kept(key: str) -> None:
+    st.session_state[key] = st.session_state[f"_{key}"]
+
+def keep(key: str, default) -> dict:
+    """Widget kwargs whose value survives switching views; the value is st.session_state[key]."""
+    if key not in st.session_state:
+        st.session_state[key] = default
+    st.session_state[f"_{key}"] = st.session_state[key]
+    return {"key": f"_{key}", "on_change": _store_kept, "args": (key,)}
 
 # ---------------------- Tab 1: Generate ---------------------
-with tab1:
+def view_generate():
     st.subheader("Blog ideation and persona newsletters")
-    topic = st.text_input("Topic (weekly blog)", "Automation that actually ships: small stacks, big ROI")
+    topic = st.text_input("Topic (weekly blog)", **keep("topic", "Automation that actually ships: small stacks, big ROI"))
 
     if st.button("Generate blog + 3 newsletters", key="gen_blog_newsletters"):
-        payload = ce.make_blog_and_newsletters(topic)
-
-        # Create Google Doc and store the URL
-        try:
-            doc_url = gdocs.create_blog_doc(payload.get("topic", ""), payload.get("blog", ""))
-            payload["doc_url"] = doc_url
-            st.success(f"Google Doc created ✔  \n{doc_url}")
-            st.markdown(f"[Open the doc]({doc_url})")
-        except Exception as e:
-            payload["doc_url"] = ""
-            st.warning(f"Couldn’t create Google Doc automatically: {e}")
-
-        path = store.save_content(payload)
+        st.session_state["gen_job"] = jobs.submit("generate", {"topic": topic}, owner=session_id)
+
+    gen_job = jobs.get(st.session_state["gen_job"]) if st.session_state.get("gen_job") else None
+    gen_running = bool(gen_job) and gen_job["state"] in ("queued", "running")
+
+    @st.fragment(run_every=2 if gen_running else None)
+    def generation_result(job_id: str):
+        j = jobs.get(job_id)
+        if j and j["state"] in ("queued", "running"):
+            st.progress(j["progress"] or 0.0, text=j.get("note") or "queued")
+            return
+        if gen_running:
+            st.rerun()  # finished since this page rendered: redraw once with the result
+        if not j:
+            return
+        if j["state"] != "done":
+            st.error(f"Generation failed: {j.get('error')}")
+            return
+        path = j["result"]["path"]
+        payload = read_json_cached(path)
         st.success(f"Generated and saved: {path}")
+        # Google Doc is created in the background and its URL written back into the file
+        st.info("The Google Doc is created in the background; its link appears in tab 2 when ready.")
         st.text_area("Blog (editable before sending)", payload["blog"], height=260, key="blog_edit")
         st.write("Newsletters JSON:")
         st.json(payload["newsletters"])
 
+    if gen_job:
+        generation_result(gen_job["id"])
+
 # ---------------------- Tab 2: Distribute -------------------
-with tab2:
+def view_distribute():
     st.subheader("Distribute via HubSpot (or simulate)")
 
     # Get files and normalize for Windows/Linux
-    raw_files = store.list_content_files()
+    raw_files = list_content()
     def norm(p: str) -> str:
         return p.replace("\\", "/")
 
@@ -685,28 +802,30 @@ with tab2:
     if not files:
         st.info("No content yet. Generate in tab 1.")
     else:
-        choice = st.selectbox("Pick content file", files, index=len(files) - 1, key="content_choice")
-        data = store.read_json(choice)
+        # newest file is preselected, and again whenever a new one appears
+        if st.session_state.get("content_choice") not in files or st.session_state.get("content_count") != len(files):
+            st.session_state["content_choice"] = files[-1]
+        st.session_state["content_count"] = len(files)
+        choice = st.selectbox("Pick content file", files, **keep("content_choice", files[-1]))
+        data = read_json_cached(choice)
 
-        # One-time: auto-create a Google Doc if missing and save back to file
-        if not data.get("doc_url"):
-            try:
-                url = gdocs.create_blog_doc(
-                    title=data.get("topic", "Untitled"),
-                    body=data.get("blog", "")
-                )
-                data["doc_url"] = url
-                with open(choice, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                st.success("✅ Created Google Doc and saved its URL in the content file.")
-            except Exception as e:
-                st.warning(f"⚠️ Couldn’t create Doc automatically: {e}")
+        # Missing doc: queue it once in the background (deduped) instead of blocking this rerun
+        doc_status = publisher.submit(choice) if not data.get("doc_url") else None
 
         st.write(f"**Blog:** {data.get('topic','')}  |  slug: `{data.get('slug','')}`")
         if data.get("doc_url"):
             st.markdown(f"**Doc URL:** {data['doc_url']}  \n[Open the doc]({data['doc_url']})")
+        elif doc_status and doc_status.get("state") == "done":
+            data["doc_url"] = doc_status["doc_url"]
+            st.markdown(f"**Doc URL:** {data['doc_url']}  \n[Open the doc]({data['doc_url']})")
+        elif doc_status and doc_status.get("state") == "error":
+            st.warning(f"⚠️ Couldn’t create Doc automatically: {doc_status['error']}")
+            if st.button("Retry Google Doc", key="retry_doc"):
+                publisher.submit(choice, force=True)
+                st.rerun()
         else:
-            st.info("This content file has no `doc_url`. The CTA will fall back to BLOG_BASE_URL (if set).")
+            st.info("⏳ Google Doc is being created in the background. Until then the CTA falls back to BLOG_BASE_URL (if set).")
+            st.button("Check again", key="doc_check_again")
 
         st.text_area("Blog body", data.get("blog", ""), height=180, key="blog_readonly")
 
@@ -719,12 +838,18 @@ with tab2:
         st.markdown("**Audience and sending**")
         cols = st.columns(3)
 
-        send_date = st.date_input("Send date", value=datetime.date.today(), key="send_date")
+        send_date = st.date_input("Send date", **keep("send_date", datetime.date.today()))
         to_placeholder = st.text_input(
             "Optional test recipients (comma-separated emails). Leave blank to target persona lists",
-            key="test_recipients"
+            **keep("test_recipients", "")
+        )
+        mirror_age_min = st.number_input(
+            "Max contact mirror age (minutes) when targeting persona lists", min_value=0, step=5,
+            **keep("mirror_max_age", 15)
         )
 
+        typed_recipients = [e.strip() for e in to_placeholder.split(",") if e.strip()]
+
         # Helper to build properties for HubL tokens
         def build_props(keyp: str) -> dict:
             nl = (data.get("newsletters") or {}).get(keyp, {})  # the parsed JSON for this persona
@@ -765,17 +890,24 @@ with tab2:
             }
 
 
-        # Helper to send with graceful error surfacing
-        def do_send(keyp: str, addresses: list[str], props: dict):
-            try:
-                return hs.single_send_marketing_email(
-                    email_id=os.getenv("HUBSPOT_EMAIL_TEMPLATE_ID", "REPLACE_WITH_TEMPLATE_ID"),
-                    to_addresses=addresses,
-                    custom_props=props,
-                )
-            except Exception as e:
-                st.error(f"HubSpot send failed: {e}")
-                return {"mode": "error", "error": str(e)}
+        # Helper to submit a send job: it resolves recipients (typed, else the contact mirror),
+        # upserts contacts and queues the sends in the durable outbox
+        def submit_send(keys: list[str]) -> str:
+            personas = {
+                keyp: {
+                    "newsletter_id": f"{data.get('slug','')}-{keyp}",
+                    "props": build_props(keyp),
+                    "recipients": typed_recipients or None,
+                }
+                for keyp in keys
+            }
+            return jobs.submit("send_personas", {
+                "personas": personas,
+                "email_id": os.getenv("HUBSPOT_EMAIL_TEMPLATE_ID", "REPLACE_WITH_TEMPLATE_ID"),
+                "send_date": str(send_date),
+                "blog_title": data.get("topic", ""),
+                "mirror_max_age_s": mirror_age_min * 60,
+            }, owner=session_id)
 
         # Per-persona send
         for label, keyp in persona_map.items():
@@ -784,105 +916,114 @@ with tab2:
                 st.json((data.get("newsletters") or {}).get(keyp, {}))
 
                 if st.button(f"Send {label}", key=f"send_{keyp}"):
-                    seg = hs.ensure_persona_list(keyp)
-                    if seg.get("status") == "error":
-                        st.error(f"List error: {seg}")
-
-                    addresses = [e.strip() for e in to_placeholder.split(",") if e.strip()] or [f"{keyp}@example.com"]
-
-                    for addr in addresses:
-                        hs.upsert_contact(addr, {"persona": keyp})
-
-                    props = build_props(keyp)
-                    result = do_send(keyp, addresses, props)
-
-                    record = {
-                        "ts": int(time.time()),
-                        "send_date": str(send_date),
-                        "audience": keyp,
-                        "blog_title": data.get("topic", ""),
-                        "newsletter_id": f"{data.get('slug','')}-{keyp}",
-                        "hubspot_result": result,
-                    }
-                    store.append_send_log(record)
-                    st.success(f"Sent (or simulated). Result: {result}")
+                    job_id = submit_send([keyp])
+                    st.success(f"Send job {job_id} started; progress is under Background jobs.")
 
         if st.button("Send all personas", key="send_all_personas"):
-            for _, keyp in persona_map.items():
-                addresses = [e.strip() for e in to_placeholder.split(",") if e.strip()] or [f"{keyp}@example.com"]
-                for addr in addresses:
-                    hs.upsert_contact(addr, {"persona": keyp})
-
-                props = build_props(keyp)
-                result = do_send(keyp, addresses, props)
-
-                record = {
-                    "ts": int(time.time()),
-                    "send_date": str(send_date),
-                    "audience": keyp,
-                    "blog_title": data.get("topic", ""),
-                    "newsletter_id": f"{data.get('slug','')}-{keyp}",
-                    "hubspot_result": result,
-                }
-                store.append_send_log(record)
-            st.success("Sent (or simulated) to all personas.")
+            job_id = submit_send(list(persona_map.values()))
+            st.success(f"Send job {job_id} started for all personas; progress is under Background jobs.")
+
+        with st.expander("Outbox status", expanded=False):
+            for keyp in persona_map.values():
+                counts = outbox.status(f"{data.get('slug','')}-{keyp}")
+                st.write(f"{keyp}: {counts or 'nothing queued'}")
+            st.button("Refresh status", key="outbox_refresh")
 
         if st.button("Save blog edits", key="save_blog_edits"):
             data["blog"] = st.session_state.get("blog_readonly", data.get("blog", ""))
-            with open(choice, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            st.success(f"Saved changes back to {choice}.")
+            # the background publisher may have written doc_url since this rerun read the file
+            data["doc_url"] = data.get("doc_url") or read_json_cached(choice).get("doc_url", "")
+            store.overwrite_content(choice, data)
+            publisher.submit(choice, force=True)  # update the Google Doc in place (no-op if unchanged)
+            st.success(f"Saved changes back to {choice}; the Google Doc is updating in the background.")
 
         if not data.get("newsletters"):
             st.error("This content file has no newsletters.")
 
 # ---------------------- Tab 3: Performance -----------------
-with tab3:
+@st.fragment  # its controls only rerun this view
+def view_performance():
     st.subheader("Performance logging and AI summary")
-    st.caption("If you can't pull real metrics yet, simulate them to build the flow.")
-
-    cols = st.columns(3)
-    for idx, aud in enumerate(["founder", "creative", "ops"]):
-        with cols[idx]:
-            if st.button(f"Simulate 1 send for {aud}", key=f"sim_{aud}"):
-                m = sim.simulate_performance(aud)
-                store.append_metrics(m)
-                st.success(f"Logged: {m}")
+    if hs.hubspot_available():
+        st.caption("Engagement (opens, clicks, unsubscribes) is pulled from HubSpot's email events for logged sends.")
+        if st.button("Pull engagement from HubSpot", key="pull_engagement"):
+            try:
+                with st.spinner("Reading email events…"):
+                    res = engagement.ingest()
+                st.success(f"Ingested {res.get('events', 0)} events; updated {res.get('newsletters', 0)} newsletter(s).")
+            except Exception as e:
+                st.error(f"Engagement ingest failed: {e}")
+    else:
+        st.caption("If you can't pull real metrics yet, simulate them to build the flow.")
 
-    import pandas as pd
-    perf_path = "data/perf/metrics.jsonl"
-    if os.path.exists(perf_path):
-        rows = [json.loads(line) for line in open(perf_path, "r", encoding="utf-8").read().splitlines() if line.strip()]
-        if rows:
-            df = pd.DataFrame(rows)
+        cols = st.columns(3)
+        for idx, aud in enumerate(["founder", "creative", "ops"]):
+            with cols[idx]:
+                if st.button(f"Simulate 1 send for {aud}", key=f"sim_{aud}"):
+                    m = sim.simulate_performance(aud)
+                    store.append_metrics(m)
+                    st.success(f"Logged: {m}")
+
+    lookback = st.selectbox("Window", ["Last 7 days", "Last 30 days", "Last 90 days", "All time"], **keep("perf_window", "All time"))
+    days = {"Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90}.get(lookback)
+    start = datetime.date.today() - datetime.timedelta(days=days - 1) if days else None
+    if store.list_partitions(store.PERF_DIR) or os.path.exists(f"{store.PERF_DIR}/{store.METRICS_FILE}"):
+        df = metrics_df(start)
+        if df is not None:
             st.write("Recent metrics")
             st.dataframe(df.tail(30), use_container_width=True, hide_index=True)
-            st.line_chart(df.pivot_table(index="ts", columns="audience", values="open_rate").ffill())
-            st.line_chart(df.pivot_table(index="ts", columns="audience", values="click_rate").ffill())
-            st.line_chart(df.pivot_table(index="ts", columns="audience", values="unsub_rate").ffill())
+            c1, c2, c3 = st.columns(3)
+            bucket = c1.selectbox("Bucket", list(rollup.BUCKETS), **keep("perf_bucket", "day"))
+            downsample = c2.checkbox("Downsample (LTTB)", **keep("perf_lttb", True))
+            max_points = c3.number_input("Max points per persona", min_value=rollup.POINTS_RANGE[0],
+                                         max_value=rollup.POINTS_RANGE[1], step=50,
+                                         disabled=not downsample, **keep("perf_max_points", rollup.MAX_POINTS))
+            frame = None
+            for metric in ("open_rate", "click_rate", "unsub_rate"):
+                if metric in df:
+                    frame = metric_chart(start, metric, bucket, int(max_points) if downsample else None)
+                    st.caption(f"{metric} — mean per {bucket}")
+                    st.line_chart(frame, x="bucket", y="mean", color="audience")
+            if frame is not None:
+                st.caption(f"Records per {bucket}")
+                st.bar_chart(frame, x="bucket", y="count", color="audience")
             if st.button("Write AI performance summary", key="write_ai_summary"):
-                text = lsum.summarize_metrics(rows)
+                text = lsum.summarize_metrics(store.read_metrics(start=start))
                 store.dump_summary(text)
                 st.success("Summary updated.")
         else:
             st.info("No metrics logged yet.")
     else:
-        st.info("No metrics file found. Simulate above.")
+        st.info("No metrics file found. Pull or simulate above.")
 
     summ_path = "data/perf/summary.json"
     if os.path.exists(summ_path):
         st.write("Latest AI summary")
-        st.json(json.load(open(summ_path)))
+        st.json(read_json_cached(summ_path))
 
 # ---------------------- Tab 4: Data Browser ----------------
-with tab4:
+def view_data():
     st.subheader("Browse raw data")
-    st.code("data/content/*  data/perf/*.jsonl  data/crm/send_log.jsonl")
-    import glob
+    st.code("data/content/date=*/*.json  data/perf/date=*/metrics.jsonl  data/crm/date=*/send_log.jsonl")
     st.write("Content files")
-    for p in glob.glob("data/content/*.json"):
+    for p in list_content():
         st.write("-", p)
-    if os.path.exists("data/crm/send_log.jsonl"):
+    # only the newest partitions are needed for a 20-line tail
+    recent = [store.CRM_DIR] + store.list_partitions(store.CRM_DIR)[-3:]
+    recent = [f"{d}/{store.SEND_LOG_FILE}" for d in recent if os.path.exists(f"{d}/{store.SEND_LOG_FILE}")]
+    if recent:
         st.write("Send log (tail)")
-        tail = "\n".join(open("data/crm/send_log.jsonl", "r", encoding="utf-8").read().splitlines()[-20:])
+        lines = []
+        for p in recent:
+            lines.extend(open(p, "r", encoding="utf-8").read().splitlines())
+        tail = "\n".join(lines[-20:])
         st.code(tail or "(empty)")
+
+VIEWS = {
+    "1) Generate Content": view_generate,
+    "2) Distribute": view_distribute,
+    "3) Performance": view_performance,
+    "4) Data Browser": view_data,
+}
+view = st.radio("View", list(VIEWS), horizontal=True, label_visibility="collapsed", key="view")
+VIEWS[view]()
@@ -0,0 +1,55 @@
+"""
+Send throughput benchmark against the local HubSpot stand-in
+- Starts hubspot_mock_server in-process, points hubspot_client at it, upserts N contacts
+  in batches and single-sends to all of them with the parallel dispatcher.
+- Prints upsert/send wall time, throughput and how many calls the mock throttled.
+Usage: python bench_send.py [N] [concurrency] [--latency-ms 40] [--rate-limit 100]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import hubspot_mock_server as mock
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark sends against the HubSpot stand-in")
+    ap.add_argument("n", nargs="?", type=int, default=300)
+    ap.add_argument("concurrency", nargs="?", type=int, default=8)
+    ap.add_argument("--latency-ms", type=float, default=40.0)
+    ap.add_argument("--rate-limit", type=int, default=100)
+    ap.add_argument("--rate-interval-ms", type=int, default=10_000)
+    args = ap.parse_args(argv)
+
+    server, portal = mock.serve(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4,
+                                rate_limit=args.rate_limit, rate_interval_ms=args.rate_interval_ms)
+    # hubspot_client reads its config at import time, so point it at the mock first
+    os.environ.update({
+        "HUBSPOT_API_BASE": f"http://127.0.0.1:{server.server_address[1]}",
+        "HUBSPOT_AUTH_MODE": "private",
+        "HUBSPOT_PRIVATE_APP_TOKEN": "mock",
+        "HUBSPOT_SEND_ENABLED": "true",
+        "HUBSPOT_RATE_LIMIT": str(args.rate_limit),
+        "HUBSPOT_RATE_INTERVAL": str(args.rate_interval_ms / 1000.0),
+    })
+    import hubspot_client as hc
+
+    emails = [f"bench{i}@example.com" for i in range(args.n)]
+    t0 = time.perf_counter()
+    up = hc.upsert_contacts({"email": e, "properties": {"persona": "ops"}} for e in emails)
+    t_up = time.perf_counter() - t0
+
+    res = hc.single_send_marketing_email("123", emails, {"persona": "ops"}, concurrency=args.concurrency)
+    server.shutdown()
+
+    print(f"contacts: {args.n}  concurrency: {args.concurrency}  mock latency: {args.latency_ms:.0f} ms  "
+          f"limit: {args.rate_limit}/{args.rate_interval_ms} ms")
+    print(f"batch upsert: {t_up:.2f}s ({up['ok']} ok, {up['errors']} errors)")
+    print(f"send: {res['throughput']}")
+    print(f"mock: {portal.stats}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
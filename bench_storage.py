@@ -0,0 +1,76 @@
+"""
+Storage serializer benchmark
+- Writes N synthetic send-log records as JSONL with stdlib json and with storage's compact backend.
+- Reads them back (bulk log ingestion) both ways and prints timings + speedup.
+Usage: python bench_storage.py [N]
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+
+import storage as store
+
+
+def _records(n: int):
+    for i in range(n):
+        yield {
+            "ts": 1761233449 + i,
+            "send_date": "2025-10-23",
+            "audience": ("founder", "creative", "ops")[i % 3],
+            "blog_title": "Automation that actually ships, small stacks, big ROI",
+            "newsletter_id": f"automation-that-actually-ships-{i % 50}",
+            "hubspot_result": {
+                "status": "simulated",
+                "messageId": f"SIM-{1761233449 + i}-{i % 9999}",
+                "to": [f"user{i}@example.com"],
+                "props": {"persona": "founder", "blogSlug": "automation-that-actually-ships"},
+            },
+        }
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t0, out
+
+
+def main(n: int):
+    rows = list(_records(n))
+    with tempfile.TemporaryDirectory() as tmp:
+        std_path = os.path.join(tmp, "stdlib.jsonl")
+        fast_path = os.path.join(tmp, "fast.jsonl")
+
+        def write_std():
+            with open(std_path, "w", encoding="utf-8") as f:
+                for r in rows:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+        def write_fast():
+            with open(fast_path, "wb") as f:
+                for r in rows:
+                    f.write(store.dumps(r, "compact") + b"\n")
+
+        def read_std():
+            with open(std_path, "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f.read().splitlines() if line.strip()]
+
+        def read_fast():
+            return store.read_jsonl(fast_path)
+
+        w_std, _ = _timed(write_std)
+        w_fast, _ = _timed(write_fast)
+        r_std, a = _timed(read_std)
+        r_fast, b = _timed(read_fast)
+        assert a == b, "backends disagree on decoded records"
+
+    backend = "orjson" if store.orjson is not None else "stdlib (orjson not installed)"
+    print(f"records: {n}  compact backend: {backend}")
+    print(f"write  stdlib {w_std*1000:8.1f} ms | compact {w_fast*1000:8.1f} ms | x{w_std / w_fast:.2f}")
+    print(f"ingest stdlib {r_std*1000:8.1f} ms | compact {r_fast*1000:8.1f} ms | x{r_std / r_fast:.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,194 @@
+# contact_mirror.py — local SQLite mirror of HubSpot contacts for instant segmentation
+"""
+Keeps data/crm/contacts.db in step with HubSpot by incremental sync on lastmodifieddate:
+each run only asks search for contacts modified at/after the saved cursor, and the cursor is
+checkpointed in the same transaction as every page, so an interrupted sync resumes where it
+stopped. Persona segment queries are then answered locally instead of via the search API.
+
+    import contact_mirror as mirror
+    emails = mirror.persona_emails("founder", max_age_s=900)  # syncs first if older than 15 min
+
+In simulate mode (no HubSpot auth) the mirror holds the client's placeholder contacts under
+"sim:" ids; the first real sync deletes them.
+
+Limitations: search never returns archived/deleted contacts, so a contact deleted in HubSpot
+stays in the mirror until a full resync (sync(full=True)).
+Usage: python contact_mirror.py [--full]
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, Iterator, List, Optional
+
+import hubspot_client as hc
+import storage as store
+
+DB_PATH = os.getenv("CONTACT_MIRROR_DB", f"{store.CRM_DIR}/contacts.db")
+
+# Default freshness bound for callers that don't pass one (seconds)
+DEFAULT_MAX_AGE = float(os.getenv("CONTACT_MIRROR_MAX_AGE", "900"))
+
+_SYNC_PROPS = ["email", "firstname", "lastname", hc.PERSONA_PROP, "lastmodifieddate"]
+_SYNC_LOCK = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id           TEXT PRIMARY KEY,
+    email        TEXT,
+    firstname    TEXT,
+    lastname     TEXT,
+    persona      TEXT,
+    lastmodified INTEGER,
+    props        TEXT
+);
+CREATE INDEX IF NOT EXISTS contacts_persona ON contacts(persona);
+CREATE INDEX IF NOT EXISTS contacts_email ON contacts(email);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _get_state(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _set_state(conn: sqlite3.Connection, key: str, value: Any) -> None:
+    conn.execute("INSERT OR REPLACE INTO sync_state(key, value) VALUES (?, ?)", (key, str(value)))
+
+def _row(contact_id: str, p: Dict[str, Any]) -> tuple:
+    persona = p.get(hc.PERSONA_PROP) or ""
+    modified = hc._epoch_ms(p.get("lastmodifieddate"))
+    return (
+        str(contact_id),
+        (p.get("email") or "").lower() or None,
+        p.get("firstname"),
+        p.get("lastname"),
+        hc._PERSONA_VALUE_TO_KEY.get(persona, persona),
+        int(modified) if modified and str(modified).isdigit() else None,
+        json.dumps(p, ensure_ascii=False),
+    )
+
+_UPSERT = "INSERT OR REPLACE INTO contacts(id, email, firstname, lastname, persona, lastmodified, props) VALUES (?,?,?,?,?,?,?)"
+
+# ===== Sync =====
+def sync(
+    full: bool = False,
+    *,
+    max_age_s: Optional[float] = None,
+    page_size: int = hc.SEARCH_PAGE_SIZE,
+    checkpoint_every: int = 500,
+) -> Dict[str, Any]:
+    """
+    Pull contacts modified since the saved cursor (or everything with full=True) into the mirror.
+    Returns counts and the new cursor. Concurrent callers in this process run one at a time;
+    with max_age_s, a caller that waited while another one synced returns without syncing again.
+    """
+    with _SYNC_LOCK:
+        started = time.time()
+        conn = _connect()
+        try:
+            last = _get_state(conn, "last_sync")
+            if not full and max_age_s is not None and last and started - float(last) <= max_age_s:
+                return {"status": "fresh", "synced": 0, "age_s": round(started - float(last), 3)}
+            cursor = None if full else _get_state(conn, "cursor")
+
+            if not hc.hubspot_available():
+                # simulate mode: mirror the same placeholder contacts the client would return
+                n = 0
+                for key in ("founder", "creative", "ops"):
+                    for c in hc.iter_contacts_by_persona(key):
+                        email = c["email"]
+                        conn.execute(_UPSERT, _row(f"sim:{email}", {"email": email, hc.PERSONA_PROP: c.get("persona")}))
+                        n += 1
+                _set_state(conn, "last_sync", started)
+                conn.commit()
+                return {"status": "simulated", "synced": n, "cursor": cursor}
+
+            # placeholders from simulate mode
+            purged = conn.execute("DELETE FROM contacts WHERE id LIKE 'sim:%'").rowcount
+            conn.commit()
+
+            filters = [{"propertyName": "lastmodifieddate", "operator": "GTE", "value": cursor}] if cursor else []
+            hits = hc._iter_search(
+                "contacts", filters, _SYNC_PROPS, page_size=page_size, sort_prop="lastmodifieddate"
+            )
+            n, newest = 0, int(cursor) if cursor else 0
+            for hit in hits:
+                row = _row(hit.get("id"), hit.get("properties") or {})
+                conn.execute(_UPSERT, row)
+                n += 1
+                if row[5] and row[5] > newest:
+                    newest = row[5]
+                if n % checkpoint_every == 0:
+                    # results arrive in lastmodifieddate order, so everything up to newest is mirrored
+                    _set_state(conn, "cursor", newest)
+                    conn.commit()
+            if newest:
+                _set_state(conn, "cursor", newest)
+            _set_state(conn, "last_sync", started)
+            conn.commit()
+            return {"status": "ok", "synced": n, "purged": purged, "cursor": newest or None,
+                    "elapsed_s": round(time.time() - started, 3)}
+        finally:
+            conn.close()
+
+def last_sync_age() -> Optional[float]:
+    conn = _connect()
+    try:
+        ts = _get_state(conn, "last_sync")
+    finally:
+        conn.close()
+    return time.time() - float(ts) if ts else None
+
+def ensure_fresh(max_age_s: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Sync if the mirror is older than max_age_s (DEFAULT_MAX_AGE when None). Returns the sync result, if any."""
+    bound = DEFAULT_MAX_AGE if max_age_s is None else max_age_s
+    age = last_sync_age()
+    if age is None or age > bound:
+        return sync(max_age_s=bound)
+    return None
+
+# ===== Queries =====
+def iter_persona(persona_value_or_key: str, *, max_age_s: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """Stream mirrored contacts for a persona (UI key or enum value), syncing first if stale."""
+    ensure_fresh(max_age_s)
+    key = hc._PERSONA_VALUE_TO_KEY.get(persona_value_or_key, persona_value_or_key)
+    conn = _connect()
+    try:
+        cur = conn.execute(
+            "SELECT id, email, firstname, lastname, persona FROM contacts WHERE persona = ? AND email IS NOT NULL ORDER BY id",
+            (key,),
+        )
+        for cid, email, first, last, persona in cur:
+            yield {"id": cid, "email": email, "firstname": first, "lastname": last, "persona": persona}
+    finally:
+        conn.close()
+
+def persona_emails(persona_value_or_key: str, *, max_age_s: Optional[float] = None) -> List[str]:
+    return [c["email"] for c in iter_persona(persona_value_or_key, max_age_s=max_age_s)]
+
+def counts_by_persona() -> Dict[str, int]:
+    conn = _connect()
+    try:
+        return dict(conn.execute("SELECT persona, COUNT(*) FROM contacts GROUP BY persona").fetchall())
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    res = sync(full="--full" in sys.argv[1:])
+    print(f"✅ Mirror sync: {res}")
+    print(f"Contacts by persona: {counts_by_persona()}")
@@ -201,6 +201,7 @@ import os
 import json
 import time
 import re
+import functools
 from typing import Dict, Any, Optional
 from slugify import slugify
 from dotenv import load_dotenv
@@ -212,15 +213,20 @@ PROVIDER = (os.getenv("LLM_PROVIDER") or "openai").strip().lower()
 DEFAULT_OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo-0125").strip()
 DEFAULT_GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
 
-def _get_openai_client():
+@functools.lru_cache(maxsize=4)
+def _openai_client_for(key: str):
+    # one client (and its HTTP connection pool) per API key for the life of the process
     try:
         from openai import OpenAI
     except Exception:
         return None
+    return OpenAI(api_key=key)
+
+def _get_openai_client():
     key = (os.getenv("OPENAI_API_KEY") or "").strip().strip('"').strip("'")
     if not key:
         return None
-    return OpenAI(api_key=key)
+    return _openai_client_for(key)
 
 def _get_openai_model() -> str:
     """
@@ -0,0 +1,88 @@
+# doc_publisher.py — create Google Docs for content files in the background
+"""
+Streamlit reruns must never wait on Google APIs. submit(path) queues doc publishing for a
+content file at most once at a time (in-flight dedup per path) on a small worker pool.
+Publishing goes through google_docs_client.upsert_blog_doc, so a content file keeps one doc that
+is updated in place (and skipped when unchanged); its URL is written back into the content file
+as doc_url via storage.overwrite_content. status(path) tells the UI whether a doc is pending, done or
+failed (failed files are retried only after RETRY_AFTER_S, or when forced).
+
+    import doc_publisher as publisher
+    publisher.submit(path)          # returns immediately
+    publisher.status(path)          # {"state": "pending"} / {"state": "done", "doc_url": ...} / ...
+"""
+from __future__ import annotations
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Optional
+
+import google_docs_client as gdocs
+import storage as store
+
+WORKERS = int(os.getenv("DOC_PUBLISH_WORKERS", "2"))
+RETRY_AFTER_S = float(os.getenv("DOC_PUBLISH_RETRY_AFTER", "300"))
+
+_POOL = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="doc-publisher")
+_LOCK = threading.Lock()
+_INFLIGHT: Dict[str, Future] = {}
+_DONE: Dict[str, Dict[str, Any]] = {}
+_AGAIN: set = set()  # forced while in flight: publish once more when the current run ends
+
+def _key(path: str) -> str:
+    return os.path.normpath(str(path))
+
+def _publish(path: str) -> str:
+    data = store.read_json(path)
+    # one doc per content file: files from different days can share a slug
+    key = os.path.splitext(os.path.basename(path))[0]
+    url = gdocs.upsert_blog_doc(key, data.get("topic", "Untitled"), data.get("blog", ""), known_url=data.get("doc_url") or "")
+    # re-read so edits saved while the doc was being written are kept
+    data = store.read_json(path)
+    if data.get("doc_url") != url:
+        data["doc_url"] = url
+        store.overwrite_content(path, data)
+    return url
+
+def _finish(key: str, path: str, fut: Future) -> None:
+    with _LOCK:
+        _INFLIGHT.pop(key, None)
+        err = fut.exception()
+        if err is None:
+            _DONE[key] = {"state": "done", "doc_url": fut.result(), "ts": time.time()}
+        else:
+            _DONE[key] = {"state": "error", "error": f"{type(err).__name__}: {err}", "ts": time.time()}
+        again = key in _AGAIN
+        _AGAIN.discard(key)
+    if again:
+        submit(path, force=True)
+
+def submit(path: str, *, force: bool = False) -> Dict[str, Any]:
+    """Queue doc creation for a content file unless it is already queued, done, or recently failed."""
+    key = _key(path)
+    with _LOCK:
+        if key in _INFLIGHT:
+            if force:
+                _AGAIN.add(key)
+            return {"state": "pending"}
+        last = _DONE.get(key)
+        if last and not force and (last["state"] == "done" or time.time() - last["ts"] < RETRY_AFTER_S):
+            return dict(last)
+        fut = _POOL.submit(_publish, path)
+        _INFLIGHT[key] = fut
+    fut.add_done_callback(lambda f: _finish(key, path, f))
+    return {"state": "pending"}
+
+def status(path: str) -> Optional[Dict[str, Any]]:
+    key = _key(path)
+    with _LOCK:
+        if key in _INFLIGHT:
+            return {"state": "pending"}
+        last = _DONE.get(key)
+        return dict(last) if last else None
+
+def pending() -> int:
+    with _LOCK:
+        return len(_INFLIGHT)
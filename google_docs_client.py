@@ -129,15 +129,18 @@
 
 # google_docs_client.py
 from __future__ import annotations
-import os, json, time
-from typing import Optional
+import os, re, json, time, hashlib, threading
+from typing import Dict, Any, Optional, Tuple
 
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaInMemoryUpload
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 
+import storage as store
+
 SCOPES = [
     "https://www.googleapis.com/auth/documents",
     "https://www.googleapis.com/auth/drive",
@@ -145,45 +148,185 @@ SCOPES = [
 
 TOKEN_PATH = "token.json"
 CREDS_PATH = "credentials.json"
-
-def _get_creds():
-    creds: Optional[Credentials] = None
-    if os.path.exists(TOKEN_PATH):
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDS_PATH, SCOPES)
-            creds = flow.run_local_server(port=0)
+INDEX_PATH = f"{store.CONTENT_DIR}/google_docs_index.json"  # content key -> {documentId, hash, url}
+
+# Process-wide credentials: token.json is read once and refreshed in memory; the file is
+# rewritten only when the token actually changes (refresh or new consent).
+_CREDS: Optional[Credentials] = None
+_CREDS_JSON: Optional[str] = None  # what token.json currently holds
+_CREDS_LOCK = threading.Lock()
+
+# Service objects per thread (httplib2 connections are not thread-safe), built from the
+# discovery documents bundled with google-api-python-client, so no discovery fetch happens.
+_LOCAL = threading.local()
+
+def _save_creds_if_changed(creds: Credentials) -> None:
+    global _CREDS_JSON
+    data = creds.to_json()
+    if data != _CREDS_JSON:
         with open(TOKEN_PATH, "w") as f:
-            f.write(creds.to_json())
-    return creds
+            f.write(data)
+        _CREDS_JSON = data
 
-def create_blog_doc(title: str, body: str, *, make_public: bool = True) -> str:
-    """Create a Google Doc for the blog and return its webViewLink."""
+def _get_creds():
+    global _CREDS, _CREDS_JSON
+    with _CREDS_LOCK:
+        creds = _CREDS
+        if creds is None and os.path.exists(TOKEN_PATH):
+            with open(TOKEN_PATH) as f:
+                _CREDS_JSON = f.read()
+            creds = Credentials.from_authorized_user_info(json.loads(_CREDS_JSON), SCOPES)
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(CREDS_PATH, SCOPES)
+                creds = flow.run_local_server(port=0)
+            _save_creds_if_changed(creds)
+        _CREDS = creds
+        return creds
+
+def _persist_refreshed_creds() -> None:
+    # the HTTP layer may have refreshed the token mid-call; persist it if so
+    with _CREDS_LOCK:
+        if _CREDS is not None:
+            _save_creds_if_changed(_CREDS)
+
+def _services() -> Tuple[object, object]:
+    """(docs, drive) service objects for this thread, rebuilt only if the credentials object changed."""
     creds = _get_creds()
-    docs = build("docs", "v1", credentials=creds)
-    drive = build("drive", "v3", credentials=creds)
+    if getattr(_LOCAL, "creds", None) is not creds:
+        _LOCAL.docs = build("docs", "v1", credentials=creds, static_discovery=True, cache_discovery=False)
+        _LOCAL.drive = build("drive", "v3", credentials=creds, static_discovery=True, cache_discovery=False)
+        _LOCAL.creds = creds
+    return _LOCAL.docs, _LOCAL.drive
+
+GOOGLE_DOC_MIME = "application/vnd.google-apps.document"
+
+def doc_url(doc_id: str) -> str:
+    return f"https://docs.google.com/document/d/{doc_id}/edit?usp=sharing"
+
+def _make_public(drive, file_id: str) -> None:
+    try:
+        drive.permissions().create(
+            fileId=file_id,
+            body={"type": "anyone", "role": "reader"},
+            fields="id",
+        ).execute()
+    except HttpError:
+        pass
+
+def _doc_text(title: str, body: str) -> str:
+    return f"{title}\n\n{body or ''}"
+
+def _import_doc(drive, title: str, body: str, *, make_public: bool) -> Tuple[str, str]:
+    media = MediaInMemoryUpload(_doc_text(title, body).encode("utf-8"), mimetype="text/plain", resumable=False)
+    meta = drive.files().create(
+        body={"name": title or "Untitled", "mimeType": GOOGLE_DOC_MIME},
+        media_body=media,
+        fields="id,webViewLink",
+    ).execute()
+    if make_public:
+        _make_public(drive, meta["id"])
+    return meta["id"], meta.get("webViewLink") or doc_url(meta["id"])
+
+def create_blog_doc(title: str, body: str, *, make_public: bool = True, fast: bool = True) -> str:
+    """
+    Create a Google Doc for the blog and return its webViewLink.
+    fast=True uploads the text through Drive files.create with conversion to a Google Doc,
+    which creates the doc, fills it and returns its link in one call (two with make_public).
+    fast=False keeps the Docs API route (create + batchUpdate + permission + files.get).
+    """
+    docs, drive = _services()
+
+    if fast:
+        doc_id, url = _import_doc(drive, title, body, make_public=make_public)
+        _persist_refreshed_creds()
+        return url
 
     doc = docs.documents().create(body={"title": title or "Untitled"}).execute()
     doc_id = doc["documentId"]
 
     requests = [
         {"insertText": {"location": {"index": 1},
-                        "text": f"{title}\n\n{body or ''}"}}
+                        "text": _doc_text(title, body)}}
     ]
     docs.documents().batchUpdate(documentId=doc_id, body={"requests": requests}).execute()
 
     if make_public:
+        _make_public(drive, doc_id)
+
+    _persist_refreshed_creds()
+    return doc_url(doc_id)
+
+
+# ===== Content file -> doc index =====
+# Keyed per content file ("<YYYYMMDD>-<slug>", the file name), not by slug alone: the same
+# topic generated on different days has the same slug but is a different post with its own doc.
+_INDEX_LOCK = threading.Lock()
+_DOC_ID_RE = re.compile(r"/document/d/([A-Za-z0-9_-]+)")
+
+def _load_index() -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(INDEX_PATH):
+        return {}
+    try:
+        raw = store.read_json(INDEX_PATH)
+    except Exception:
+        return {}
+    # older entries are a bare documentId string
+    return {key: (v if isinstance(v, dict) else {"documentId": v, "hash": None, "url": doc_url(v)})
+            for key, v in raw.items()}
+
+def _save_index(index: Dict[str, Dict[str, Any]]) -> None:
+    os.makedirs(os.path.dirname(INDEX_PATH) or ".", exist_ok=True)
+    store.write_doc(INDEX_PATH, index, fmt="pretty")
+
+def _content_hash(title: str, body: str) -> str:
+    return hashlib.sha256(_doc_text(title, body).encode("utf-8")).hexdigest()
+
+def _replace_body(docs, doc_id: str, title: str, body: str) -> None:
+    """Swap the whole body of an existing doc for the new text (one read, one batchUpdate)."""
+    doc = docs.documents().get(documentId=doc_id, fields="body(content(endIndex))").execute()
+    end = max((c.get("endIndex", 1) for c in (doc.get("body") or {}).get("content") or []), default=1)
+    requests = []
+    if end > 2:  # the final newline of a doc can't be deleted
+        requests.append({"deleteContentRange": {"range": {"startIndex": 1, "endIndex": end - 1}}})
+    requests.append({"insertText": {"location": {"index": 1}, "text": _doc_text(title, body)}})
+    docs.documents().batchUpdate(documentId=doc_id, body={"requests": requests}).execute()
+
+def upsert_blog_doc(key: str, title: str, body: str, *, make_public: bool = True, known_url: str = "") -> str:
+    """
+    Create or update the one Google Doc for a content file (key, e.g. its file name without
+    extension) and return its URL. Unchanged content (same hash as last written) makes no API
+    calls; changed content is replaced in place in the existing doc. known_url (the file's
+    doc_url) wins over the index, so a doc created before the index existed is adopted instead
+    of a second one being created.
+    """
+    digest = _content_hash(title, body)
+    with _INDEX_LOCK:
+        entry = _load_index().get(key)
+    m = _DOC_ID_RE.search(known_url or "")
+    if m and (not entry or entry.get("documentId") != m.group(1)):
+        entry = {"documentId": m.group(1), "hash": None, "url": known_url}
+    if entry and entry.get("hash") == digest:
+        return entry["url"]
+
+    docs, drive = _services()
+    doc_id = entry["documentId"] if entry else None
+    url = entry.get("url") if entry else None
+    if doc_id:
         try:
-            drive.permissions().create(
-                fileId=doc_id,
-                body={"type": "anyone", "role": "reader"},
-                fields="id",
-            ).execute()
-        except HttpError:
-            pass
-
-    file_meta = drive.files().get(fileId=doc_id, fields="webViewLink").execute()
-    return file_meta.get("webViewLink")
+            _replace_body(docs, doc_id, title, body)
+        except HttpError as e:
+            if getattr(e, "resp", None) is None or e.resp.status not in (403, 404):
+                raise
+            doc_id = None  # deleted or no longer ours: start a fresh doc
+    if not doc_id:
+        doc_id, url = _import_doc(drive, title, body, make_public=make_public)
+    _persist_refreshed_creds()
+
+    with _INDEX_LOCK:
+        index = _load_index()
+        index[key] = {"documentId": doc_id, "hash": digest, "url": url or doc_url(doc_id)}
+        _save_index(index)
+    return index[key]["url"]
@@ -0,0 +1,328 @@
+# hubspot_async.py — asyncio HubSpot client with the same surface as hubspot_client
+"""
+Async versions of the hubspot_client calls, built on httpx so HubSpot I/O can overlap
+with LLM or Google Docs work. Config, auth (including the cached OAuth token), the
+process-wide rate limiter and the request/response shapes all come from hubspot_client,
+and simulate mode falls through to the sync functions (they do no I/O there).
+
+Sync callers can drive any coroutine with run_sync(), which runs it on one long-lived
+background loop so its connection pool is reused across calls:
+
+    import hubspot_async as hsa
+    res = hsa.run_sync(hsa.single_send_marketing_email(email_id, addresses, props))
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+
+import hubspot_client as hc
+
+log = logging.getLogger(__name__)
+
+# One pooled AsyncClient per event loop (httpx clients are bound to the loop they run on)
+_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def _client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=hc.POOL_SIZE, max_keepalive_connections=hc.POOL_SIZE),
+            transport=httpx.AsyncHTTPTransport(retries=hc.CONNECT_RETRIES),  # connect errors only
+            headers={"Accept-Encoding": "gzip, deflate"},
+            timeout=hc.DEFAULT_TIMEOUT,
+        )
+        _CLIENTS[loop] = client
+    return client
+
+async def aclose() -> None:
+    """Close the pooled client for the running loop."""
+    client = _CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+# ===== Transport =====
+async def _headers() -> Dict[str, str]:
+    if hc.AUTH_MODE == "oauth":
+        # the token cache is shared with the sync client; a refresh may block, so keep it off the loop
+        return await asyncio.to_thread(hc._headers)
+    return hc._headers()
+
+async def _throttle() -> None:
+    wait = hc._LIMITER.reserve()
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+async def _send(
+    method: str,
+    path: str,
+    *,
+    params: Optional[Dict[str, Any]] = None,
+    body: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+    retry_statuses=hc._RETRY_STATUSES,
+) -> httpx.Response:
+    url = f"{hc.BASE}{path}"
+    log.debug("HubSpot call: %s %s", method, url)
+    hc._RETRY_BUDGET.deposit()
+    attempt, reauthed = 0, False
+    while True:
+        await _throttle()
+        resp = await _client().request(
+            method, url, headers=await _headers(), params=params, json=body, timeout=timeout or hc.DEFAULT_TIMEOUT
+        )
+        if resp.status_code == 401 and hc.AUTH_MODE == "oauth" and not reauthed:
+            hc.invalidate_oauth_token()
+            reauthed = True
+            continue
+        delay = hc._retry_delay(resp, attempt, retry_statuses)
+        if delay is None:
+            return resp
+        attempt += 1
+        log.info("HubSpot retry %d/%d after %d: waiting %.2fs", attempt, hc.MAX_RETRIES, resp.status_code, delay)
+        await asyncio.sleep(delay)
+
+async def _req(
+    method: str,
+    path: str,
+    *,
+    params: Optional[Dict[str, Any]] = None,
+    body: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    resp = await _send(method, path, params=params, body=body, timeout=timeout)
+    if resp.status_code >= 300:
+        try:
+            detail = resp.json()
+        except Exception:
+            detail = resp.text
+        raise RuntimeError(f"{method} {path} failed [{resp.status_code}] -> {detail}")
+    try:
+        return resp.json()
+    except Exception:
+        return {"status": "ok", "text": resp.text}
+
+# ===== Persona property management =====
+async def ensure_persona_property() -> Dict[str, Any]:
+    if not hc.hubspot_available():
+        return hc.ensure_persona_property()
+    if hc._cache_get(f"property:{hc.PERSONA_PROP}"):
+        return {"status": "ok", "property_name": hc.PERSONA_PROP, "created": False, "cached": True}
+
+    r = await _send("GET", f"/crm/v3/properties/contacts/{hc.PERSONA_PROP}")
+    if r.status_code == 200:
+        hc._cache_put(f"property:{hc.PERSONA_PROP}", True)
+        return {"status": "ok", "property_name": hc.PERSONA_PROP, "created": False}
+    if r.status_code != 404:
+        return {"status": "error", "code": r.status_code, "detail": r.text}
+
+    cr = await _send("POST", "/crm/v3/properties/contacts", body=hc._PERSONA_PROPERTY_DEF)
+    if cr.status_code >= 300:
+        return hc._error(cr)
+    hc._cache_put(f"property:{hc.PERSONA_PROP}", True)
+    return {"status": "ok", "property_name": hc.PERSONA_PROP, "created": True}
+
+# ===== Contacts =====
+async def upsert_contact(email: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    if not hc.hubspot_available():
+        return hc.upsert_contact(email, properties)
+
+    payload = {"properties": {"email": email, **hc._contact_props(properties)}}
+    update = await _send("PATCH", f"/crm/v3/objects/contacts/{email}", params={"idProperty": "email"}, body=payload)
+    if update.status_code == 404:
+        create = await _send("POST", "/crm/v3/objects/contacts", body=payload)
+        if create.status_code >= 300:
+            return hc._error(create)
+        return {"status": "ok", **create.json()}
+    if update.status_code >= 300:
+        return hc._error(update)
+    return {"status": "ok", **update.json()}
+
+async def _iter_search(
+    object_type: str,
+    filters: List[Dict[str, Any]],
+    properties: List[str],
+    *,
+    page_size: int = hc.SEARCH_PAGE_SIZE,
+    prefetch: bool = True,
+    sort_prop: str = "hs_object_id",
+) -> AsyncIterator[Dict[str, Any]]:
+    """Async counterpart of hubspot_client._iter_search (same _SearchWalk paging and restarts)."""
+    walk = hc._SearchWalk(object_type, filters, properties, page_size=page_size, sort_prop=sort_prop)
+
+    async def fetch(state: Dict[str, Any]) -> Dict[str, Any]:
+        return await _req("POST", walk.path, body=walk.body(state))
+
+    state = walk.start()
+    res = await fetch(state)
+    pending: Optional[asyncio.Task] = None
+    try:
+        while True:
+            nxt = walk.following(state, res)
+            pending = asyncio.create_task(fetch(nxt)) if (prefetch and nxt) else None
+            for hit in walk.fresh(state, res.get("results") or []):
+                yield hit
+            if not nxt:
+                return
+            state = nxt
+            res = await pending if pending else await fetch(state)
+            pending = None
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+async def iter_contacts_by_persona(
+    persona_value_or_key: str,
+    *,
+    page_size: int = hc.SEARCH_PAGE_SIZE,
+    properties: Optional[List[str]] = None,
+    prefetch: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Async counterpart of hubspot_client.iter_contacts_by_persona."""
+    if not hc.hubspot_available():
+        for item in hc.iter_contacts_by_persona(persona_value_or_key):
+            yield item
+        return
+
+    persona_value = hc._PERSONA_KEY_TO_VALUE.get(persona_value_or_key, persona_value_or_key)
+    wanted, fetch_props = hc._projection(properties)
+    filters = [{"propertyName": hc.PERSONA_PROP, "operator": "EQ", "value": persona_value}]
+    async for hit in _iter_search("contacts", filters, fetch_props, page_size=page_size, prefetch=prefetch):
+        yield hc._contact_item(hit, wanted)
+
+async def search_contacts_by_persona(persona_value_or_key: str, limit: Optional[int] = None) -> Dict[str, Any]:
+    if not hc.hubspot_available():
+        return hc.search_contacts_by_persona(persona_value_or_key, limit)
+
+    items: List[Dict[str, Any]] = []
+    async for item in iter_contacts_by_persona(persona_value_or_key):
+        items.append(item)
+        if limit is not None and len(items) >= limit:
+            break
+    return {"status": "ok", "count": len(items), "results": items}
+
+# ===== Segments / Lists =====
+async def ensure_persona_list(persona_key: str) -> Dict[str, Any]:
+    if not hc.hubspot_available():
+        return hc.ensure_persona_list(persona_key)
+
+    list_name = f"[Auto] Persona: {persona_key}"
+    persona_value = hc._PERSONA_KEY_TO_VALUE.get(persona_key, persona_key)
+    cached = hc._cache_get(f"list:{list_name}")
+    if cached:
+        return {"status": "ok", "list_id": cached, "name": list_name, "created": False, "cached": True}
+
+    try:
+        params: Optional[Dict[str, Any]] = {"limit": 100}
+        while params:
+            page = await _req("GET", "/crm/v3/lists", params=params)
+            list_id = hc._scan_lists_page(page, list_name)
+            if list_id:
+                return {"status": "ok", "list_id": list_id, "name": list_name, "created": False}
+            params = hc._next_lists_params(page)
+
+        created = await _req("POST", "/crm/v3/lists", body=hc._persona_list_def(list_name, persona_value))
+        list_id = created.get("listId") or created.get("id")
+        if list_id:
+            hc._cache_put(f"list:{list_name}", list_id)
+        return {"status": "ok", "list_id": list_id, "name": list_name, "created": True}
+    except Exception as e:
+        return {
+            "status": "simulated",
+            "list_id": f"sim-list-{persona_key}",
+            "name": list_name,
+            "note": f"{type(e).__name__}: {e}",
+        }
+
+# ===== Single-send =====
+async def _single_send_one(
+    eid: int, addr: str, custom_props: Dict[str, Any], retry_statuses=hc._SINGLE_SEND_RETRY_STATUSES
+) -> Dict[str, Any]:
+    try:
+        resp = await _send(
+            "POST", "/marketing/v4/email/single-send", body=hc._single_send_body(eid, addr, custom_props),
+            timeout=hc.SEND_TIMEOUT, retry_statuses=retry_statuses,
+        )
+    except httpx.HTTPError as e:
+        # only a failed connect guarantees nothing was delivered
+        never_sent = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+        return {"to": addr, "error": f"{type(e).__name__}: {e}", "retryable": never_sent}
+    return hc._single_send_outcome(addr, resp)
+
+async def single_send_marketing_email(
+    email_id,
+    to_addresses,
+    custom_props=None,
+    *,
+    concurrency: Optional[int] = None,
+    retries: Optional[int] = None,
+    retry_statuses=hc._SINGLE_SEND_RETRY_STATUSES,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+):
+    """Async counterpart of hubspot_client.single_send_marketing_email (same result shape)."""
+    if not hc.can_send():
+        return hc._simulated_send(email_id, to_addresses, custom_props)
+
+    eid = hc._template_id(email_id)
+    addresses = list(to_addresses)
+    props = custom_props or {}
+    workers = max(1, int(concurrency or hc.SEND_CONCURRENCY))
+    rounds = 1 + max(0, hc.SEND_RETRIES if retries is None else int(retries))
+    gate = asyncio.Semaphore(workers)
+
+    async def one(i: int) -> int:
+        async with gate:
+            results[i] = await _single_send_one(eid, addresses[i], props, retry_statuses)
+        return i
+
+    started = time.monotonic()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(addresses)
+    todo = list(range(len(addresses)))
+    for attempt in range(1, rounds + 1):
+        retry_next = []
+        for fut in asyncio.as_completed([one(i) for i in todo]):
+            i = await fut
+            res = results[i]
+            res["attempts"] = attempt
+            if "error" in res and res["retryable"] and attempt < rounds:
+                retry_next.append(i)
+                continue
+            if on_result:
+                on_result(res)
+        todo = sorted(retry_next)
+        if not todo:
+            break
+        await asyncio.sleep(min(8.0, 0.5 * 2 ** (attempt - 1)))
+
+    return hc._send_report(results, time.monotonic() - started, workers)
+
+# ===== Sync shim =====
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None or _LOOP.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="hubspot-async", daemon=True).start()
+            _LOOP = loop
+    return _LOOP
+
+def run_sync(coro, timeout: Optional[float] = None):
+    """Run a coroutine from this module to completion from synchronous code (any thread)."""
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_sync() called from the hubspot_async loop itself; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
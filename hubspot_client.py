@@ -641,12 +641,23 @@
 from __future__ import annotations
 
 import os
-import json
 import time
+import datetime
 import random
-from typing import Dict, Any, List, Optional
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.retry import Retry
+
+import storage
+
+log = logging.getLogger(__name__)
 
 # ===== Config =====
 BASE = os.getenv("HUBSPOT_API_BASE", "https://api.hubapi.com").rstrip("/")
@@ -660,6 +671,51 @@ HUB_TOKEN = os.getenv("HUBSPOT_PRIVATE_APP_TOKEN", "").strip()
 # Sending gate
 SEND_ENABLED = os.getenv("HUBSPOT_SEND_ENABLED", "false").lower() == "true"
 
+# Connection pool / transport
+POOL_SIZE = int(os.getenv("HUBSPOT_POOL_SIZE", "20"))
+CONNECT_RETRIES = int(os.getenv("HUBSPOT_CONNECT_RETRIES", "3"))
+DEFAULT_TIMEOUT = float(os.getenv("HUBSPOT_TIMEOUT", "30"))
+
+# HubSpot batch endpoints accept at most 100 inputs per call
+BATCH_SIZE = 100
+
+# CRM search: at most 100 hits per page and no paging past 10k results per query
+SEARCH_PAGE_SIZE = 100
+SEARCH_RESULT_CAP = 10000
+
+# Request budget per HubSpot's burst window: private apps get 100 requests / 10 s
+# on Free/Starter (190 on Pro/Enterprise), shared by every call in this process
+RATE_LIMIT = int(os.getenv("HUBSPOT_RATE_LIMIT", "100"))
+RATE_INTERVAL = float(os.getenv("HUBSPOT_RATE_INTERVAL", "10"))
+# Share of that budget allowed as an instant burst. HubSpot counts over a rolling window, so
+# burst + refill over one window must stay within the limit: the bucket refills at (1 - burst)
+RATE_BURST = float(os.getenv("HUBSPOT_RATE_BURST", "0.1"))
+
+# 429 / 502-504 handling: up to MAX_RETRIES jittered retries per call, and retries overall
+# may not exceed RETRY_BUDGET_RATIO of recent traffic (plus a small reserve), so an outage
+# doesn't multiply load on the portal
+MAX_RETRIES = int(os.getenv("HUBSPOT_MAX_RETRIES", "5"))
+RETRY_BACKOFF_BASE = float(os.getenv("HUBSPOT_RETRY_BACKOFF_BASE", "0.5"))
+RETRY_BACKOFF_CAP = float(os.getenv("HUBSPOT_RETRY_BACKOFF_CAP", "30"))
+RETRY_BUDGET_RATIO = float(os.getenv("HUBSPOT_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_RESERVE = float(os.getenv("HUBSPOT_RETRY_BUDGET_RESERVE", "20"))
+_RETRY_STATUSES = {429, 502, 503, 504}
+# Single-send POSTs are not idempotent: a 502/504 or read timeout may come after HubSpot accepted
+# the email, so only answers that guarantee nothing was sent are retried
+_SINGLE_SEND_RETRY_STATUSES = {429, 503}
+
+# Single-send dispatcher
+SEND_CONCURRENCY = int(os.getenv("HUBSPOT_SEND_CONCURRENCY", "8"))
+SEND_RETRIES = int(os.getenv("HUBSPOT_SEND_RETRIES", "2"))
+SEND_TIMEOUT = float(os.getenv("HUBSPOT_SEND_TIMEOUT", "60"))
+
+# Process-wide cache for CRM bootstrap (property existence, list name -> id)
+CACHE_TTL = float(os.getenv("HUBSPOT_CACHE_TTL", "3600"))
+# email -> contact id lookups; "not found" answers are kept for a shorter time since
+# the contact may be created any moment
+CONTACT_ID_TTL = float(os.getenv("HUBSPOT_CONTACT_ID_TTL", "900"))
+CONTACT_MISS_TTL = float(os.getenv("HUBSPOT_CONTACT_MISS_TTL", "60"))
+
 # Persona custom property key
 PERSONA_PROP = "audience_persona"
 
@@ -670,9 +726,18 @@ _PERSONA_KEY_TO_VALUE = {
     "ops": "ops_manager",
 }
 _PERSONA_VALUE_TO_KEY = {v: k for k, v in _PERSONA_KEY_TO_VALUE.items()}
+_CONTACT_PROPS = ["email", "firstname", "lastname", PERSONA_PROP]
 
 # ===== OAuth Helper =====
-def _oauth_access_token() -> str:
+# Refresh this many seconds before expires_in runs out
+TOKEN_REFRESH_SKEW = float(os.getenv("HUBSPOT_TOKEN_REFRESH_SKEW", "300"))
+
+# (access_token, expires_at) swapped as one tuple so readers never see a torn pair
+_TOKEN: tuple = ("", 0.0)
+_TOKEN_LOCK = threading.Lock()
+_ROTATED_REFRESH_TOKEN = ""
+
+def _exchange_refresh_token() -> Dict[str, Any]:
     """
     Exchanges refresh token for a short-lived access token.
     Used when HUBSPOT_AUTH_MODE=oauth. Env vars required:
@@ -682,7 +747,7 @@ def _oauth_access_token() -> str:
     """
     cid = os.getenv("HUBSPOT_CLIENT_ID", "").strip()
     csec = os.getenv("HUBSPOT_CLIENT_SECRET", "").strip()
-    rtok = os.getenv("HUBSPOT_REFRESH_TOKEN", "").strip()
+    rtok = _ROTATED_REFRESH_TOKEN or os.getenv("HUBSPOT_REFRESH_TOKEN", "").strip()
     if not (cid and csec and rtok):
       raise RuntimeError("OAuth selected but HUBSPOT_CLIENT_ID/SECRET/REFRESH_TOKEN missing")
 
@@ -692,10 +757,221 @@ def _oauth_access_token() -> str:
         "client_secret": csec,
         "refresh_token": rtok,
     }
-    r = requests.post("https://api.hubapi.com/oauth/v1/token", data=data, timeout=30)
+    r = _session().post(f"{BASE}/oauth/v1/token", data=data, timeout=DEFAULT_TIMEOUT)
     if r.status_code != 200:
         raise RuntimeError(f"OAuth token exchange failed [{r.status_code}] -> {r.text}")
-    return r.json()["access_token"]
+    return r.json()
+
+def _refresh_locked() -> str:
+    # caller holds _TOKEN_LOCK; another thread may have refreshed while we waited
+    global _TOKEN, _ROTATED_REFRESH_TOKEN
+    token, expires_at = _TOKEN
+    if token and time.time() < expires_at - TOKEN_REFRESH_SKEW:
+        return token
+    data = _exchange_refresh_token()
+    _TOKEN = (data["access_token"], time.time() + float(data.get("expires_in") or 1800))
+    if data.get("refresh_token"):
+        _ROTATED_REFRESH_TOKEN = data["refresh_token"]
+    return _TOKEN[0]
+
+def _oauth_access_token() -> str:
+    """
+    Cached access token honoring expires_in. Inside the refresh window one thread
+    refreshes while the others keep using the still-valid token; once expired,
+    callers block on a single in-flight refresh instead of each exchanging.
+    """
+    token, expires_at = _TOKEN
+    now = time.time()
+    if token and now < expires_at - TOKEN_REFRESH_SKEW:
+        return token
+    if token and now < expires_at:
+        if not _TOKEN_LOCK.acquire(blocking=False):
+            return token
+        try:
+            return _refresh_locked()
+        except Exception:
+            return token  # proactive refresh failed; current token is still good
+        finally:
+            _TOKEN_LOCK.release()
+    with _TOKEN_LOCK:
+        return _refresh_locked()
+
+def invalidate_oauth_token() -> None:
+    global _TOKEN
+    _TOKEN = ("", 0.0)
+
+# ===== Transport =====
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+def _session() -> requests.Session:
+    """
+    Process-wide pooled session so every HubSpot call reuses keep-alive connections.
+    Connect errors are retried with backoff (safe for any method: nothing reached the server).
+    """
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                retry = Retry(
+                    total=CONNECT_RETRIES,
+                    connect=CONNECT_RETRIES,
+                    read=0,
+                    status=0,
+                    backoff_factor=0.3,
+                    allowed_methods=None,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+                s = requests.Session()
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                s.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+                _SESSION = s
+    return _SESSION
+
+class _RateLimiter:
+    """
+    Token bucket shared by every HubSpot call in the process (all threads).
+    Responses feed it HubSpot's X-HubSpot-RateLimit-* headers, so the bucket follows the
+    portal's real limit and remaining budget (other apps on the portal spend it too), and a
+    429's Retry-After pauses every worker rather than just the one that got it.
+    """
+
+    def __init__(self, limit: int, interval: float, burst: float = RATE_BURST):
+        self.burst = burst
+        self._configure(limit, interval)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _configure(self, limit: int, interval: float) -> None:
+        self.capacity = max(1.0, limit * self.burst)
+        self.rate = max(1.0, limit - self.capacity) / interval
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token now (possibly going into debt); return seconds to wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def observe(self, headers) -> None:
+        """Sync the bucket with the rate-limit headers of a response."""
+        limit = _int_header(headers, "X-HubSpot-RateLimit-Max")
+        interval_ms = _int_header(headers, "X-HubSpot-RateLimit-Interval-Milliseconds")
+        remaining = _int_header(headers, "X-HubSpot-RateLimit-Remaining")
+        with self.lock:
+            self._refill(time.monotonic())
+            if limit and interval_ms:
+                self._configure(limit, interval_ms / 1000.0)
+            if remaining is not None and remaining < self.tokens:
+                self.tokens = float(remaining)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for `seconds` and start the next window with an empty bucket."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            self.paused_until = max(self.paused_until, now + seconds)
+
+class _RetryBudget:
+    """Retries may spend at most `ratio` of calls made, plus a fixed reserve."""
+
+    def __init__(self, ratio: float, reserve: float):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.balance = reserve
+        self.lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self.lock:
+            self.balance = min(self.reserve, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self.lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+_LIMITER = _RateLimiter(RATE_LIMIT, RATE_INTERVAL)
+_RETRY_BUDGET = _RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_RESERVE)
+
+def _int_header(headers, name: str) -> Optional[int]:
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+def _retry_delay(resp, attempt: int, statuses=_RETRY_STATUSES) -> Optional[float]:
+    """
+    Seconds to wait before retrying a throttled/unavailable response, or None to give up.
+    Honors Retry-After; otherwise full-jitter exponential backoff. Works for requests and httpx.
+    """
+    _LIMITER.observe(resp.headers)
+    retry_after = _int_header(resp.headers, "Retry-After")
+    if resp.status_code not in statuses or attempt >= MAX_RETRIES or not _RETRY_BUDGET.withdraw():
+        if resp.status_code == 429 and retry_after:
+            _LIMITER.pause(retry_after)  # not retried here, but nobody else should call meanwhile
+        return None
+    backoff = random.uniform(0, min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2 ** attempt))
+    if resp.status_code == 429:
+        # the whole portal is out of budget: hold every worker, then spread the restart
+        delay = (retry_after if retry_after is not None else RETRY_BACKOFF_BASE * 2 ** attempt) + backoff / 4
+        _LIMITER.pause(delay)
+        return delay
+    return max(float(retry_after or 0), backoff)
+
+def _send(
+    method: str,
+    path: str,
+    *,
+    params: Optional[Dict[str, Any]] = None,
+    body: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+    retry_statuses=_RETRY_STATUSES,
+) -> requests.Response:
+    url = f"{BASE}{path}"
+    log.debug("HubSpot call: %s %s", method, url)
+    _RETRY_BUDGET.deposit()
+    attempt, reauthed = 0, False
+    while True:
+        _LIMITER.acquire()
+        resp = _session().request(
+            method, url, headers=_headers(), params=params, json=body, timeout=timeout or DEFAULT_TIMEOUT
+        )
+        if resp.status_code == 401 and AUTH_MODE == "oauth" and not reauthed:
+            # token revoked or expired early: drop the cache and retry once with a fresh one
+            invalidate_oauth_token()
+            reauthed = True
+            continue
+        delay = _retry_delay(resp, attempt, retry_statuses)
+        if delay is None:
+            return resp
+        attempt += 1
+        log.info("HubSpot retry %d/%d after %d: waiting %.2fs", attempt, MAX_RETRIES, resp.status_code, delay)
+        time.sleep(delay)
+
+def _error(resp: requests.Response) -> Dict[str, Any]:
+    try:
+        detail = resp.json()
+    except Exception:
+        detail = resp.text
+    return {"status": "error", "code": resp.status_code, "detail": detail}
 
 # ===== Internals =====
 def _headers() -> Dict[str, str]:
@@ -713,11 +989,9 @@ def _req(
     *,
     params: Optional[Dict[str, Any]] = None,
     body: Optional[Dict[str, Any]] = None,
-    timeout: int = 30,
+    timeout: Optional[float] = None,
 ) -> Dict[str, Any]:
-    url = f"{BASE}{path}"
-    print("HUBSPOT CALL:", method, url)
-    resp = requests.request(method, url, headers=_headers(), params=params, json=body, timeout=timeout)
+    resp = _send(method, path, params=params, body=body, timeout=timeout)
     if resp.status_code >= 300:
         try:
             detail = resp.json()
@@ -729,6 +1003,28 @@ def _req(
     except Exception:
         return {"status": "ok", "text": resp.text}
 
+# ===== Process cache =====
+# Survives Streamlit reruns (the module stays imported), so bootstrap lookups
+# hit HubSpot once per TTL instead of once per rerun/click.
+_CACHE: Dict[str, tuple] = {}
+_CACHE_LOCK = threading.Lock()
+
+def _cache_get(key: str) -> Any:
+    hit = _CACHE.get(key)
+    if hit and hit[0] > time.time():
+        return hit[1]
+    return None
+
+def _cache_put(key: str, value: Any, ttl: Optional[float] = None) -> None:
+    with _CACHE_LOCK:
+        _CACHE[key] = (time.time() + (CACHE_TTL if ttl is None else ttl), value)
+
+def invalidate_cache(prefix: str = "") -> None:
+    """Drop cached entries whose key starts with prefix ("property:", "list:", "contact:"), or everything."""
+    with _CACHE_LOCK:
+        for key in [k for k in _CACHE if k.startswith(prefix)]:
+            _CACHE.pop(key, None)
+
 # ===== Capability flags =====
 def hubspot_available() -> bool:
     if AUTH_MODE == "oauth":
@@ -739,6 +1035,21 @@ def can_send() -> bool:
     return hubspot_available() and SEND_ENABLED
 
 # ===== Persona property management =====
+_PERSONA_PROPERTY_DEF = {
+    "name": PERSONA_PROP,
+    "label": "Audience Persona",
+    "type": "enumeration",
+    "fieldType": "select",
+    "groupName": "contactinformation",
+    "options": [
+        {"label": "Startup Founder", "value": "startup_founder"},
+        {"label": "Creative Professional", "value": "creative_professional"},
+        {"label": "Operations Manager", "value": "ops_manager"},
+    ],
+    "description": "Audience persona for targeted newsletters.",
+    "hidden": False,
+}
+
 def ensure_persona_property() -> Dict[str, Any]:
     """
     Ensure a contacts property named 'audience_persona' (enumeration) exists with three options.
@@ -746,34 +1057,20 @@ def ensure_persona_property() -> Dict[str, Any]:
     """
     if not hubspot_available():
         return {"status": "simulated", "property_name": PERSONA_PROP, "created": False, "note": "no auth"}
+    if _cache_get(f"property:{PERSONA_PROP}"):
+        return {"status": "ok", "property_name": PERSONA_PROP, "created": False, "cached": True}
 
-    r = requests.get(f"{BASE}/crm/v3/properties/contacts/{PERSONA_PROP}", headers=_headers(), timeout=30)
+    r = _send("GET", f"/crm/v3/properties/contacts/{PERSONA_PROP}")
     if r.status_code == 200:
+        _cache_put(f"property:{PERSONA_PROP}", True)
         return {"status": "ok", "property_name": PERSONA_PROP, "created": False}
     if r.status_code != 404:
         return {"status": "error", "code": r.status_code, "detail": r.text}
 
-    body = {
-        "name": PERSONA_PROP,
-        "label": "Audience Persona",
-        "type": "enumeration",
-        "fieldType": "select",
-        "groupName": "contactinformation",
-        "options": [
-            {"label": "Startup Founder", "value": "startup_founder"},
-            {"label": "Creative Professional", "value": "creative_professional"},
-            {"label": "Operations Manager", "value": "ops_manager"},
-        ],
-        "description": "Audience persona for targeted newsletters.",
-        "hidden": False,
-    }
-    cr = requests.post(f"{BASE}/crm/v3/properties/contacts", headers=_headers(), json=body, timeout=30)
+    cr = _send("POST", "/crm/v3/properties/contacts", body=_PERSONA_PROPERTY_DEF)
     if cr.status_code >= 300:
-        try:
-            detail = cr.json()
-        except Exception:
-            detail = cr.text
-        return {"status": "error", "code": cr.status_code, "detail": detail}
+        return _error(cr)
+    _cache_put(f"property:{PERSONA_PROP}", True)
     return {"status": "ok", "property_name": PERSONA_PROP, "created": True}
 
 def init_crm() -> None:
@@ -783,63 +1080,324 @@ def init_crm() -> None:
         pass
 
 # ===== Contacts =====
+def _read_ids_chunk(emails: List[str]) -> Dict[str, Optional[str]]:
+    body = {"idProperty": "email", "properties": ["email"], "inputs": [{"id": e} for e in emails]}
+    resp = _send("POST", "/crm/v3/objects/contacts/batch/read", body=body)
+    if resp.status_code >= 300 and resp.status_code != 207:  # 207: some emails have no contact
+        raise RuntimeError(f"POST /crm/v3/objects/contacts/batch/read failed [{resp.status_code}] -> {_error(resp)['detail']}")
+    found: Dict[str, Optional[str]] = {e: None for e in emails}
+    for r in resp.json().get("results") or []:
+        email = ((r.get("properties") or {}).get("email") or "").lower()
+        if email in found:
+            found[email] = r.get("id")
+    return found
+
+def resolve_contact_ids(emails: Iterable[str], *, ttl: Optional[float] = None) -> Dict[str, Optional[str]]:
+    """
+    Map emails (lower-cased) to contact ids, None where no contact exists.
+    Uncached emails are read via contacts batch/read with idProperty=email, BATCH_SIZE per
+    call, a few calls in flight under the shared rate limiter; answers are cached for
+    CONTACT_ID_TTL (CONTACT_MISS_TTL for misses) unless ttl overrides it.
+    """
+    wanted = list(dict.fromkeys(e.strip().lower() for e in emails if e and e.strip()))
+    if not hubspot_available():
+        return {e: None for e in wanted}
+
+    out: Dict[str, Optional[str]] = {}
+    todo = []
+    for e in wanted:
+        hit = _cache_get(f"contact:{e}")
+        if hit is None:
+            todo.append(e)
+        else:
+            out[e] = hit or None  # "" marks a cached miss
+    chunks = [todo[i : i + BATCH_SIZE] for i in range(0, len(todo), BATCH_SIZE)]
+    if chunks:
+        with ThreadPoolExecutor(max_workers=min(4, len(chunks))) as pool:
+            for found in pool.map(_read_ids_chunk, chunks):
+                for e, cid in found.items():
+                    _cache_put(f"contact:{e}", cid or "", ttl if ttl is not None else (CONTACT_ID_TTL if cid else CONTACT_MISS_TTL))
+                    out[e] = cid
+    return {e: out.get(e) for e in wanted}
+
 def _find_contact_id_by_email(email: str) -> Optional[str]:
     if not hubspot_available():
         return None
-    body = {
-        "filterGroups": [{"filters": [{"propertyName": "email", "operator": "EQ", "value": email}]}],
-        "properties": ["email"],
-    }
-    res = _req("POST", "/crm/v3/objects/contacts/search", body=body)
-    hits = res.get("results") or []
-    return hits[0]["id"] if hits else None
+    return resolve_contact_ids([email]).get(email.strip().lower())
 
-def upsert_contact(email: str, properties: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    True upsert by email using idProperty=email.
-    Accepts 'persona' as founder|creative|ops and maps to PERSONA_PROP.
-    """
+def _contact_props(properties: Optional[Dict[str, Any]]) -> Dict[str, Any]:
     props = dict(properties or {})
     if "persona" in props:
         props[PERSONA_PROP] = _PERSONA_KEY_TO_VALUE.get(props.pop("persona"), "")
     if "hs_persona" in props:
         props[PERSONA_PROP] = props.pop("hs_persona")
+    return props
+
+def upsert_contact(email: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    True upsert by email using idProperty=email.
+    Accepts 'persona' as founder|creative|ops and maps to PERSONA_PROP.
+    """
+    props = _contact_props(properties)
 
     if not hubspot_available():
         return {"status": "simulated", "email": email, "properties": {"email": email, **props}}
 
     payload = {"properties": {"email": email, **props}}
 
-    update = requests.patch(
-        f"{BASE}/crm/v3/objects/contacts/{email}",
-        headers=_headers(),
-        params={"idProperty": "email"},
-        json=payload,
-        timeout=30,
-    )
+    update = _send("PATCH", f"/crm/v3/objects/contacts/{email}", params={"idProperty": "email"}, body=payload)
     if update.status_code == 404:
-        create = requests.post(f"{BASE}/crm/v3/objects/contacts", headers=_headers(), json=payload, timeout=30)
+        create = _send("POST", "/crm/v3/objects/contacts", body=payload)
         if create.status_code >= 300:
-            try:
-                detail = create.json()
-            except Exception:
-                detail = create.text
-            return {"status": "error", "code": create.status_code, "detail": detail}
+            return _error(create)
         return {"status": "ok", **create.json()}
 
     if update.status_code >= 300:
-        try:
-            detail = update.json()
-        except Exception:
-            detail = update.text
-        return {"status": "error", "code": update.status_code, "detail": detail}
+        return _error(update)
 
     return {"status": "ok", **update.json()}
 
-def search_contacts_by_persona(persona_value_or_key: str, limit: int = 100) -> Dict[str, Any]:
+def _upsert_chunk(merged: Dict[str, Dict[str, Any]], chunk: List[str]) -> Dict[str, Dict[str, Any]]:
+    body = {
+        "inputs": [
+            {"idProperty": "email", "id": merged[k]["email"], "properties": {"email": merged[k]["email"], **merged[k]["properties"]}}
+            for k in chunk
+        ]
+    }
+    try:
+        resp = _send("POST", "/crm/v3/objects/contacts/batch/upsert", body=body)
+    except requests.RequestException as e:
+        return {k: {"status": "error", "email": merged[k]["email"], "detail": f"{type(e).__name__}: {e}"} for k in chunk}
+    if resp.status_code >= 300 and resp.status_code != 207:
+        err = _error(resp)
+        return {k: {"email": merged[k]["email"], **err} for k in chunk}
+
+    by_key: Dict[str, Dict[str, Any]] = {}
+    data = resp.json()
+    for r in data.get("results") or []:
+        k = ((r.get("properties") or {}).get("email") or "").lower()
+        if k in merged:
+            by_key[k] = {"status": "ok", "email": merged[k]["email"], "id": r.get("id"), "new": r.get("new")}
+            _cache_put(f"contact:{k}", r.get("id"), CONTACT_ID_TTL)
+    # 207 multi-status: attribute errors to their inputs where HubSpot tells us which
+    errors = data.get("errors") or []
+    for err in errors:
+        for ident in ((err.get("context") or {}).get("ids") or []):
+            k = str(ident).lower()
+            if k in merged and k not in by_key:
+                by_key[k] = {"status": "error", "email": merged[k]["email"], "detail": err.get("message") or err}
+    for k in chunk:
+        if k not in by_key:
+            by_key[k] = {"status": "error", "email": merged[k]["email"], "detail": errors or "missing from batch response"}
+    return by_key
+
+def upsert_contacts(records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Batch upsert by email via /crm/v3/objects/contacts/batch/upsert (BATCH_SIZE per call,
+    a few calls in flight under the shared rate limiter).
+    records: [{"email": ..., "properties": {...}}], same persona mapping as upsert_contact.
+    Duplicate emails are merged (later properties win). Returns one result per unique
+    email in input order; a failed chunk only marks its own records as errors.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for rec in records:
+        email = (rec.get("email") or "").strip()
+        if not email:
+            continue
+        entry = merged.setdefault(email.lower(), {"email": email, "properties": {}})
+        entry["properties"].update(_contact_props(rec.get("properties")))
+
+    if not hubspot_available():
+        results = [{"status": "simulated", "email": e["email"], "properties": {"email": e["email"], **e["properties"]}}
+                   for e in merged.values()]
+        return {"status": "simulated", "count": len(results), "ok": len(results), "errors": 0, "results": results}
+
+    keys = list(merged)
+    by_key: Dict[str, Dict[str, Any]] = {}
+    chunks = [keys[i : i + BATCH_SIZE] for i in range(0, len(keys), BATCH_SIZE)]
+    if chunks:
+        with ThreadPoolExecutor(max_workers=min(4, len(chunks))) as pool:
+            for found in pool.map(lambda chunk: _upsert_chunk(merged, chunk), chunks):
+                by_key.update(found)
+
+    results = [by_key[k] for k in keys]
+    n_err = sum(1 for r in results if r["status"] != "ok")
+    status = "ok" if not n_err else ("error" if n_err == len(results) else "partial")
+    return {"status": status, "count": len(results), "ok": len(results) - n_err, "errors": n_err, "results": results}
+
+def _epoch_ms(value: Any) -> Optional[str]:
+    """Search filters want datetimes as epoch millis; ids/numbers pass through."""
+    if value is None or str(value).isdigit():
+        return value
+    try:
+        dt = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        return str(int(dt.timestamp() * 1000))
+    except ValueError:
+        return str(value)
+
+class _SearchWalk:
+    """
+    Paging state for one search walk, shared by _iter_search and hubspot_async. Search stops
+    paging at SEARCH_RESULT_CAP, so past that the walk restarts with a keyset filter on the last
+    value seen. For a non-unique sort_prop (e.g. lastmodifieddate) the restart is on
+    (sort_prop, id): the hits sharing the last value are read in id order (restartable however
+    many share it, say after a bulk import), then paging resumes with sort_prop > that value.
+
+    A state is {after (page token), floor (sort_prop > value), tie (sort_prop == value, paged
+    by id above id_floor)}; body(state) is the request for it, following(state, res) the state
+    after its response, and fresh(state, hits) the hits not already yielded.
+    """
+
+    def __init__(self, object_type: str, filters: List[Dict[str, Any]], properties: List[str], *,
+                 page_size: int = SEARCH_PAGE_SIZE, sort_prop: str = "hs_object_id"):
+        self.path = f"/crm/v3/objects/{object_type}/search"
+        self.filters = list(filters)
+        self.props = list(properties) + ([sort_prop] if sort_prop not in properties else [])
+        self.page_size = max(1, min(int(page_size), SEARCH_PAGE_SIZE))
+        self.sort_prop = sort_prop
+        self.unique = sort_prop == "hs_object_id"
+        self.run_value, self.run_ids = None, set()  # ids of the trailing hits sharing one value
+
+    @staticmethod
+    def start() -> Dict[str, Any]:
+        return {"after": None, "floor": None, "tie": None, "id_floor": None}
+
+    def value(self, hit: Dict[str, Any]) -> Optional[str]:
+        if self.unique:
+            return hit.get("id")
+        return _epoch_ms((hit.get("properties") or {}).get(self.sort_prop))
+
+    def body(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        flt = list(self.filters)
+        order = self.sort_prop
+        if state["tie"] is not None:
+            flt += [{"propertyName": self.sort_prop, "operator": "GTE", "value": state["tie"]},
+                    {"propertyName": self.sort_prop, "operator": "LTE", "value": state["tie"]}]
+            if state["id_floor"] is not None:
+                flt.append({"propertyName": "hs_object_id", "operator": "GT", "value": state["id_floor"]})
+            order = "hs_object_id"
+        elif state["floor"] is not None:
+            flt.append({"propertyName": self.sort_prop, "operator": "GT", "value": state["floor"]})
+        body = {
+            "filterGroups": [{"filters": flt}],
+            "properties": self.props,
+            "sorts": [{"propertyName": order, "direction": "ASCENDING"}],
+            "limit": self.page_size,
+        }
+        if state["after"]:
+            body["after"] = state["after"]
+        return body
+
+    def following(self, state: Dict[str, Any], res: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        hits = res.get("results") or []
+        after = ((res.get("paging") or {}).get("next") or {}).get("after")
+        if after and int(after) + self.page_size <= SEARCH_RESULT_CAP:
+            return {**state, "after": after}
+        if state["tie"] is not None:
+            if after and hits:
+                last_id = hits[-1].get("id")
+                if state["id_floor"] is not None and int(last_id) <= int(state["id_floor"]):
+                    raise RuntimeError(
+                        f"search restart on {self.sort_prop}={state['tie']} made no progress past id {last_id}"
+                    )
+                return {**state, "after": None, "id_floor": last_id}
+            return {"after": None, "floor": state["tie"], "tie": None, "id_floor": None}
+        if not (after and hits):
+            return None
+        last = self.value(hits[-1])
+        if last is None:
+            raise RuntimeError(f"cannot page past {SEARCH_RESULT_CAP} results: last hit has no {self.sort_prop}")
+        if self.unique:
+            return {"after": None, "floor": last, "tie": None, "id_floor": None}
+        return {"after": None, "floor": state["floor"], "tie": last, "id_floor": None}
+
+    def fresh(self, state: Dict[str, Any], hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if state["tie"] is not None:
+            return [h for h in hits if h.get("id") not in self.run_ids]
+        if not self.unique:
+            for h in hits:
+                v = self.value(h)
+                if v != self.run_value:
+                    self.run_value, self.run_ids = v, set()
+                self.run_ids.add(h.get("id"))
+        return hits
+
+def _iter_search(
+    object_type: str,
+    filters: List[Dict[str, Any]],
+    properties: List[str],
+    *,
+    page_size: int = SEARCH_PAGE_SIZE,
+    prefetch: bool = True,
+    sort_prop: str = "hs_object_id",
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield raw search hits in sort_prop order, following paging.next.after and restarting past
+    SEARCH_RESULT_CAP (see _SearchWalk). With prefetch, the next page is in flight while the
+    caller handles this one.
+    """
+    walk = _SearchWalk(object_type, filters, properties, page_size=page_size, sort_prop=sort_prop)
+
+    def fetch(state: Dict[str, Any]) -> Dict[str, Any]:
+        return _req("POST", walk.path, body=walk.body(state))
+
+    pool = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        state = walk.start()
+        res = fetch(state)
+        while True:
+            nxt = walk.following(state, res)
+            pending = pool.submit(fetch, nxt) if (pool and nxt) else None
+            yield from walk.fresh(state, res.get("results") or [])
+            if not nxt:
+                return
+            state = nxt
+            res = pending.result() if pending else fetch(state)
+    finally:
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+def _projection(properties: Optional[List[str]]) -> tuple:
+    wanted = list(properties or _CONTACT_PROPS)
+    if "email" not in wanted:
+        wanted.insert(0, "email")
+    return wanted, wanted + ([PERSONA_PROP] if PERSONA_PROP not in wanted else [])
+
+def _contact_item(hit: Dict[str, Any], wanted: List[str]) -> Dict[str, Any]:
+    p = hit.get("properties", {}) or {}
+    item = {"id": hit.get("id")}
+    item.update({k: p.get(k) for k in wanted if k != PERSONA_PROP})
+    item["persona"] = _PERSONA_VALUE_TO_KEY.get(p.get(PERSONA_PROP, ""), "")
+    return item
+
+def iter_contacts_by_persona(
+    persona_value_or_key: str,
+    *,
+    page_size: int = SEARCH_PAGE_SIZE,
+    properties: Optional[List[str]] = None,
+    prefetch: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream every contact where PERSONA_PROP equals the given value, page by page.
+    properties projects the returned fields (email is always included); persona is
+    mapped back to its UI key.
+    """
+    persona_value = _PERSONA_KEY_TO_VALUE.get(persona_value_or_key, persona_value_or_key)
+
+    if not hubspot_available():
+        yield {"email": f"sim_{persona_value}@example.com", "persona": persona_value}
+        return
+
+    wanted, fetch_props = _projection(properties)
+    filters = [{"propertyName": PERSONA_PROP, "operator": "EQ", "value": persona_value}]
+    for r in _iter_search("contacts", filters, fetch_props, page_size=page_size, prefetch=prefetch):
+        yield _contact_item(r, wanted)
+
+def search_contacts_by_persona(persona_value_or_key: str, limit: Optional[int] = None) -> Dict[str, Any]:
     """
-    Return contacts where PERSONA_PROP equals the given value.
+    Return contacts where PERSONA_PROP equals the given value (all pages, or the first `limit`).
     Accepts either UI key (founder|creative|ops) or the enum value.
+    Prefer iter_contacts_by_persona for large segments.
     """
     persona_value = _PERSONA_KEY_TO_VALUE.get(persona_value_or_key, persona_value_or_key)
 
@@ -850,27 +1408,39 @@ def search_contacts_by_persona(persona_value_or_key: str, limit: int = 100) -> D
             "results": [{"email": f"sim_{persona_value}@example.com", "persona": persona_value}],
         }
 
-    body = {
-        "filterGroups": [{"filters": [{"propertyName": PERSONA_PROP, "operator": "EQ", "value": persona_value}]}],
-        "properties": ["email", "firstname", "lastname", PERSONA_PROP],
-        "limit": limit,
-    }
-    res = _req("POST", "/crm/v3/objects/contacts/search", body=body)
-    items = []
-    for r in res.get("results", []):
-        p = r.get("properties", {}) or {}
-        items.append(
-            {
-                "id": r.get("id"),
-                "email": p.get("email"),
-                "firstname": p.get("firstname"),
-                "lastname": p.get("lastname"),
-                "persona": _PERSONA_VALUE_TO_KEY.get(p.get(PERSONA_PROP, ""), ""),
-            }
-        )
+    items = list(itertools.islice(iter_contacts_by_persona(persona_value), limit))
     return {"status": "ok", "count": len(items), "results": items}
 
 # ===== Segments / Lists =====
+def _persona_list_def(list_name: str, persona_value: str) -> Dict[str, Any]:
+    return {
+        "name": list_name,
+        "dynamic": True,
+        "filterBranch": {
+            "filterBranchOperator": "AND",
+            "filters": [{"property": PERSONA_PROP, "operator": "EQ", "value": persona_value}],
+        },
+    }
+
+def _scan_lists_page(page: Dict[str, Any], list_name: str) -> Optional[str]:
+    # cache every name we see, so other personas resolve without another listing
+    found = None
+    for lst in (page.get("results") or page.get("lists") or []):
+        list_id = lst.get("listId") or lst.get("id")
+        if lst.get("name") and list_id:
+            _cache_put(f"list:{lst['name']}", list_id)
+            if lst["name"] == list_name:
+                found = list_id
+    return found
+
+def _next_lists_params(page: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    after = ((page.get("paging") or {}).get("next") or {}).get("after")
+    if after:
+        return {"limit": 100, "after": after}
+    if page.get("hasMore") and page.get("offset") is not None:
+        return {"limit": 100, "offset": page["offset"]}
+    return None
+
 def ensure_persona_list(persona_key: str) -> Dict[str, Any]:
     """
     Ensure a persona-based dynamic list exists (or simulate if no auth).
@@ -881,22 +1451,24 @@ def ensure_persona_list(persona_key: str) -> Dict[str, Any]:
     if not hubspot_available():
         return {"status": "simulated", "list_id": f"sim-list-{persona_key}", "name": list_name}
 
-    try:
-        lists = _req("GET", "/crm/v3/lists", params={"limit": 100})
-        for lst in (lists.get("results") or []):
-            if lst.get("name") == list_name:
-                return {"status": "ok", "list_id": lst.get("listId") or lst.get("id"), "name": list_name, "created": False}
+    cached = _cache_get(f"list:{list_name}")
+    if cached:
+        return {"status": "ok", "list_id": cached, "name": list_name, "created": False, "cached": True}
 
-        body = {
-            "name": list_name,
-            "dynamic": True,
-            "filterBranch": {
-                "filterBranchOperator": "AND",
-                "filters": [{"property": PERSONA_PROP, "operator": "EQ", "value": persona_value}],
-            },
-        }
-        created = _req("POST", "/crm/v3/lists", body=body, timeout=30)
-        return {"status": "ok", "list_id": created.get("listId") or created.get("id"), "name": list_name, "created": True}
+    try:
+        params: Optional[Dict[str, Any]] = {"limit": 100}
+        while params:
+            page = _req("GET", "/crm/v3/lists", params=params)
+            list_id = _scan_lists_page(page, list_name)
+            if list_id:
+                return {"status": "ok", "list_id": list_id, "name": list_name, "created": False}
+            params = _next_lists_params(page)
+
+        created = _req("POST", "/crm/v3/lists", body=_persona_list_def(list_name, persona_value))
+        list_id = created.get("listId") or created.get("id")
+        if list_id:
+            _cache_put(f"list:{list_name}", list_id)
+        return {"status": "ok", "list_id": list_id, "name": list_name, "created": True}
     except Exception as e:
         return {
             "status": "simulated",
@@ -906,37 +1478,128 @@ def ensure_persona_list(persona_key: str) -> Dict[str, Any]:
         }
 
 # ===== Single-send =====
-def single_send_marketing_email(email_id, to_addresses, custom_props=None):
+def _simulated_send(email_id, to_addresses, custom_props) -> Dict[str, Any]:
+    sim_id = f"SIM-{int(time.time())}-{random.randint(1000, 9999)}"
+    return {
+        "mode": "simulate",
+        "messageId": sim_id,
+        "to": to_addresses,
+        "emailId": email_id,
+        "props": custom_props or {},
+    }
+
+def _template_id(email_id) -> int:
+    return int(email_id) if str(email_id).isdigit() else int(os.getenv("HUBSPOT_EMAIL_TEMPLATE_ID"))
+
+def _single_send_body(eid: int, addr: str, custom_props: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "emailId": eid,
+        "message": {"to": addr},  # single string, not a list
+        "customProperties": custom_props,
+    }
+
+def _single_send_outcome(addr: str, resp) -> Dict[str, Any]:
+    # works for requests and httpx responses alike
+    if resp.status_code >= 300:
+        err = _error(resp)
+        return {"to": addr, "error": err, "retryable": resp.status_code in _SINGLE_SEND_RETRY_STATUSES}
+    try:
+        res = resp.json()
+    except Exception:
+        res = {"status": "ok", "text": resp.text}
+    return {"to": addr, "response": res}
+
+def _send_report(results: List[Dict[str, Any]], elapsed: float, workers: int) -> Dict[str, Any]:
+    failed = [r["to"] for r in results if r and "error" in r]
+    sent = len(results) - len(failed)
+    return {
+        "mode": "send",
+        "results": results,
+        "failed": failed,
+        "throughput": {
+            "sent": sent,
+            "failed": len(failed),
+            "elapsed_s": round(elapsed, 3),
+            "per_sec": round(sent / elapsed, 2) if elapsed > 0 else None,
+            "concurrency": workers,
+        },
+    }
+
+def _never_sent(exc: requests.RequestException) -> bool:
+    """True only for failures before the request reached HubSpot (connect errors/timeouts)."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.ConnectionError):
+        reason = getattr(exc.args[0], "reason", None) if exc.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+def _single_send_one(eid: int, addr: str, custom_props: Dict[str, Any], retry_statuses=_SINGLE_SEND_RETRY_STATUSES) -> Dict[str, Any]:
+    try:
+        resp = _send(
+            "POST", "/marketing/v4/email/single-send", body=_single_send_body(eid, addr, custom_props),
+            timeout=SEND_TIMEOUT, retry_statuses=retry_statuses,
+        )
+    except requests.RequestException as e:
+        # anything after the request went out (read timeout, dropped connection) may have been delivered
+        return {"to": addr, "error": f"{type(e).__name__}: {e}", "retryable": _never_sent(e)}
+    return _single_send_outcome(addr, resp)
+
+def single_send_marketing_email(
+    email_id,
+    to_addresses,
+    custom_props=None,
+    *,
+    concurrency: Optional[int] = None,
+    retries: Optional[int] = None,
+    retry_statuses=_SINGLE_SEND_RETRY_STATUSES,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+):
     """
     Send a published 'Single send API' marketing email via v4.
-    HubSpot expects one recipient per call.
+    HubSpot expects one recipient per call, so recipients are dispatched on a bounded
+    worker pool (HUBSPOT_SEND_CONCURRENCY) under the shared rate limiter. Only failures that
+    guarantee nothing was sent are retried: retry_statuses (429, 503) inside each call, connect
+    errors and those statuses again in up to `retries` rounds. Callers that retry on their own
+    (the outbox) pass retries=0, retry_statuses=() so each attempt is a single POST.
+    Every failure carries "retryable" for the caller, and whatever still
+    failed is listed in "failed" so the caller can retry just those. on_result is called
+    once per recipient as its final outcome lands.
     Requires: marketing-email scope, a Published Single Send email, and SEND_ENABLED=true.
     """
     if not can_send():
-        sim_id = f"SIM-{int(time.time())}-{random.randint(1000, 9999)}"
-        return {
-            "mode": "simulate",
-            "messageId": sim_id,
-            "to": to_addresses,
-            "emailId": email_id,
-            "props": custom_props or {},
-        }
-
-    eid = int(email_id) if str(email_id).isdigit() else int(os.getenv("HUBSPOT_EMAIL_TEMPLATE_ID"))
-
-    results = []
-    for addr in to_addresses:
-        body = {
-            "emailId": eid,
-            "message": {"to": addr},  # single string, not a list
-            "customProperties": custom_props or {},
-        }
-        res = _req("POST", "/marketing/v4/email/single-send", body=body, timeout=60)
-        results.append({"to": addr, "response": res})
-    return {"mode": "send", "results": results}
+        return _simulated_send(email_id, to_addresses, custom_props)
+
+    eid = _template_id(email_id)
+    addresses = list(to_addresses)
+    props = custom_props or {}
+    workers = max(1, int(concurrency or SEND_CONCURRENCY))
+    rounds = 1 + max(0, SEND_RETRIES if retries is None else int(retries))
+
+    started = time.monotonic()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(addresses)
+    todo = list(range(len(addresses)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for attempt in range(1, rounds + 1):
+            futures = {pool.submit(_single_send_one, eid, addresses[i], props, retry_statuses): i for i in todo}
+            retry_next = []
+            for fut in as_completed(futures):
+                i = futures[fut]
+                res = fut.result()
+                res["attempts"] = attempt
+                results[i] = res
+                if "error" in res and res["retryable"] and attempt < rounds:
+                    retry_next.append(i)
+                    continue
+                if on_result:
+                    on_result(res)
+            todo = sorted(retry_next)
+            if not todo:
+                break
+            time.sleep(min(8.0, 0.5 * 2 ** (attempt - 1)))
+
+    return _send_report(results, time.monotonic() - started, workers)
 
 # ===== Local logging =====
 def log_send_event(path: str, record: Dict[str, Any]) -> None:
-    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    storage.append_jsonl(path, record)
@@ -0,0 +1,412 @@
+"""
+Local HubSpot API stand-in for offline load and regression tests
+- Implements the endpoints hubspot_client uses: OAuth token, contact properties,
+  contacts search / create / PATCH-by-email / batch upsert / batch read, lists,
+  v4 single-send, and the email events API (each send emits SENT/DELIVERED and, at
+  configurable rates, OPEN/CLICK/unsubscribe events).
+- In-memory contact store, HubSpot-style cursor paging (incl. the 10k search cap),
+  configurable latency, and 429s with X-HubSpot-RateLimit-* / Retry-After headers.
+Usage:
+  python hubspot_mock_server.py [--port 8765] [--latency-ms 40] [--rate-limit 100] [--seed 5000]
+  HUBSPOT_API_BASE=http://127.0.0.1:8765 HUBSPOT_PRIVATE_APP_TOKEN=mock HUBSPOT_SEND_ENABLED=true streamlit run app.py
+"""
+
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import calendar
+import functools
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+PERSONAS = ["startup_founder", "creative_professional", "ops_manager"]
+SEARCH_RESULT_CAP = 10000
+
+
+class MockHubSpot:
+    """In-memory portal state shared by all request threads."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 rate_limit: int = 100, rate_interval_ms: int = 10_000, error_rate: float = 0.0,
+                 engagement: Tuple[float, float, float] = (0.35, 0.08, 0.003)):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.rate_interval_ms = rate_interval_ms
+        self.error_rate = error_rate
+        self.engagement = engagement  # open / click / unsubscribe probability per delivered send
+        self.lock = threading.Lock()
+        self.contacts: Dict[str, Dict[str, Any]] = {}
+        self.by_email: Dict[str, str] = {}
+        self.properties: Dict[str, Dict[str, Any]] = {}
+        self.lists: List[Dict[str, Any]] = []
+        self.sends: List[Dict[str, Any]] = []
+        self.events: List[Dict[str, Any]] = []
+        self.next_id = 1
+        self.hits: deque = deque()
+        self.stats = {"requests": 0, "throttled": 0, "sends": 0}
+
+    # ----- store -----
+    def _now_iso(self) -> str:
+        now = time.time()
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)) + f".{int(now * 1000) % 1000:03d}Z"
+
+    def _public(self, c: Dict[str, Any], props: Optional[List[str]] = None) -> Dict[str, Any]:
+        p = c["properties"]
+        shown = {k: p.get(k) for k in props} if props else {k: p.get(k) for k in ("email", "firstname", "lastname")}
+        shown.update({"hs_object_id": c["id"], "lastmodifieddate": p["lastmodifieddate"], "createdate": p["createdate"]})
+        return {"id": c["id"], "properties": shown, "createdAt": p["createdate"], "updatedAt": p["lastmodifieddate"], "archived": False}
+
+    def upsert(self, email: str, props: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        with self.lock:
+            key = email.strip().lower()
+            cid = self.by_email.get(key)
+            now = self._now_iso()
+            new = cid is None
+            if new:
+                cid = str(self.next_id)
+                self.next_id += 1
+                self.by_email[key] = cid
+                self.contacts[cid] = {"id": cid, "properties": {"createdate": now}}
+            c = self.contacts[cid]
+            c["properties"].update({k: v for k, v in props.items() if v is not None})
+            c["properties"].update({"email": key, "lastmodifieddate": now, "hs_object_id": cid})
+            return c, new
+
+    def seed(self, n: int) -> None:
+        for i in range(n):
+            self.upsert(f"user{i}@example.com", {"firstname": f"User{i}", "audience_persona": PERSONAS[i % 3]})
+
+    # ----- rate limiting -----
+    def admit(self) -> Tuple[bool, Dict[str, str]]:
+        """Rolling-window limiter, reporting the same headers HubSpot sends."""
+        now = time.monotonic()
+        window = self.rate_interval_ms / 1000.0
+        with self.lock:
+            self.stats["requests"] += 1
+            while self.hits and now - self.hits[0] >= window:
+                self.hits.popleft()
+            allowed = len(self.hits) < self.rate_limit
+            if allowed:
+                self.hits.append(now)
+            remaining = max(0, self.rate_limit - len(self.hits))
+            headers = {
+                "X-HubSpot-RateLimit-Max": str(self.rate_limit),
+                "X-HubSpot-RateLimit-Remaining": str(remaining),
+                "X-HubSpot-RateLimit-Interval-Milliseconds": str(self.rate_interval_ms),
+            }
+            if not allowed:
+                self.stats["throttled"] += 1
+                retry_after = max(0.0, window - (now - self.hits[0])) if self.hits else window
+                headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+            return allowed, headers
+
+    def delay(self) -> None:
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000.0)
+
+    # ----- email events -----
+    def engage(self, to: str, email_id: Any, created_ms: Optional[int] = None) -> None:
+        """Record the events HubSpot would log for one delivered send."""
+        created = int(created_ms if created_ms is not None else time.time() * 1000)
+        open_p, click_p, unsub_p = self.engagement
+        kinds = ["SENT", "DELIVERED"]
+        if random.random() < open_p:
+            kinds.append("OPEN")
+            if random.random() < click_p / max(open_p, 1e-9):
+                kinds.append("CLICK")
+        if random.random() < unsub_p:
+            kinds.append("STATUSCHANGE")
+        with self.lock:
+            for i, kind in enumerate(kinds):
+                ev = {"id": str(uuid.uuid4()), "type": kind, "recipient": to, "created": created + i,
+                      "emailCampaignId": int(email_id) if str(email_id).isdigit() else 0, "appId": 0}
+                if kind == "STATUSCHANGE":
+                    ev.update({"source": "SOURCE_RECIPIENT", "subscriptions": [{"status": "UNSUBSCRIBED"}]})
+                self.events.append(ev)
+
+    def list_events(self, query: Dict[str, str]) -> Dict[str, Any]:
+        lo = int(query.get("startTimestamp") or 0)
+        hi = int(query.get("endTimestamp") or 2 ** 62)
+        kind = query.get("eventType")
+        limit = min(int(query.get("limit") or 1000), 1000)
+        offset = int(query.get("offset") or 0)
+        with self.lock:
+            hits = [e for e in self.events if lo <= e["created"] <= hi and (not kind or e["type"] == kind)]
+        hits.sort(key=lambda e: e["created"], reverse=True)  # newest first, as HubSpot returns them
+        page = hits[offset : offset + limit]
+        more = offset + limit < len(hits)
+        return {"events": page, "hasMore": more, "offset": str(offset + limit) if more else None}
+
+    # ----- search -----
+    def search(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        limit = int(body.get("limit") or 10)
+        if limit > 200:
+            return 400, {"status": "error", "message": "limit must be <= 200", "category": "VALIDATION_ERROR"}
+        after = int(body.get("after") or 0)
+        if after + limit > SEARCH_RESULT_CAP:
+            return 400, {"status": "error", "message": f"paging beyond {SEARCH_RESULT_CAP} results is not supported",
+                         "category": "VALIDATION_ERROR"}
+        groups = body.get("filterGroups") or [{"filters": []}]
+        with self.lock:
+            rows = [c for c in self.contacts.values() if any(_matches(c, g.get("filters") or []) for g in groups)]
+        sorts = body.get("sorts") or [{"propertyName": "hs_object_id", "direction": "ASCENDING"}]
+        for s in reversed(sorts):
+            name = s.get("propertyName") if isinstance(s, dict) else str(s)
+            desc = isinstance(s, dict) and s.get("direction") == "DESCENDING"
+            rows.sort(key=lambda c: _sort_key(c["properties"].get(name)), reverse=desc)
+        page = rows[after : after + limit]
+        out: Dict[str, Any] = {"total": len(rows), "results": [self._public(c, body.get("properties")) for c in page]}
+        if after + limit < len(rows):
+            out["paging"] = {"next": {"after": str(after + limit)}}
+        return 200, out
+
+
+def _sort_key(v):
+    n = _num(v)
+    return (0, n, "") if n is not None else (1, 0.0, str(v or ""))
+
+
+def _matches(c: Dict[str, Any], filters: List[Dict[str, Any]]) -> bool:
+    p = c["properties"]
+    for f in filters:
+        have, want, op = p.get(f.get("propertyName")), f.get("value"), f.get("operator", "EQ")
+        if op == "EQ" and str(have).lower() != str(want).lower():
+            return False
+        if op == "NEQ" and str(have).lower() == str(want).lower():
+            return False
+        if op == "IN" and str(have).lower() not in {str(v).lower() for v in f.get("values") or []}:
+            return False
+        if op in ("GT", "GTE", "LT", "LTE"):
+            a, b = _num(have), _num(want)
+            if a is None or b is None:
+                return False
+            ok = {"GT": a > b, "GTE": a >= b, "LT": a < b, "LTE": a <= b}[op]
+            if not ok:
+                return False
+    return True
+
+
+@functools.lru_cache(maxsize=65536)  # every search re-sorts the whole store by these
+def _num(value) -> Optional[float]:
+    """Numbers as-is; ISO datetimes as epoch millis (HubSpot accepts either for date filters)."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        s = str(value)
+        ms = int(s[20:23]) if len(s) > 20 and s[19] == "." else 0
+        return calendar.timegm(time.strptime(s[:19], "%Y-%m-%dT%H:%M:%S")) * 1000.0 + ms
+    except (TypeError, ValueError):
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    portal: MockHubSpot = None  # set by serve()
+
+    def log_message(self, fmt, *args):  # keep load tests quiet
+        pass
+
+    # ----- plumbing -----
+    def _reply(self, code: int, obj: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None):
+        raw = json.dumps(obj).encode("utf-8") if obj is not None else b""
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if obj is not None:
+            self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _body(self) -> Dict[str, Any]:
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b""
+        if not raw:
+            return {}
+        if "application/x-www-form-urlencoded" in (self.headers.get("Content-Type") or ""):
+            return {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+        return json.loads(raw)
+
+    def _dispatch(self, method: str):
+        portal = self.portal
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = self._body()
+        portal.delay()
+
+        if url.path == "/oauth/v1/token":
+            return self._reply(200, {"access_token": f"mock-{uuid.uuid4().hex[:12]}", "expires_in": 1800,
+                                     "refresh_token": body.get("refresh_token", "mock-refresh"), "token_type": "bearer"})
+
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            return self._reply(401, {"status": "error", "message": "Authentication credentials not found.",
+                                     "category": "INVALID_AUTHENTICATION"})
+
+        allowed, rl = portal.admit()
+        if not allowed:
+            return self._reply(429, {"status": "error", "message": "You have reached your ten_secondly_rolling limit.",
+                                     "errorType": "RATE_LIMIT", "policyName": "TEN_SECONDLY_ROLLING"}, rl)
+        if portal.error_rate and random.random() < portal.error_rate:
+            return self._reply(502, {"status": "error", "message": "Bad gateway (injected)"}, rl)
+
+        code, out = route(portal, method, url.path, query, body)
+        return self._reply(code, out, rl)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+
+def route(portal: MockHubSpot, method: str, path: str, query: Dict[str, str], body: Dict[str, Any]):
+    # ----- properties -----
+    m = re.fullmatch(r"/crm/v3/properties/contacts/([^/]+)", path)
+    if m and method == "GET":
+        prop = portal.properties.get(m.group(1))
+        return (200, prop) if prop else (404, {"status": "error", "message": "property not found", "category": "OBJECT_NOT_FOUND"})
+    if path == "/crm/v3/properties/contacts" and method == "POST":
+        if body.get("name") in portal.properties:
+            return 409, {"status": "error", "message": "property already exists", "category": "CONFLICT"}
+        portal.properties[body.get("name")] = dict(body)
+        return 201, dict(body)
+
+    # ----- contacts -----
+    if path == "/crm/v3/objects/contacts/search" and method == "POST":
+        return portal.search(body)
+    if path == "/crm/v3/objects/contacts" and method == "POST":
+        email = ((body.get("properties") or {}).get("email") or "").lower()
+        if email in portal.by_email:
+            return 409, {"status": "error", "message": f"Contact already exists. Existing ID: {portal.by_email[email]}",
+                         "category": "CONFLICT"}
+        c, _ = portal.upsert(email, body.get("properties") or {})
+        return 201, portal._public(c)
+    m = re.fullmatch(r"/crm/v3/objects/contacts/([^/]+)", path)
+    if m and method == "PATCH":
+        ident = m.group(1)
+        cid = portal.by_email.get(ident.lower()) if query.get("idProperty") == "email" else ident
+        if not cid or cid not in portal.contacts:
+            return 404, {"status": "error", "message": "resource not found", "category": "OBJECT_NOT_FOUND"}
+        c, _ = portal.upsert(portal.contacts[cid]["properties"]["email"], body.get("properties") or {})
+        return 200, portal._public(c)
+    if path == "/crm/v3/objects/contacts/batch/upsert" and method == "POST":
+        inputs = body.get("inputs") or []
+        if len(inputs) > 100:
+            return 400, {"status": "error", "message": "batch size must be <= 100", "category": "VALIDATION_ERROR"}
+        results, errors = [], []
+        for item in inputs:
+            email = str(item.get("id") or "")
+            if "@" not in email:
+                errors.append({"status": "error", "category": "VALIDATION_ERROR",
+                               "message": f"Email address {email} is invalid", "context": {"ids": [email]}})
+                continue
+            c, new = portal.upsert(email, item.get("properties") or {})
+            results.append({**portal._public(c), "new": new})
+        out = {"status": "COMPLETE", "results": results}
+        if errors:
+            out.update({"errors": errors, "numErrors": len(errors)})
+        return (207 if errors else 200), out
+    if path == "/crm/v3/objects/contacts/batch/read" and method == "POST":
+        by_email = body.get("idProperty") == "email"
+        results, errors = [], []
+        for item in body.get("inputs") or []:
+            ident = str(item.get("id") or "")
+            cid = portal.by_email.get(ident.lower()) if by_email else ident
+            if cid in portal.contacts:
+                results.append(portal._public(portal.contacts[cid], body.get("properties")))
+            else:
+                errors.append({"status": "error", "category": "OBJECT_NOT_FOUND", "message": "Could not get some CONTACT objects",
+                               "context": {"ids": [ident]}})
+        out = {"status": "COMPLETE", "results": results}
+        if errors:
+            out.update({"errors": errors, "numErrors": len(errors)})
+        return (207 if errors else 200), out
+
+    # ----- lists -----
+    if path == "/crm/v3/lists" and method == "GET":
+        limit = int(query.get("limit") or 100)
+        after = int(query.get("after") or 0)
+        page = portal.lists[after : after + limit]
+        out = {"results": page}
+        if after + limit < len(portal.lists):
+            out["paging"] = {"next": {"after": str(after + limit)}}
+        return 200, out
+    if path == "/crm/v3/lists" and method == "POST":
+        with portal.lock:
+            lst = {"listId": str(1000 + len(portal.lists)), "name": body.get("name"), "processingType": "DYNAMIC",
+                   "filterBranch": body.get("filterBranch")}
+            portal.lists.append(lst)
+        return 200, lst
+
+    # ----- marketing single-send -----
+    if path == "/marketing/v4/email/single-send" and method == "POST":
+        to = (body.get("message") or {}).get("to")
+        if not isinstance(to, str) or "@" not in to:
+            return 400, {"status": "error", "message": "message.to must be an email address", "category": "VALIDATION_ERROR"}
+        status_id = str(uuid.uuid4())
+        with portal.lock:
+            portal.sends.append({"statusId": status_id, "emailId": body.get("emailId"), "to": to.lower(),
+                                 "customProperties": body.get("customProperties") or {}, "ts": time.time()})
+            portal.stats["sends"] += 1
+        portal.engage(to.lower(), body.get("emailId"))
+        return 200, {"statusId": status_id, "status": "PENDING", "requestedAt": portal._now_iso()}
+
+    # ----- email events (legacy v1) -----
+    if path == "/email/public/v1/events" and method == "GET":
+        return 200, portal.list_events(query)
+
+    return 404, {"status": "error", "message": f"No mock route for {method} {path}", "category": "OBJECT_NOT_FOUND"}
+
+
+def serve(host: str = "127.0.0.1", port: int = 0, **portal_opts) -> Tuple[ThreadingHTTPServer, MockHubSpot]:
+    """Start the stand-in on a daemon thread (port 0 = pick a free port). Returns (server, portal)."""
+    seed = portal_opts.pop("seed", 0)
+    portal = MockHubSpot(**portal_opts)
+    if seed:
+        portal.seed(seed)
+    handler = type("BoundHandler", (Handler,), {"portal": portal})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="hubspot-mock", daemon=True).start()
+    return server, portal
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Local HubSpot API stand-in")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=40.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--rate-limit", type=int, default=100, help="requests per interval before 429")
+    ap.add_argument("--rate-interval-ms", type=int, default=10_000)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 502")
+    ap.add_argument("--seed", type=int, default=0, help="pre-populate N contacts across the 3 personas")
+    args = ap.parse_args(argv)
+
+    server, portal = serve(args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           rate_limit=args.rate_limit, rate_interval_ms=args.rate_interval_ms,
+                           error_rate=args.error_rate, seed=args.seed)
+    print(f"🧪 Mock HubSpot on http://{args.host}:{server.server_address[1]}  ({len(portal.contacts)} contacts)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"stats: {portal.stats}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
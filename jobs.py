@@ -0,0 +1,275 @@
+# jobs.py — background job runner for long generation / send work
+"""
+Button clicks submit jobs instead of doing the work inside the Streamlit script run, so
+reruns never cut work off and several editors can queue work at once. Jobs run on a shared
+thread pool; each one has a row in data/jobs.db (state, progress, partial result, error),
+which the UI polls.
+
+    import jobs
+    job_id = jobs.submit("generate", {"topic": "..."}, owner=session_id)
+    jobs.get(job_id)   # {"state": "running", "progress": 0.5, "note": "...", "result": {...}, ...}
+
+Job kinds are registered with @jobs.job("kind"); the function gets a JobContext first and
+the submitted params as keyword arguments, and returns the final result (a dict).
+Jobs left queued/running by a process that has exited are marked "interrupted".
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, List, Optional
+
+import content_engine as ce
+import contact_mirror as mirror
+import doc_publisher as publisher
+import hubspot_client as hs
+import outbox
+import storage as store
+
+DB_PATH = os.getenv("JOBS_DB", f"{store.ROOT}/jobs.db")
+WORKERS = int(os.getenv("JOBS_WORKERS", "4"))
+# How long a send job waits for rows the outbox worker claimed before reporting
+SEND_SETTLE_S = float(os.getenv("JOBS_SEND_SETTLE_S", "120"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id       TEXT PRIMARY KEY,
+    kind     TEXT NOT NULL,
+    owner    TEXT,
+    params   TEXT,
+    state    TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    note     TEXT,
+    result   TEXT,
+    error    TEXT,
+    pid      INTEGER,
+    created  REAL,
+    started  REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs(created);
+"""
+
+_KINDS: Dict[str, Callable[..., Dict[str, Any]]] = {}
+_POOL = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="job")
+_INIT_LOCK = threading.Lock()
+_INITIALIZED = False
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _reap_orphans() -> None:
+    """Mark jobs whose owning process has gone as interrupted (once per process)."""
+    global _INITIALIZED
+    with _INIT_LOCK:
+        if _INITIALIZED:
+            return
+        conn = _connect()
+        try:
+            rows = conn.execute("SELECT id, pid FROM jobs WHERE state IN ('queued', 'running')").fetchall()
+            dead = [(time.time(), r["id"]) for r in rows if r["pid"] != os.getpid() and not _pid_alive(r["pid"])]
+            conn.executemany(
+                "UPDATE jobs SET state = 'interrupted', error = 'process exited before the job finished', finished = ? WHERE id = ?",
+                dead,
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        _INITIALIZED = True
+
+def _update(job_id: str, **fields: Any) -> None:
+    for k in ("result", "params"):
+        if k in fields:
+            fields[k] = json.dumps(fields[k], ensure_ascii=False, default=str)
+    conn = _connect()
+    try:
+        conn.execute(f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+class JobContext:
+    """Handed to job functions to report progress and partial results."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.result: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def progress(self, fraction: float, note: str = "") -> None:
+        _update(self.job_id, progress=max(0.0, min(1.0, float(fraction))), note=note)
+
+    def partial(self, **result: Any) -> None:
+        """Merge keys into the job's visible result while it is still running."""
+        with self._lock:
+            self.result.update(result)
+            snapshot = dict(self.result)
+        _update(self.job_id, result=snapshot)
+
+def job(kind: str):
+    """Register a job function under `kind`."""
+    def register(fn: Callable[..., Dict[str, Any]]):
+        _KINDS[kind] = fn
+        return fn
+    return register
+
+def _run(job_id: str, kind: str, params: Dict[str, Any]) -> None:
+    ctx = JobContext(job_id)
+    _update(job_id, state="running", started=time.time())
+    try:
+        result = _KINDS[kind](ctx, **params)
+        ctx.result.update(result or {})
+        _update(job_id, state="done", progress=1.0, result=ctx.result, finished=time.time())
+    except Exception as e:
+        _update(job_id, state="error", error=f"{type(e).__name__}: {e}", result=ctx.result, finished=time.time())
+
+def submit(kind: str, params: Optional[Dict[str, Any]] = None, *, owner: str = "") -> str:
+    """Queue a job and return its id; the work runs on the pool, independent of the caller."""
+    if kind not in _KINDS:
+        raise ValueError(f"unknown job kind: {kind}")
+    _reap_orphans()
+    job_id = uuid.uuid4().hex[:12]
+    params = params or {}
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs(id, kind, owner, params, state, pid, created) VALUES (?,?,?,?,?,?,?)",
+            (job_id, kind, owner, json.dumps(params, ensure_ascii=False, default=str), "queued", os.getpid(), time.time()),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    _POOL.submit(_run, job_id, kind, params)
+    return job_id
+
+def _row(r: sqlite3.Row) -> Dict[str, Any]:
+    out = dict(r)
+    out["params"] = json.loads(out["params"] or "{}")
+    out["result"] = json.loads(out["result"] or "{}")
+    return out
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    conn = _connect()
+    try:
+        r = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row(r) if r else None
+    finally:
+        conn.close()
+
+def recent(limit: int = 10, *, kinds: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    _reap_orphans()
+    conn = _connect()
+    try:
+        if kinds:
+            marks = ",".join("?" * len(kinds))
+            rows = conn.execute(f"SELECT * FROM jobs WHERE kind IN ({marks}) ORDER BY created DESC LIMIT ?", (*kinds, limit))
+        else:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,))
+        return [_row(r) for r in rows.fetchall()]
+    finally:
+        conn.close()
+
+def active() -> int:
+    conn = _connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE state IN ('queued', 'running')").fetchone()[0]
+    finally:
+        conn.close()
+
+# ===== Job kinds =====
+@job("generate")
+def _generate(ctx: JobContext, topic: str) -> Dict[str, Any]:
+    ctx.progress(0.05, "writing blog and newsletters")
+    payload = ce.make_blog_and_newsletters(topic)
+    payload["doc_url"] = ""
+    path = store.save_content(payload)
+    ctx.partial(path=path, slug=payload.get("slug"))
+    ctx.progress(0.9, "queueing Google Doc")
+    publisher.submit(path)
+    return {"path": path, "slug": payload.get("slug")}
+
+@job("send_personas")
+def _send_personas(
+    ctx: JobContext,
+    personas: Dict[str, Dict[str, Any]],
+    email_id: str,
+    send_date: str = "",
+    blog_title: str = "",
+    mirror_max_age_s: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    personas: {key: {"newsletter_id", "props", "recipients" (explicit list or None for the mirror)}}.
+    Personas run side by side: each resolves recipients, creates the ones that are not HubSpot
+    contacts yet (mirrored recipients already are), queues its sends and starts draining them
+    right away. The send log is written once at the end.
+    """
+    started = time.monotonic()
+    queued: Dict[str, Any] = {}
+    sent: Dict[str, Any] = {}
+
+    def run(keyp: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+        seg = hs.ensure_persona_list(keyp)
+        mirrored = [] if spec.get("recipients") else mirror.persona_emails(keyp, max_age_s=mirror_max_age_s)
+        addresses = spec.get("recipients") or mirrored or [f"{keyp}@example.com"]
+        missing = []
+        if not mirrored:
+            # one batch read per 100 addresses (cached), then create only the unknown ones
+            known = hs.resolve_contact_ids(addresses)
+            missing = [a for a in addresses if not known.get(a.strip().lower())]
+            if missing:
+                hs.upsert_contacts([{"email": a, "properties": {"persona": keyp}} for a in missing])
+        res = outbox.enqueue(
+            spec["newsletter_id"], addresses, email_id=email_id, props=spec.get("props") or {},
+            audience=keyp, send_date=send_date, blog_title=blog_title, defer_log=True,
+        )
+        res["contacts_created"] = len(missing)
+        if seg.get("status") == "error":
+            res["list_error"] = seg
+        queued[keyp] = res
+        ctx.partial(queued=dict(queued))
+        outbox.drain(newsletter_ids=[spec["newsletter_id"]])
+        # the background worker may have claimed some of these rows: wait for its sends to land,
+        # then report what the outbox recorded rather than what this drain happened to send
+        deadline = time.monotonic() + SEND_SETTLE_S
+        counts = outbox.status(spec["newsletter_id"])
+        while counts.get("inflight") and time.monotonic() < deadline:
+            time.sleep(0.5)
+            counts = outbox.status(spec["newsletter_id"])
+        return counts
+
+    ctx.progress(0.05, f"preparing {', '.join(personas)}")
+    with ThreadPoolExecutor(max_workers=max(1, len(personas)), thread_name_prefix="send-persona") as pool:
+        futures = {pool.submit(run, keyp, spec): keyp for keyp, spec in personas.items()}
+        for n, fut in enumerate(as_completed(futures), 1):
+            keyp = futures[fut]
+            try:
+                sent[keyp] = fut.result()
+            except Exception as e:
+                sent[keyp] = {"status": "error", "detail": f"{type(e).__name__}: {e}"}
+            ctx.partial(sent=dict(sent))
+            ctx.progress(0.05 + 0.9 * n / len(personas), f"{keyp}: done")
+
+    logged = outbox.flush_send_log(newsletter_ids=[spec["newsletter_id"] for spec in personas.values()])
+    outbox.ensure_worker()  # retries for anything that failed transiently
+    return {"queued": queued, "sent": sent, "logged": logged, "wall_s": round(time.monotonic() - started, 2)}
@@ -1,5 +1,6 @@
 # llm_summary.py
 import os
+import functools
 from typing import List, Dict, Any
 from collections import defaultdict
 from dotenv import load_dotenv
@@ -13,15 +14,20 @@ GEMINI_MODEL = (os.getenv("GEMINI_MODEL") or "gemini-1.5-flash").strip()
 
 
 # OpenAI helpers
-def _get_openai_client():
+@functools.lru_cache(maxsize=4)
+def _openai_client_for(key: str):
+    # one client (and its HTTP connection pool) per API key for the life of the process
     try:
         from openai import OpenAI
     except Exception:
         return None
+    return OpenAI(api_key=key)
+
+def _get_openai_client():
     key = (os.getenv("OPENAI_API_KEY") or "").strip().strip('"').strip("'")
     if not key:
         return None
-    return OpenAI(api_key=key)
+    return _openai_client_for(key)
 
 
 def _call_openai(prompt: str, system: str = "") -> str:
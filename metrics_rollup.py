@@ -0,0 +1,86 @@
+# metrics_rollup.py — server-side aggregation and downsampling for the performance charts
+"""
+Tab 3 used to chart every raw metrics record. With months of history that is a large
+payload for the browser, so charts are built from rollups instead:
+
+- rollup(df, metric, bucket): per-persona mean of `metric` and record count per time bucket
+  (hour, day or week), in long form (bucket, audience, mean, count).
+- lttb(x, y, n): Largest-Triangle-Three-Buckets downsampling; keeps the first and last point
+  and the n-2 points in between that best preserve the line's shape.
+- chart_frame(...): rollup, then LTTB per persona down to at most max_points points.
+
+    import metrics_rollup as rollup
+    frame = rollup.chart_frame(df, "open_rate", bucket="day", max_points=500)
+    st.line_chart(frame, x="bucket", y="mean", color="audience")
+"""
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# bucket name -> pandas period alias (weeks start on Monday)
+BUCKETS = {"hour": "h", "day": "D", "week": "W-SUN"}
+# bounds for the per-persona point budget (the Tab 3 widget uses the same range)
+POINTS_RANGE = (50, 5000)
+MAX_POINTS = min(max(int(os.getenv("METRICS_CHART_MAX_POINTS", "500")), POINTS_RANGE[0]), POINTS_RANGE[1])
+
+def rollup(df: pd.DataFrame, metric: str, bucket: str = "day") -> pd.DataFrame:
+    """Per-audience mean and count of `metric` per time bucket (UTC), sorted by bucket."""
+    if bucket not in BUCKETS:
+        raise ValueError(f"unknown bucket: {bucket} (expected one of {', '.join(BUCKETS)})")
+    cols = ["bucket", "audience", "mean", "count"]
+    if df is None or df.empty or metric not in df:
+        return pd.DataFrame(columns=cols)
+    data = df[["ts", "audience", metric]].dropna(subset=[metric])
+    when = pd.to_datetime(pd.to_numeric(data["ts"], errors="coerce"), unit="s")
+    data = data.assign(bucket=when.dt.to_period(BUCKETS[bucket]).dt.start_time).dropna(subset=["bucket"])
+    out = (data.groupby(["bucket", "audience"])[metric]
+               .agg(["mean", "count"])
+               .reset_index()
+               .sort_values(["audience", "bucket"], ignore_index=True))
+    return out[cols]
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """Indices of the points LTTB keeps when reducing (x, y) to n points; x must be sorted."""
+    size = len(x)
+    if n >= size or size <= 2:
+        return np.arange(size)
+    n = max(n, 3)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (size - 2) / (n - 2)
+    keep = np.empty(n, dtype=int)
+    keep[0], keep[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        # average of the next bucket is the third corner of the triangle
+        nxt_hi = min(int((i + 2) * every) + 1, size)
+        avg_x, avg_y = x[hi:nxt_hi].mean(), y[hi:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def chart_frame(
+    df: pd.DataFrame,
+    metric: str,
+    *,
+    bucket: str = "day",
+    max_points: Optional[int] = MAX_POINTS,
+) -> pd.DataFrame:
+    """rollup() with each audience's series reduced to at most max_points by LTTB (None keeps all)."""
+    frame = rollup(df, metric, bucket)
+    if not max_points or frame.empty:
+        return frame
+    parts = []
+    for _, series in frame.groupby("audience", sort=False):
+        if len(series) > max_points:
+            x = series["bucket"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+            series = series.iloc[lttb(x, series["mean"].to_numpy(), max_points)]
+        parts.append(series)
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,62 @@
+"""
+Migrate flat data files into the day-partitioned layout
+- data/content/YYYYMMDD-<slug>.json  -> data/content/date=YYYY-MM-DD/YYYYMMDD-<slug>.json
+- data/perf/metrics.jsonl            -> data/perf/date=YYYY-MM-DD/metrics.jsonl  (split by record ts)
+- data/crm/send_log.jsonl            -> data/crm/date=YYYY-MM-DD/send_log.jsonl  (split by record ts)
+Migrated log files are renamed to *.migrated so a re-run never appends twice.
+Usage: python migrate_partitions.py [--dry-run]
+"""
+
+import os
+import sys
+import pathlib
+from collections import defaultdict
+from typing import Dict, List, Any
+
+import storage as store
+
+
+def migrate_content(dry_run: bool = False) -> int:
+    moved = 0
+    for p in sorted(pathlib.Path(store.CONTENT_DIR).glob("*.json")):
+        prefix = p.name[:8]
+        if not prefix.isdigit():
+            continue  # e.g. google_docs_index.json stays at the top level
+        day = f"{prefix[:4]}-{prefix[4:6]}-{prefix[6:]}"
+        dest = pathlib.Path(store.partition_dir(store.CONTENT_DIR, day)) / p.name
+        print(f"content: {p} -> {dest}")
+        if not dry_run:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(p, dest)
+        moved += 1
+    return moved
+
+
+def migrate_log(kind_dir: str, name: str, dry_run: bool = False) -> int:
+    src = pathlib.Path(kind_dir) / name
+    if not src.exists():
+        return 0
+    by_day: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for rec in store.read_jsonl(src):
+        by_day[store._day_of_ts(rec.get("ts"))].append(rec)
+    for day, rows in sorted(by_day.items()):
+        dest = f"{store.partition_dir(kind_dir, day)}/{name}"
+        print(f"{name}: {len(rows)} rows -> {dest}")
+        if not dry_run:
+            for rec in rows:
+                store.append_jsonl(dest, rec)
+    if not dry_run:
+        os.replace(src, src.with_name(src.name + ".migrated"))
+    return sum(len(r) for r in by_day.values())
+
+
+def main(dry_run: bool = False):
+    n_content = migrate_content(dry_run)
+    n_metrics = migrate_log(store.PERF_DIR, store.METRICS_FILE, dry_run)
+    n_sends = migrate_log(store.CRM_DIR, store.SEND_LOG_FILE, dry_run)
+    mode = "would migrate" if dry_run else "migrated"
+    print(f"✅ {mode}: {n_content} content files, {n_metrics} metric rows, {n_sends} send-log rows")
+
+
+if __name__ == "__main__":
+    main(dry_run="--dry-run" in sys.argv[1:])
@@ -0,0 +1,339 @@
+# outbox.py — durable send outbox with idempotency keys and a background worker
+"""
+Every (newsletter_id, recipient) pair is enqueued once into data/crm/outbox.db under the
+idempotency key "<newsletter_id>:<email>", so clicking Send twice never queues a second copy.
+Without send credentials rows are queued in simulate mode instead ("sim:" key prefix, final
+state "simulated", send-log mode "simulate"), which never counts as a delivery: once sending is
+enabled the same newsletter can still go out for real.
+A worker drains the queue in parallel through hubspot_client's dispatcher and records each
+recipient's delivery state as its result lands. Rows are claimed with a lease, so after a crash
+or restart anything left in flight goes back to the queue when its lease expires and the worker
+resumes where it stopped. The send log (storage.append_send_log) is written from the outbox, one
+record per drained newsletter batch, and a logged flag makes that catch up after a crash too.
+
+Failed sends: transient errors (429, 503, connection failures) go back to pending with an
+exponential backoff (next_attempt_at) that claims respect, up to MAX_ATTEMPTS; permanent errors
+(any other 4xx, or a failure where delivery is unknown) are marked failed on the first attempt.
+
+Sending is at-least-once around a crash: a recipient whose send went out but whose state was not
+yet recorded is retried once the lease expires.
+
+Usage: python outbox.py [--once]        # run a standalone worker (set OUTBOX_EXTERNAL_WORKER=true
+                                         # so the Streamlit app doesn't start its own)
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, Any, Iterable, List, Optional
+
+import hubspot_client as hs
+import storage as store
+
+DB_PATH = os.getenv("OUTBOX_DB", f"{store.CRM_DIR}/outbox.db")
+LEASE_S = float(os.getenv("OUTBOX_LEASE_S", "300"))
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# Transient failures wait RETRY_BASE_S * 2^(attempts-1) (jittered, capped) before the next claim
+RETRY_BASE_S = float(os.getenv("OUTBOX_RETRY_BASE_S", "30"))
+RETRY_CAP_S = float(os.getenv("OUTBOX_RETRY_CAP_S", "3600"))
+EXTERNAL_WORKER = os.getenv("OUTBOX_EXTERNAL_WORKER", "false").lower() == "true"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    idem_key      TEXT PRIMARY KEY,
+    newsletter_id TEXT NOT NULL,
+    recipient     TEXT NOT NULL,
+    audience      TEXT,
+    email_id      TEXT,
+    props         TEXT,
+    send_date     TEXT,
+    blog_title    TEXT,
+    mode          TEXT NOT NULL DEFAULT 'send',
+    state         TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    lease_until   REAL,
+    next_attempt_at REAL,
+    last_error    TEXT,
+    result        TEXT,
+    logged        INTEGER NOT NULL DEFAULT 0,
+    created       REAL,
+    updated       REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox(state, lease_until);
+CREATE INDEX IF NOT EXISTS outbox_newsletter ON outbox(newsletter_id, state);
+"""
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)  # explicit transactions below
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def idempotency_key(newsletter_id: str, recipient: str, mode: str = "send") -> str:
+    key = f"{newsletter_id}:{recipient.strip().lower()}"
+    return f"sim:{key}" if mode == "simulate" else key
+
+# ===== Producer side =====
+def enqueue(
+    newsletter_id: str,
+    recipients: Iterable[str],
+    *,
+    email_id: Any,
+    props: Optional[Dict[str, Any]] = None,
+    audience: str = "",
+    send_date: str = "",
+    blog_title: str = "",
+    defer_log: bool = False,
+) -> Dict[str, Any]:
+    """
+    Queue one send per recipient, in simulate mode unless hubspot_client.can_send(). Pairs
+    already queued in the same mode, or (real sends) already delivered according to the send
+    log, are skipped and counted as duplicates. defer_log=True leaves the send-log write
+    to the caller's flush_send_log(newsletter_ids=...) instead of the worker's periodic flush
+    (the worker still picks such rows up once they are older than the lease).
+    """
+    now = time.time()
+    mode = "send" if hs.can_send() else "simulate"
+    props_json = json.dumps(props or {}, ensure_ascii=False, sort_keys=True)
+    emails = list(dict.fromkeys(e for e in ((r or "").strip().lower() for r in recipients) if e))
+    todo = store.unsent_recipients(newsletter_id, emails) if mode == "send" else emails
+    rows = [
+        (idempotency_key(newsletter_id, email, mode), newsletter_id, email, audience, str(email_id),
+         props_json, send_date, blog_title, mode, -1 if defer_log else 0, now, now)
+        for email in todo
+    ]
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO outbox(idem_key, newsletter_id, recipient, audience, email_id, props, send_date,"
+            " blog_title, mode, logged, created, updated) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+            rows,
+        )
+        added = conn.total_changes - before
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return {"newsletter_id": newsletter_id, "mode": mode, "enqueued": added, "duplicates": len(emails) - added}
+
+def status(newsletter_id: Optional[str] = None) -> Dict[str, int]:
+    conn = _connect()
+    try:
+        if newsletter_id:
+            cur = conn.execute("SELECT state, COUNT(*) FROM outbox WHERE newsletter_id = ? GROUP BY state", (newsletter_id,))
+        else:
+            cur = conn.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state")
+        return dict(cur.fetchall())
+    finally:
+        conn.close()
+
+# ===== Worker side =====
+def _in_clause(column: str, values: Optional[List[str]]) -> tuple:
+    if not values:
+        return "", ()
+    return f" AND {column} IN ({','.join('?' * len(values))})", tuple(values)
+
+def _claim(conn: sqlite3.Connection, limit: int, newsletter_ids: Optional[List[str]] = None) -> List[sqlite3.Row]:
+    now = time.time()
+    only, args = _in_clause("newsletter_id", newsletter_ids)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # real sends stay queued while sending is disabled
+        rows = conn.execute(
+            "SELECT * FROM outbox WHERE ((state = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= ?))"
+            f" OR (state = 'inflight' AND lease_until < ?)) AND (mode = 'simulate' OR ?){only} ORDER BY created LIMIT ?",
+            (now, now, int(hs.can_send()), *args, limit),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE outbox SET state = 'inflight', lease_until = ?, attempts = attempts + 1, updated = ? WHERE idem_key = ?",
+            [(now + LEASE_S, now, r["idem_key"]) for r in rows],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+def _retryable(outcome: Dict[str, Any]) -> bool:
+    """Transient failures only: the dispatcher's verdict, else anything but a non-429 4xx."""
+    if "retryable" in outcome:
+        return bool(outcome["retryable"])
+    err = outcome.get("error")
+    code = err.get("code") if isinstance(err, dict) else None
+    return not (isinstance(code, int) and 400 <= code < 500 and code != 429)
+
+def _backoff(attempts: int) -> float:
+    return random.uniform(0.5, 1.0) * min(RETRY_CAP_S, RETRY_BASE_S * 2 ** max(0, attempts - 1))
+
+def _mark(conn: sqlite3.Connection, key: str, outcome: Dict[str, Any], attempts: int, *, simulated: bool = False) -> str:
+    now = time.time()
+    next_at = None
+    if "error" not in outcome:
+        state, err = ("simulated" if simulated else "sent"), None
+    else:
+        state = "pending" if attempts < MAX_ATTEMPTS and _retryable(outcome) else "failed"
+        err = json.dumps(outcome.get("error"), ensure_ascii=False, default=str)
+        if state == "pending":
+            next_at = now + _backoff(attempts)
+    conn.execute(
+        "UPDATE outbox SET state = ?, last_error = ?, result = ?, lease_until = NULL, next_attempt_at = ?, updated = ?"
+        " WHERE idem_key = ?",
+        (state, err, json.dumps(outcome.get("response"), ensure_ascii=False, default=str), next_at, now, key),
+    )
+    return state
+
+def flush_send_log(conn: Optional[sqlite3.Connection] = None, newsletter_ids: Optional[List[str]] = None) -> int:
+    """
+    Write send-log records for sent rows not yet logged: one record per newsletter, all in
+    a single storage write. With newsletter_ids, only those newsletters (deferred rows
+    included); otherwise every undeferred row plus deferred rows whose owner went away.
+    """
+    own = conn is None
+    if own:
+        conn = _connect()
+        conn.row_factory = sqlite3.Row
+    try:
+        if newsletter_ids:
+            only, args = _in_clause("newsletter_id", newsletter_ids)
+            where, params = f"state IN ('sent', 'simulated') AND logged IN (0, -1){only}", args
+        else:
+            where, params = ("state IN ('sent', 'simulated') AND (logged = 0 OR (logged = -1 AND updated < ?))",
+                             (time.time() - LEASE_S,))
+        # the write lock is held until the rows are marked, so concurrent flushes can't log a row twice
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(f"SELECT * FROM outbox WHERE {where} ORDER BY updated", params).fetchall()
+            by_nl: Dict[tuple, List[sqlite3.Row]] = defaultdict(list)
+            for r in rows:
+                by_nl[(r["newsletter_id"], r["mode"])].append(r)
+            store.append_send_logs([_log_record(nl_id, group) for (nl_id, _), group in by_nl.items()])
+            conn.executemany("UPDATE outbox SET logged = 1 WHERE idem_key = ?", [(r["idem_key"],) for r in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+    finally:
+        if own:
+            conn.close()
+
+def _release(conn: sqlite3.Connection, rows: List[sqlite3.Row]) -> None:
+    """Put claimed rows back untouched (sending was switched off between claim and send)."""
+    conn.executemany(
+        "UPDATE outbox SET state = 'pending', lease_until = NULL, attempts = ?, updated = ? WHERE idem_key = ?",
+        [(r["attempts"], time.time(), r["idem_key"]) for r in rows],
+    )
+
+def _log_record(nl_id: str, group: List[sqlite3.Row]) -> Dict[str, Any]:
+    first = group[0]
+    return {
+        "ts": int(time.time()),
+        "send_date": first["send_date"],
+        "audience": first["audience"],
+        "blog_title": first["blog_title"],
+        "newsletter_id": nl_id,
+        "recipients": [r["recipient"] for r in group],
+        "hubspot_result": {
+            "mode": first["mode"],
+            "emailId": first["email_id"],
+            "results": [{"to": r["recipient"], "response": json.loads(r["result"] or "null")} for r in group],
+        },
+    }
+
+def drain(
+    *,
+    batch_size: int = BATCH_SIZE,
+    concurrency: Optional[int] = None,
+    max_batches: Optional[int] = None,
+    newsletter_ids: Optional[List[str]] = None,
+) -> Dict[str, int]:
+    """
+    Send everything currently claimable (only newsletter_ids, if given).
+    Returns counts of rows sent / simulated / requeued / failed.
+    """
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    totals = {"sent": 0, "simulated": 0, "pending": 0, "failed": 0}
+    try:
+        flush_send_log(conn)  # catch up on anything a previous run sent but did not log
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            rows = _claim(conn, batch_size, newsletter_ids)
+            if not rows:
+                break
+            batches += 1
+            groups: Dict[tuple, List[sqlite3.Row]] = defaultdict(list)
+            for r in rows:
+                groups[(r["newsletter_id"], r["email_id"], r["props"], r["mode"])].append(r)
+
+            for (_, email_id, props_json, mode), group in groups.items():
+                by_addr = {r["recipient"]: r for r in group}
+                if mode == "simulate":
+                    sim = hs._simulated_send(email_id, list(by_addr), json.loads(props_json or "{}"))
+                    for addr, row in by_addr.items():
+                        outcome = {"to": addr, "response": {"status": "simulated", "messageId": sim["messageId"]}}
+                        totals[_mark(conn, row["idem_key"], outcome, row["attempts"] + 1, simulated=True)] += 1
+                    continue
+
+                def on_result(outcome: Dict[str, Any]) -> None:
+                    row = by_addr[outcome["to"]]
+                    totals[_mark(conn, row["idem_key"], outcome, row["attempts"] + 1)] += 1
+
+                # the outbox owns retries (with backoff across drains): one POST per attempt
+                res = hs.single_send_marketing_email(
+                    email_id=email_id,
+                    to_addresses=list(by_addr),
+                    custom_props=json.loads(props_json or "{}"),
+                    concurrency=concurrency,
+                    retries=0,
+                    retry_statuses=(),
+                    on_result=on_result,
+                )
+                if res.get("mode") == "simulate":
+                    _release(conn, group)
+            flush_send_log(conn)
+        return totals
+    finally:
+        conn.close()
+
+def run_worker(poll_s: float = 2.0, stop: Optional[threading.Event] = None, once: bool = False) -> None:
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            done = drain()
+            if any(done.values()):
+                print(f"OUTBOX: {done}")
+        except Exception as e:
+            print(f"OUTBOX worker error: {type(e).__name__}: {e}")
+        if once:
+            return
+        stop.wait(poll_s)
+
+_WORKER: Optional[threading.Thread] = None
+_WORKER_LOCK = threading.Lock()
+
+def ensure_worker() -> bool:
+    """Start an in-process background worker once (unless an external worker is configured)."""
+    global _WORKER
+    if EXTERNAL_WORKER:
+        return False
+    with _WORKER_LOCK:
+        if _WORKER is None or not _WORKER.is_alive():
+            _WORKER = threading.Thread(target=run_worker, name="outbox-worker", daemon=True)
+            _WORKER.start()
+    return True
+
+
+if __name__ == "__main__":
+    print("📬 Outbox worker started" + (" (single pass)" if "--once" in sys.argv[1:] else ""))
+    run_worker(once="--once" in sys.argv[1:])
+    print(f"Outbox: {status()}")
@@ -1,19 +1,25 @@
 """
 AI Marketing Pipeline runner
 - Generates a blog + 3 persona newsletters with OpenAI (or a deterministic fallback).
-- Pulls persona segments from HubSpot (via hubspot_client.py).
-- Simulates sends + performance and writes a campaign artifact under ./runs/
+- Optionally imports contacts from a CSV (email, persona, ...) with batched HubSpot upserts.
+- Resolves persona segments from the local contact mirror (incrementally synced from HubSpot).
+- Sends (simulated unless enabled), reads performance from ingested HubSpot email events
+  (simulated when not connected) and writes a campaign artifact under ./runs/
 """
 
 import os
-import json
+import csv
 import time
 import random
 import pathlib
-from typing import Dict, Any, List
+import itertools
+from typing import Dict, Any, Iterable, Iterator, List, Optional
 
 from dotenv import load_dotenv
 import hubspot_client as hc  #local helper
+import contact_mirror as mirror
+import engagement_ingest as engagement
+import storage as store
 
 try:
     from openai import OpenAI
@@ -31,6 +37,12 @@ RUNS_DIR.mkdir(exist_ok=True)
 # default to a broadly available model
 MODEL_ID = (os.getenv("OPENAI_MODEL") or "gpt-3.5-turbo-0125").strip()
 
+# Recipients per send call while streaming a segment
+SEND_CHUNK = 500
+
+# Resolve recipients from the local contact mirror, syncing it first if older than this (seconds)
+MIRROR_MAX_AGE = float(os.getenv("CONTACT_MIRROR_MAX_AGE", "900"))
+
 
 # OpenAI helpers
 def get_openai_client():
@@ -74,6 +86,15 @@ def ai_or_fallback(prompt: str) -> str:
         return f"[FAKE AI OUTPUT due to model/error: {e.__class__.__name__}] {prompt[:140]}..."
 
 
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 # Content generation
 def generate_content(topic: str) -> Dict[str, Any]:
     """Generate a blog draft + persona-specific newsletters."""
@@ -113,6 +134,24 @@ def simulate_performance() -> Dict[str, Any]:
     return {"open_rate": open_rate, "click_rate": click_rate, "unsubscribe_rate": unsub_rate}
 
 
+def segment_performance(segments: List[str]) -> Dict[str, Any]:
+    """
+    Per-segment rates from ingested HubSpot email events; simulated for segments with no data yet.
+    """
+    real: Dict[str, Dict[str, float]] = {}
+    if hc.hubspot_available():
+        engagement.ingest()
+        real = engagement.persona_rates()
+    perf = {}
+    for seg in segments:
+        rates = real.get(hc._PERSONA_VALUE_TO_KEY.get(seg, seg))
+        perf[seg] = (
+            {"open_rate": rates["open_rate"], "click_rate": rates["click_rate"], "unsubscribe_rate": rates["unsub_rate"]}
+            if rates else simulate_performance()
+        )
+    return perf
+
+
 def performance_summary(perf_by_segment: Dict[str, Any], topic: str) -> str:
     """
     Summarize metrics with OpenAI if available, otherwise fallback text.
@@ -149,43 +188,64 @@ def performance_summary(perf_by_segment: Dict[str, Any], topic: str) -> str:
 
 
 
+# Contact import
+def import_contacts(csv_path: str) -> Dict[str, Any]:
+    """
+    Upsert contacts from a CSV with an 'email' column; every other column is sent as a
+    contact property ('persona' accepts founder|creative|ops). Uses HubSpot batch upserts.
+    """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        records = [
+            {"email": row.pop("email", ""), "properties": {k: v for k, v in row.items() if k and v}}
+            for row in csv.DictReader(f)
+        ]
+    res = hc.upsert_contacts(records)
+    print(f"📇 Imported contacts: {res.get('ok', 0)} ok, {res.get('errors', 0)} errors ({res.get('status')})")
+    return res
+
+
 # Main pipeline
-def main(topic: str):
+def main(topic: str, contacts_csv: Optional[str] = None):
     print(f"\n🧠 Generating AI marketing campaign for topic: {topic}\n")
 
+    # 0) Optional contact import so the segments below include them
+    if contacts_csv:
+        import_contacts(contacts_csv)
+        mirror.sync()  # pick the imported contacts up before resolving segments
+
     # 1) Generate content
     content = generate_content(topic)
 
-    # 2) Pull segments (by your custom 'audience_persona' property via hubspot_client)
-    segments = {
-        "startup_founder": hc.search_contacts_by_persona("startup_founder"),
-        "creative_professional": hc.search_contacts_by_persona("creative_professional"),
-        "ops_manager": hc.search_contacts_by_persona("ops_manager"),
-    }
-
-    # 3) Simulated sends (real API call only if HUBSPOT_SEND_ENABLED=true)
+    # 2) + 3) Stream each persona segment from the mirror and send in chunks, so memory stays flat
+    # for large segments (real API call only if HUBSPOT_SEND_ENABLED=true)
+    segments = ["startup_founder", "creative_professional", "ops_manager"]
+    email_template_id = os.getenv("HUBSPOT_EMAIL_TEMPLATE_ID", "TEMPLATE_ID")
+    seg_counts: Dict[str, int] = {}
     send_logs: List[Dict[str, Any]] = []
-    for seg_key, res in segments.items():
-        emails = [r["email"] for r in res.get("results", []) if r.get("email")]
-        if not emails:
-            continue
-
-        email_template_id = os.getenv("HUBSPOT_EMAIL_TEMPLATE_ID", "TEMPLATE_ID")
-        payload = hc.single_send_marketing_email(
-            email_id=email_template_id,
-            to_addresses=emails,
-            custom_props={"persona_segment": seg_key, "topic": topic},
-        )
-        send_logs.append({"segment": seg_key, "result": payload, "emails": emails})
+    for seg_key in segments:
+        contacts = mirror.iter_persona(seg_key, max_age_s=MIRROR_MAX_AGE)
+        emails_iter = (c["email"] for c in contacts if c.get("email"))
+        sent, batches = 0, 0
+        for emails in _chunks(emails_iter, SEND_CHUNK):
+            payload = hc.single_send_marketing_email(
+                email_id=email_template_id,
+                to_addresses=emails,
+                custom_props={"persona_segment": seg_key, "topic": topic},
+            )
+            sent += len(emails)
+            batches += 1
 
-        # Local audit log
-        hc.log_send_event(
-            "runs/sends.log",
-            {"ts": int(time.time()), "segment": seg_key, "emails": emails, "result": payload},
-        )
+            # Local audit log (full per-recipient detail lives here, not in the artifact)
+            hc.log_send_event(
+                "runs/sends.log",
+                {"ts": int(time.time()), "segment": seg_key, "emails": emails, "result": payload},
+            )
+        seg_counts[seg_key] = sent
+        if sent:
+            send_logs.append({"segment": seg_key, "recipients": sent, "batches": batches})
 
-    # 4) Simulate performance per segment & summarize
-    perf = {seg: simulate_performance() for seg in segments.keys()}
+    # 4) Performance per segment (real engagement from HubSpot when connected) & summarize
+    perf = segment_performance(segments)
     summary = performance_summary(perf, topic)
 
     # 5) Save a campaign artifact
@@ -193,14 +253,14 @@ def main(topic: str):
     out = {
         "topic": topic,
         "content": content,
-        "segments": {k: v.get("results", []) for k, v in segments.items()},
+        "segments": seg_counts,
         "sends": send_logs,
         "performance": perf,
         "summary": summary,
         "model_used": MODEL_ID,
     }
     out_path = RUNS_DIR / f"campaign_{ts}.json"
-    out_path.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    store.write_doc(out_path, out)
 
     print(f"✅ Saved campaign ->  {out_path}\n")
     print("📊 Performance Summary:\n")
@@ -210,6 +270,6 @@ def main(topic: str):
 if __name__ == "__main__":
     import sys
     if len(sys.argv) < 2:
-        print('Usage: python run_campaign.py "<topic>"')
+        print('Usage: python run_campaign.py "<topic>" [contacts.csv]')
         sys.exit(1)
-    main(sys.argv[1])
+    main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -1,5 +1,15 @@
-import os, json, time, pathlib
-from typing import Dict, Any
+import os, json, time, pathlib, datetime, threading
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple, Union
+
+# Optional fast backends; stdlib json is always available as a fallback
+try:
+    import orjson
+except Exception:
+    orjson = None
+try:
+    import msgpack
+except Exception:
+    msgpack = None
 
 ROOT = "data"
 CONTENT_DIR = f"{ROOT}/content"
@@ -8,32 +18,258 @@ CRM_DIR = f"{ROOT}/crm"
 for p in (CONTENT_DIR, PERF_DIR, CRM_DIR):
     os.makedirs(p, exist_ok=True)
 
+# Documents (content files, summaries, campaign artifacts) default to the pretty
+# backend so they stay readable; JSONL logs always use one compact record per line.
+DOC_FORMAT = (os.getenv("STORAGE_DOC_FORMAT") or "pretty").strip().lower()
+
+# ===== Serialization =====
+def _dumps_pretty(obj: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+def _dumps_compact(obj: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _dumps_msgpack(obj: Any) -> bytes:
+    if msgpack is None:
+        raise RuntimeError("STORAGE format 'msgpack' selected but msgpack is not installed")
+    return msgpack.packb(obj, use_bin_type=True)
+
+SERIALIZERS = {
+    "pretty": _dumps_pretty,
+    "compact": _dumps_compact,
+    "msgpack": _dumps_msgpack,
+}
+
+def dumps(obj: Any, fmt: str = "compact") -> bytes:
+    try:
+        return SERIALIZERS[fmt](obj)
+    except KeyError:
+        raise ValueError(f"Unknown storage format '{fmt}' (expected one of {sorted(SERIALIZERS)})")
+
+def _loads_json(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+def loads(data) -> Any:
+    """
+    Decode bytes/str written by any backend: JSON first (any JSON value, not just objects and
+    arrays), msgpack when that fails to parse.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    try:
+        return _loads_json(data)
+    except ValueError as json_err:  # JSONDecodeError and UnicodeDecodeError are ValueErrors
+        if msgpack is None:
+            raise ValueError(f"not JSON ({json_err}) and msgpack is not installed to try that") from json_err
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except Exception:
+            raise json_err
+
+def write_doc(path, obj: Any, fmt: Optional[str] = None) -> None:
+    with open(path, "wb") as f:
+        f.write(dumps(obj, fmt or DOC_FORMAT))
+
+def append_jsonl(path, record: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(str(path)) or ".", exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(_dumps_compact(record) + b"\n")
+
+def read_jsonl(path) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    # JSONL is always JSON, so skip format sniffing on the hot path
+    parse = orjson.loads if orjson is not None else json.loads
+    with open(path, "rb") as f:
+        return [parse(line) for line in f if not line.isspace()]
+
+# ===== Partitions =====
+# Content, metrics and send logs live under data/<kind>/date=YYYY-MM-DD/.
+# Pre-partition flat files (data/perf/metrics.jsonl etc.) are still read until
+# migrate_partitions.py moves them.
+METRICS_FILE = "metrics.jsonl"
+SEND_LOG_FILE = "send_log.jsonl"
+DateLike = Union[None, str, datetime.date]
+
+def _day(value: DateLike) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return datetime.date.fromisoformat(str(value)).isoformat()
+
+def _day_of_ts(ts: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(ts if ts is not None else time.time()))
+
+def partition_dir(kind_dir: str, day: DateLike = None) -> str:
+    return f"{kind_dir}/date={_day(day) or _day_of_ts()}"
+
+def list_partitions(kind_dir: str, start: DateLike = None, end: DateLike = None) -> List[str]:
+    """Partition dirs for kind_dir within [start, end] (inclusive), pruned by name only."""
+    lo, hi = _day(start), _day(end)
+    out = []
+    for p in pathlib.Path(kind_dir).glob("date=*"):
+        day = p.name[len("date="):]
+        if not p.is_dir() or (lo and day < lo) or (hi and day > hi):
+            continue
+        out.append(str(p))
+    return sorted(out)
+
+def _in_range(ts: Any, start: DateLike, end: DateLike) -> bool:
+    if start is None and end is None:
+        return True
+    try:
+        day = _day_of_ts(float(ts))
+    except (TypeError, ValueError):
+        return False
+    lo, hi = _day(start), _day(end)
+    return not ((lo and day < lo) or (hi and day > hi))
+
+def _read_partitioned_log(kind_dir: str, name: str, start: DateLike, end: DateLike) -> List[Dict[str, Any]]:
+    rows = [r for r in read_jsonl(f"{kind_dir}/{name}") if _in_range(r.get("ts"), start, end)]
+    for part in list_partitions(kind_dir, start, end):
+        rows.extend(read_jsonl(f"{part}/{name}"))
+    return rows
+
+def _append_partitioned_log(kind_dir: str, name: str, record: Dict[str, Any]) -> None:
+    append_jsonl(f"{partition_dir(kind_dir, _day_of_ts(record.get('ts')))}/{name}", record)
+
+# ===== Content / metrics / logs =====
 def save_content(payload: Dict[str, Any]) -> str:
     date = time.strftime("%Y%m%d")
-    path = f"{CONTENT_DIR}/{date}-{payload['slug']}.json"
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    part = partition_dir(CONTENT_DIR)
+    os.makedirs(part, exist_ok=True)
+    path = f"{part}/{date}-{payload['slug']}.json"
+    write_doc(path, payload)
     return path
 
-def list_content_files():
-    return sorted([str(p) for p in pathlib.Path(CONTENT_DIR).glob("*.json")])
+def list_content_files(start: DateLike = None, end: DateLike = None):
+    files = [str(p) for part in list_partitions(CONTENT_DIR, start, end) for p in pathlib.Path(part).glob("*.json")]
+    # legacy flat files carry their date as a YYYYMMDD filename prefix; anything else at the
+    # top level (google_docs_index.json) is not content
+    lo, hi = _day(start), _day(end)
+    for p in pathlib.Path(CONTENT_DIR).glob("*.json"):
+        prefix = p.name[:8]
+        if not prefix.isdigit():
+            continue
+        if lo or hi:
+            day = f"{prefix[:4]}-{prefix[4:6]}-{prefix[6:]}"
+            if (lo and day < lo) or (hi and day > hi):
+                continue
+        files.append(str(p))
+    return sorted(files)
 
 def read_json(path: str) -> Dict[str, Any]:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(path, "rb") as f:
+        return loads(f.read())
 
 def append_metrics(record: Dict[str, Any]):
-    with open(f"{PERF_DIR}/metrics.jsonl", "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    _append_partitioned_log(PERF_DIR, METRICS_FILE, record)
+
+def read_metrics(start: DateLike = None, end: DateLike = None) -> List[Dict[str, Any]]:
+    return _read_partitioned_log(PERF_DIR, METRICS_FILE, start, end)
 
 def dump_summary(summary: str):
-    with open(f"{PERF_DIR}/summary.json", "w", encoding="utf-8") as f:
-        json.dump({"summary": summary, "ts": int(time.time())}, f, ensure_ascii=False, indent=2)
+    write_doc(f"{PERF_DIR}/summary.json", {"summary": summary, "ts": int(time.time())})
 
 def append_send_log(record: Dict[str, Any]):
-    with open(f"{CRM_DIR}/send_log.jsonl", "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    _append_partitioned_log(CRM_DIR, SEND_LOG_FILE, record)
+    _SEND_INDEX.add_record(record)
+
+def append_send_logs(records: List[Dict[str, Any]]) -> None:
+    """Append several send-log records with one write per partition file."""
+    by_path: Dict[str, List[bytes]] = {}
+    for record in records:
+        path = f"{partition_dir(CRM_DIR, _day_of_ts(record.get('ts')))}/{SEND_LOG_FILE}"
+        by_path.setdefault(path, []).append(_dumps_compact(record) + b"\n")
+    for path, lines in by_path.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.write(b"".join(lines))
+    for record in records:
+        _SEND_INDEX.add_record(record)
+
+def read_send_log(start: DateLike = None, end: DateLike = None) -> List[Dict[str, Any]]:
+    return _read_partitioned_log(CRM_DIR, SEND_LOG_FILE, start, end)
 
 def overwrite_content(path: str, payload: Dict[str, Any]) -> None:
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    write_doc(path, payload)
+
+# ===== Send dedup index =====
+def _delivered_to(record: Dict[str, Any]) -> List[str]:
+    """Recipients a send-log record counts as delivered (simulated sends never count)."""
+    res = record.get("hubspot_result") or {}
+    if res.get("mode") == "simulate":
+        return []
+    if "recipients" in record:
+        return list(record.get("recipients") or [])
+    return [r.get("to") for r in res.get("results") or [] if r and r.get("to") and "error" not in r]
+
+class _SendIndex:
+    """
+    (newsletter_id, email) pairs already in the send log, held in a set. Built on first use,
+    then kept current by tail-following the log files (only bytes appended since the last look
+    are parsed), so appends from other processes show up too.
+    """
+
+    def __init__(self):
+        self.sent: Set[Tuple[str, str]] = set()
+        self.offsets: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def add_record(self, record: Dict[str, Any]) -> None:
+        nl_id = record.get("newsletter_id")
+        if not nl_id:
+            return
+        with self.lock:
+            for email in _delivered_to(record):
+                if email:
+                    self.sent.add((nl_id, email.strip().lower()))
+
+    def refresh(self) -> None:
+        files = [f"{CRM_DIR}/{SEND_LOG_FILE}"] + [f"{p}/{SEND_LOG_FILE}" for p in list_partitions(CRM_DIR)]
+        for path in files:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            offset = self.offsets.get(path, 0)
+            if size < offset:  # truncated or replaced: start over on this file
+                offset = 0
+            if size == offset:
+                continue
+            with open(path, "rb") as f:
+                f.seek(offset)
+                chunk = f.read(size - offset)
+            end = chunk.rfind(b"\n") + 1  # leave a partially written last line for next time
+            for line in chunk[:end].splitlines():
+                if line.strip():
+                    self.add_record(loads(line))
+            self.offsets[path] = offset + end
+
+    def unsent(self, newsletter_id: str, emails: Iterable[str]) -> List[str]:
+        self.refresh()
+        return [e for e in emails if (newsletter_id, e.strip().lower()) not in self.sent]
+
+_SEND_INDEX = _SendIndex()
+
+def already_sent(newsletter_id: str, email: str) -> bool:
+    return not _SEND_INDEX.unsent(newsletter_id, [email])
+
+def unsent_recipients(newsletter_id: str, emails: Iterable[str]) -> List[str]:
+    """emails minus those the send log already records for newsletter_id (order kept)."""
+    return _SEND_INDEX.unsent(newsletter_id, emails)
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point storage at an empty data/ tree with a fresh send index."""
+    for name, sub in (("ROOT", ""), ("CONTENT_DIR", "content"), ("PERF_DIR", "perf"), ("CRM_DIR", "crm")):
+        path = tmp_path / "data" / sub
+        path.mkdir(parents=True, exist_ok=True)
+        monkeypatch.setattr(storage, name, str(path).rstrip("/"))
+    monkeypatch.setattr(storage, "_SEND_INDEX", storage._SendIndex())
+    return tmp_path / "data"
+
+
+@pytest.fixture
+def mock_hubspot(monkeypatch):
+    """
+    Run hubspot_mock_server on a free port and point hubspot_client at it with a private
+    token and sending enabled. Yields the in-memory portal; seed contacts with portal.seed(n).
+    """
+    import hubspot_client as hc
+    import hubspot_mock_server as mock
+
+    server, portal = mock.serve(rate_limit=1_000_000, rate_interval_ms=1000, engagement=(0.5, 0.2, 0.0))
+    monkeypatch.setattr(hc, "BASE", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(hc, "AUTH_MODE", "private")
+    monkeypatch.setattr(hc, "HUB_TOKEN", "mock")
+    monkeypatch.setattr(hc, "SEND_ENABLED", True)
+    monkeypatch.setattr(hc, "_LIMITER", hc._RateLimiter(1_000_000, 1))
+    monkeypatch.setattr(hc, "_RETRY_BUDGET", hc._RetryBudget(hc.RETRY_BUDGET_RATIO, hc.RETRY_BUDGET_RESERVE))
+    monkeypatch.setattr(hc, "_CACHE", {})
+    yield portal
+    server.shutdown()
+    server.server_close()
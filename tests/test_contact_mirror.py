@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+
+import pytest
+
+import contact_mirror as mirror
+import hubspot_client as hc
+
+
+@pytest.fixture
+def db(data_dir, monkeypatch):
+    monkeypatch.setattr(mirror, "DB_PATH", str(data_dir / "crm" / "contacts.db"))
+    return mirror.DB_PATH
+
+
+def _seed(portal, n):
+    """n contacts, each modified one second after the previous one (well before now)."""
+    portal.seed(n)
+    for i, c in enumerate(portal.contacts.values()):
+        c["properties"]["lastmodifieddate"] = f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}.000Z"
+
+
+def _state(key):
+    conn = mirror._connect()
+    try:
+        return mirror._get_state(conn, key)
+    finally:
+        conn.close()
+
+
+def _ids():
+    conn = sqlite3.connect(mirror.DB_PATH)
+    try:
+        return [r[0] for r in conn.execute("SELECT id FROM contacts ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_sync_mirrors_contacts_and_answers_persona_queries(db, mock_hubspot):
+    mock_hubspot.seed(30)
+    res = mirror.sync(page_size=7)
+    assert (res["status"], res["synced"]) == ("ok", 30)
+    assert len(mirror.persona_emails("founder", max_age_s=3600)) == 10
+    assert mirror.counts_by_persona() == {"founder": 10, "creative": 10, "ops": 10}
+
+
+def test_sync_checkpoints_and_resumes_after_interruption(db, mock_hubspot, monkeypatch):
+    _seed(mock_hubspot, 50)
+    real_search = hc._iter_search
+
+    def dropped_after(n):
+        def search(*a, **kw):
+            for i, hit in enumerate(real_search(*a, **kw)):
+                if i == n:
+                    raise RuntimeError("connection dropped")
+                yield hit
+        return search
+
+    monkeypatch.setattr(hc, "_iter_search", dropped_after(23))
+    with pytest.raises(RuntimeError):
+        mirror.sync(page_size=5, checkpoint_every=10)
+    # the 20 checkpointed rows survive, and the cursor is the newest of them
+    assert len(_ids()) == 20
+    checkpoint = _state("cursor")
+    conn = sqlite3.connect(mirror.DB_PATH)
+    assert str(conn.execute("SELECT MAX(lastmodified) FROM contacts").fetchone()[0]) == checkpoint
+    conn.close()
+    assert _state("last_sync") is None
+
+    filters = []
+    monkeypatch.setattr(hc, "_iter_search", lambda t, f, *a, **kw: filters.append(f) or real_search(t, f, *a, **kw))
+    res = mirror.sync(page_size=5, checkpoint_every=10)
+    assert filters == [[{"propertyName": "lastmodifieddate", "operator": "GTE", "value": checkpoint}]]
+    assert res["synced"] == 31  # resumed at the checkpointed contact, not from the start
+    assert len(_ids()) == 50
+
+
+def test_incremental_sync_picks_up_changes(db, mock_hubspot):
+    _seed(mock_hubspot, 20)
+    mirror.sync()
+    mock_hubspot.upsert("user3@example.com", {hc.PERSONA_PROP: "ops_manager"})
+    mock_hubspot.upsert("new@example.com", {hc.PERSONA_PROP: "ops_manager"})
+    res = mirror.sync()
+    assert res["synced"] == 3  # the newest seeded contact (cursor is inclusive) and the two changes
+    assert {"user3@example.com", "new@example.com"} <= set(mirror.persona_emails("ops", max_age_s=3600))
+    assert "user3@example.com" not in mirror.persona_emails("founder", max_age_s=3600)
+
+
+def test_waiting_caller_reuses_a_fresh_sync(db, mock_hubspot, monkeypatch):
+    mock_hubspot.seed(10)
+    calls = []
+    real_search = hc._iter_search
+    monkeypatch.setattr(hc, "_iter_search", lambda *a, **kw: calls.append(1) or real_search(*a, **kw))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(mirror.sync(max_age_s=60))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert sorted(r["status"] for r in results) == ["fresh", "fresh", "fresh", "ok"]
+
+
+def test_first_real_sync_purges_simulated_contacts(db, mock_hubspot, monkeypatch):
+    monkeypatch.setattr(hc, "HUB_TOKEN", "")
+    assert mirror.sync()["status"] == "simulated"
+    assert _ids() and all(i.startswith("sim:") for i in _ids())
+
+    monkeypatch.setattr(hc, "HUB_TOKEN", "mock")
+    mock_hubspot.seed(3)
+    res = mirror.sync(full=True)
+    assert (res["purged"], _ids()) == (3, ["1", "2", "3"])
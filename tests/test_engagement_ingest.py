@@ -0,0 +1,122 @@
+import time
+
+import pytest
+
+import engagement_ingest as engagement
+import hubspot_client as hc
+import storage
+
+DAY = 86400
+
+
+@pytest.fixture
+def portal(data_dir, mock_hubspot, monkeypatch):
+    monkeypatch.setattr(engagement, "DB_PATH", str(data_dir / "perf" / "engagement.db"))
+    monkeypatch.setattr(engagement, "WINDOW_S", DAY)
+    mock_hubspot.engagement = (1.0, 1.0, 0.0)  # every delivery is opened and clicked
+    return mock_hubspot
+
+
+def _sent(nl_id, audience, recipients, ts):
+    storage.append_send_log({"ts": ts, "newsletter_id": nl_id, "audience": audience, "recipients": recipients,
+                             "hubspot_result": {"mode": "send"}})
+
+
+def _engage(portal, recipients, ts):
+    for to in recipients:
+        portal.engage(to, 7, created_ms=int(ts * 1000))
+
+
+def test_ingest_attributes_events_and_appends_metrics(portal):
+    now = time.time()
+    _sent("nl-1", "founder", ["a@x.com", "b@x.com"], now - 3 * DAY)
+    _sent("nl-2", "ops", ["a@x.com"], now - DAY)
+    _engage(portal, ["a@x.com", "b@x.com"], now - 3 * DAY + 60)
+    _engage(portal, ["a@x.com"], now - DAY + 60)
+
+    res = engagement.ingest()
+    assert (res["status"], res["events"], res["newsletters"]) == ("ok", 12, 2)
+    by_nl = {r["newsletter_id"]: r for r in storage.read_metrics()}
+    assert (by_nl["nl-1"]["delivered"], by_nl["nl-1"]["opens"], by_nl["nl-1"]["open_rate"]) == (2, 2, 1.0)
+    assert (by_nl["nl-2"]["audience"], by_nl["nl-2"]["clicks"]) == ("ops", 1)
+    assert engagement.persona_rates()["founder"] == {"open_rate": 1.0, "click_rate": 1.0, "unsub_rate": 0.0}
+
+    # the cursor moved past everything: a second run reads no events and writes no metrics
+    again = engagement.ingest()
+    assert (again["events"], again["newsletters"]) == (0, 0)
+    assert len(storage.read_metrics()) == 2
+
+
+def test_ingest_resumes_mid_window_after_interruption(portal, monkeypatch):
+    now = time.time()
+    recipients = [f"u{i}@x.com" for i in range(5)]
+    _sent("nl-1", "founder", recipients, now - 2 * DAY)
+    _engage(portal, recipients, now - 2 * DAY + 60)  # 20 events in one window
+
+    calls = []
+    real_req = hc._req
+
+    def flaky_req(method, path, **kw):
+        calls.append(dict(kw.get("params") or {}))
+        if len(calls) == 3:
+            raise RuntimeError("connection dropped")
+        return real_req(method, path, **kw)
+
+    monkeypatch.setattr(hc, "_req", flaky_req)
+    with pytest.raises(RuntimeError):
+        engagement.ingest(page_size=4)
+    monkeypatch.setattr(hc, "_req", real_req)
+
+    conn = engagement._connect()
+    try:
+        assert engagement._get_state(conn, "offset") == "8"
+        assert engagement._get_state(conn, "window_start") == str(calls[0]["startTimestamp"])
+        assert conn.execute("SELECT COUNT(*) FROM engagement").fetchone()[0] == 8
+    finally:
+        conn.close()
+
+    calls.clear()
+    monkeypatch.setattr(hc, "_req", lambda m, p, **kw: calls.append(dict(kw.get("params") or {})) or real_req(m, p, **kw))
+    res = engagement.ingest(page_size=4)
+    assert calls[0]["offset"] == "8"  # resumed inside the window, not from its start
+    assert res["events"] == 12
+    conn = engagement._connect()
+    try:
+        counts = dict(conn.execute("SELECT kind, COUNT(*) FROM engagement GROUP BY kind").fetchall())
+    finally:
+        conn.close()
+    assert counts == {"delivered": 5, "open": 5, "click": 5}
+
+
+def test_ingest_reads_send_log_only_within_horizon(portal, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(engagement, "ATTRIBUTION_HORIZON_S", 5 * DAY)
+    _sent("nl-old", "ops", ["a@x.com"], now - 20 * DAY)
+    _sent("nl-new", "founder", ["b@x.com"], now - 2 * DAY)
+    _engage(portal, ["a@x.com", "b@x.com"], now - DAY)  # a@x.com: too long after nl-old
+    cursor_ms = int((now - 3 * DAY) * 1000)
+    conn = engagement._connect()
+    try:
+        engagement._set_state(conn, "cursor", cursor_ms)
+        conn.commit()
+    finally:
+        conn.close()
+
+    starts = []
+    real_read = storage.read_send_log
+    monkeypatch.setattr(storage, "read_send_log", lambda start=None, end=None: starts.append(start) or real_read(start, end))
+    res = engagement.ingest()
+
+    assert starts == [storage._day_of_ts(cursor_ms / 1000.0 - 5 * DAY)]
+    assert (res["events"], res["attributed"], res["newsletters"]) == (8, 3, 1)
+    assert [r["newsletter_id"] for r in storage.read_metrics()] == ["nl-new"]
+
+
+def test_attribution_ignores_sends_past_the_horizon(data_dir, monkeypatch):
+    monkeypatch.setattr(engagement, "ATTRIBUTION_HORIZON_S", 5 * DAY)
+    _sent("nl-1", "ops", ["a@x.com"], 1_000_000)
+    attr = engagement._Attribution()
+    assert attr.newsletter_for("A@x.com", (1_000_000 + DAY) * 1000) == "nl-1"
+    assert attr.newsletter_for("a@x.com", (1_000_000 - 60) * 1000) == "nl-1"  # logged just after the send
+    assert attr.newsletter_for("a@x.com", (1_000_000 - 3600) * 1000) is None
+    assert attr.newsletter_for("a@x.com", (1_000_000 + 6 * DAY) * 1000) is None
@@ -0,0 +1,136 @@
+import threading
+
+import httplib2
+import pytest
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+
+import google_docs_client as gd
+
+
+class _Call:
+    def __init__(self, result=None, error=None):
+        self.result, self.error = result, error
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class FakeGoogle:
+    """Records docs/drive calls; get_status makes documents().get fail with that HTTP status."""
+
+    def __init__(self):
+        self.calls = []
+        self.get_status = None
+
+    # drive
+    def files(self):
+        return self
+
+    def permissions(self):
+        return self
+
+    def create(self, **kw):
+        if "fileId" in kw:
+            self.calls.append(("permission", kw["fileId"]))
+            return _Call({"id": "p"})
+        doc_id = f"doc{sum(1 for c in self.calls if c[0] == 'import') + 1}"
+        self.calls.append(("import", kw["body"]["name"]))
+        return _Call({"id": doc_id, "webViewLink": f"https://docs.google.com/document/d/{doc_id}/edit"})
+
+    # docs
+    def documents(self):
+        return self
+
+    def get(self, documentId, fields):
+        self.calls.append(("get", documentId))
+        if self.get_status:
+            return _Call(error=HttpError(httplib2.Response({"status": self.get_status}), b"{}"))
+        return _Call({"body": {"content": [{"endIndex": 1}, {"endIndex": 40}]}})
+
+    def batchUpdate(self, documentId, body):
+        self.calls.append(("update", documentId, [next(iter(r)) for r in body["requests"]]))
+        return _Call({})
+
+
+@pytest.fixture
+def google(data_dir, monkeypatch):
+    fake = FakeGoogle()
+    monkeypatch.setattr(gd, "INDEX_PATH", str(data_dir / "content" / "google_docs_index.json"))
+    monkeypatch.setattr(gd, "_services", lambda: (fake, fake))
+    monkeypatch.setattr(gd, "_CREDS", None)
+    return fake
+
+
+# ===== Service objects =====
+def test_services_are_built_once_per_thread_and_credentials(monkeypatch):
+    creds = [Credentials(token="t1")]
+    monkeypatch.setattr(gd, "_get_creds", lambda: creds[0])
+    monkeypatch.setattr(gd, "_LOCAL", threading.local())
+    built = []
+    real_build = gd.build
+    monkeypatch.setattr(gd, "build", lambda *a, **kw: built.append((a[0], kw["static_discovery"])) or real_build(*a, **kw))
+
+    first = gd._services()
+    assert gd._services() == first
+    assert built == [("docs", True), ("drive", True)]
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(gd._services()))
+    t.start()
+    t.join()
+    assert other[0][0] is not first[0] and len(built) == 4
+
+    creds[0] = Credentials(token="t2")
+    assert gd._services()[0] is not first[0] and len(built) == 6
+
+
+# ===== Doc index =====
+def test_upsert_creates_once_and_skips_unchanged_content(google):
+    url = gd.upsert_blog_doc("20250102-ai", "AI", "body")
+    assert url == "https://docs.google.com/document/d/doc1/edit"
+    assert google.calls == [("import", "AI"), ("permission", "doc1")]
+
+    assert gd.upsert_blog_doc("20250102-ai", "AI", "body") == url
+    assert len(google.calls) == 2
+    assert gd._load_index()["20250102-ai"]["documentId"] == "doc1"
+
+
+def test_upsert_replaces_changed_content_in_place(google):
+    url = gd.upsert_blog_doc("20250102-ai", "AI", "body")
+    assert gd.upsert_blog_doc("20250102-ai", "AI", "new body") == url
+    assert google.calls[2:] == [("get", "doc1"), ("update", "doc1", ["deleteContentRange", "insertText"])]
+
+
+def test_same_slug_on_another_day_gets_its_own_doc(google):
+    gd.upsert_blog_doc("20250102-ai", "AI", "body")
+    gd.upsert_blog_doc("20250309-ai", "AI", "body")
+    assert set(gd._load_index()) == {"20250102-ai", "20250309-ai"}
+    assert [c for c in google.calls if c[0] == "import"] == [("import", "AI"), ("import", "AI")]
+
+
+def test_upsert_adopts_known_url_instead_of_creating(google):
+    known = "https://docs.google.com/document/d/legacy_Id-1/edit?usp=sharing"
+    assert gd.upsert_blog_doc("20250102-ai", "AI", "body", known_url=known) == known
+    assert google.calls == [("get", "legacy_Id-1"), ("update", "legacy_Id-1", ["deleteContentRange", "insertText"])]
+
+
+def test_upsert_starts_a_fresh_doc_when_the_old_one_is_gone(google):
+    gd.upsert_blog_doc("20250102-ai", "AI", "body")
+    google.get_status = 404
+    assert gd.upsert_blog_doc("20250102-ai", "AI", "new body").endswith("/doc2/edit")
+    assert gd._load_index()["20250102-ai"]["documentId"] == "doc2"
+
+
+def test_upsert_raises_other_api_errors(google):
+    gd.upsert_blog_doc("20250102-ai", "AI", "body")
+    google.get_status = 500
+    with pytest.raises(HttpError):
+        gd.upsert_blog_doc("20250102-ai", "AI", "new body")
+
+
+def test_index_reads_legacy_bare_doc_ids(google):
+    gd._save_index({"20250102-ai": "abc"})
+    assert gd._load_index()["20250102-ai"] == {"documentId": "abc", "hash": None, "url": gd.doc_url("abc")}
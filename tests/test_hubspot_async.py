@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("httpx")
+
+import hubspot_async as hsa  # noqa: E402
+import hubspot_client as hc  # noqa: E402
+
+
+def _collect(agen):
+    async def run():
+        return [item async for item in agen]
+    return hsa.run_sync(run(), timeout=60)
+
+
+def test_async_search_matches_sync_client_past_result_cap(mock_hubspot, monkeypatch):
+    import hubspot_mock_server as mock
+    monkeypatch.setattr(mock, "SEARCH_RESULT_CAP", 1000)
+    monkeypatch.setattr(hc, "SEARCH_RESULT_CAP", 1000)
+    mock_hubspot.seed(7_500)  # 2,500 founders: two restarts past the cap
+    sync_ids = [c["id"] for c in hc.iter_contacts_by_persona("founder")]
+    async_ids = [c["id"] for c in _collect(hsa.iter_contacts_by_persona("founder"))]
+    assert len(sync_ids) == 2_500 == len(set(sync_ids))
+    assert async_ids == sync_ids
+
+
+def test_async_single_send_reports_like_sync_client(mock_hubspot):
+    seen = []
+    res = hsa.run_sync(hsa.single_send_marketing_email(
+        "7", ["a@x.com", "not-an-address"], {"persona": "founder"}, on_result=seen.append,
+    ))
+    assert res["mode"] == "send"
+    assert res["failed"] == ["not-an-address"]
+    assert sorted(r["to"] for r in seen) == ["a@x.com", "not-an-address"]
+    assert [r for r in seen if "error" in r][0]["retryable"] is False
+    assert [s["to"] for s in mock_hubspot.sends] == ["a@x.com"]
+
+
+def test_async_calls_fall_back_to_simulate_without_auth(monkeypatch):
+    monkeypatch.setattr(hc, "HUB_TOKEN", "")
+    monkeypatch.setattr(hc, "AUTH_MODE", "private")
+    assert hsa.run_sync(hsa.single_send_marketing_email("7", ["a@x.com"]))["mode"] == "simulate"
+    assert hsa.run_sync(hsa.ensure_persona_list("ops"))["status"] == "simulated"
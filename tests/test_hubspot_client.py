@@ -0,0 +1,283 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import hubspot_client as hc
+
+
+# ===== OAuth token cache =====
+@pytest.fixture
+def oauth(monkeypatch):
+    """Fake token exchange: counts calls, optionally blocks on a gate or fails."""
+    monkeypatch.setattr(hc, "_TOKEN", ("", 0.0))
+    monkeypatch.setattr(hc, "_ROTATED_REFRESH_TOKEN", "")
+    monkeypatch.setattr(hc, "TOKEN_REFRESH_SKEW", 300)
+
+    class Exchange:
+        calls = 0
+        gate = None
+        fail = False
+
+        def __call__(self):
+            Exchange.calls += 1
+            if self.gate is not None:
+                self.gate.wait(5)
+            if self.fail:
+                raise RuntimeError("token endpoint down")
+            return {"access_token": f"tok-{Exchange.calls}", "expires_in": 1800, "refresh_token": f"rt-{Exchange.calls}"}
+
+    exchange = Exchange()
+    monkeypatch.setattr(hc, "_exchange_refresh_token", exchange)
+    return exchange
+
+
+def test_token_is_cached_until_refresh_window(oauth):
+    assert hc._oauth_access_token() == "tok-1"
+    assert hc._oauth_access_token() == "tok-1"
+    assert oauth.calls == 1
+    assert hc._ROTATED_REFRESH_TOKEN == "rt-1"
+
+    hc.invalidate_oauth_token()
+    assert hc._oauth_access_token() == "tok-2"
+
+
+def test_expired_token_is_refreshed_once_for_all_waiting_threads(oauth):
+    oauth.gate = threading.Event()
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(hc._oauth_access_token())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    oauth.gate.set()
+    for t in threads:
+        t.join()
+    assert oauth.calls == 1
+    assert got == ["tok-1"] * 8
+
+
+def test_refresh_window_keeps_serving_the_valid_token(oauth, monkeypatch):
+    monkeypatch.setattr(hc, "_TOKEN", ("old", time.time() + 60))  # inside the 300 s skew, not expired
+    oauth.gate = threading.Event()
+    refreshed = []
+    refresher = threading.Thread(target=lambda: refreshed.append(hc._oauth_access_token()))
+    refresher.start()
+    time.sleep(0.05)
+    assert hc._oauth_access_token() == "old"  # no waiting while the refresh is in flight
+    oauth.gate.set()
+    refresher.join()
+    assert refreshed == ["tok-1"] and oauth.calls == 1
+
+
+def test_failed_proactive_refresh_falls_back_to_valid_token(oauth, monkeypatch):
+    monkeypatch.setattr(hc, "_TOKEN", ("old", time.time() + 60))
+    oauth.fail = True
+    assert hc._oauth_access_token() == "old"
+    monkeypatch.setattr(hc, "_TOKEN", ("old", time.time() - 1))
+    with pytest.raises(RuntimeError):
+        hc._oauth_access_token()
+
+
+def test_oauth_against_stand_in_server(mock_hubspot, monkeypatch):
+    monkeypatch.setattr(hc, "AUTH_MODE", "oauth")
+    monkeypatch.setattr(hc, "_TOKEN", ("", 0.0))
+    monkeypatch.setattr(hc, "_ROTATED_REFRESH_TOKEN", "")
+    for name in ("HUBSPOT_CLIENT_ID", "HUBSPOT_CLIENT_SECRET", "HUBSPOT_REFRESH_TOKEN"):
+        monkeypatch.setenv(name, "mock")
+    mock_hubspot.seed(3)
+    hits = list(hc._iter_search("contacts", [], ["email"]))
+    token = hc._TOKEN[0]
+    assert len(hits) == 3 and token.startswith("mock-")
+    assert len(list(hc._iter_search("contacts", [], ["email"]))) == 3
+    assert hc._TOKEN[0] == token
+
+
+# ===== Batch upsert =====
+def test_upsert_contacts_reports_207_partial_failure(mock_hubspot):
+    records = [{"email": f"u{i}@x.com", "properties": {"persona": "ops"}} for i in range(230)]
+    records[5] = {"email": "not-an-email", "properties": {}}
+    records.append({"email": "U1@x.com", "properties": {"firstname": "Una"}})  # merged into u1@x.com
+
+    res = hc.upsert_contacts(records)
+    assert (res["status"], res["count"], res["ok"], res["errors"]) == ("partial", 230, 229, 1)
+    assert res["results"][5] == {"status": "error", "email": "not-an-email", "detail": "Email address not-an-email is invalid"}
+    assert [r["email"] for r in res["results"][:3]] == ["u0@x.com", "u1@x.com", "u2@x.com"]
+
+    u1 = mock_hubspot.contacts[mock_hubspot.by_email["u1@x.com"]]["properties"]
+    assert (u1["firstname"], u1[hc.PERSONA_PROP]) == ("Una", "ops_manager")
+    assert hc._cache_get("contact:u2@x.com") == mock_hubspot.by_email["u2@x.com"]
+
+
+def test_upsert_contacts_failed_chunk_only_fails_its_records(mock_hubspot, monkeypatch):
+    monkeypatch.setattr(hc, "BATCH_SIZE", 150)  # the stand-in rejects batches over 100
+    res = hc.upsert_contacts([{"email": f"u{i}@x.com"} for i in range(200)])
+    assert (res["status"], res["ok"], res["errors"]) == ("partial", 50, 150)
+    assert {r["code"] for r in res["results"][:150]} == {400}
+    assert len(mock_hubspot.contacts) == 50
+
+
+def test_upsert_contacts_simulates_without_auth(monkeypatch):
+    monkeypatch.setattr(hc, "AUTH_MODE", "private")
+    monkeypatch.setattr(hc, "HUB_TOKEN", "")
+    res = hc.upsert_contacts([{"email": "a@x.com", "properties": {"persona": "founder"}}])
+    assert (res["status"], res["results"][0]["properties"][hc.PERSONA_PROP]) == ("simulated", "startup_founder")
+
+
+# ===== Bootstrap caching =====
+def _add_lists(portal, names):
+    for name in names:
+        portal.lists.append({"listId": str(1000 + len(portal.lists)), "name": name, "processingType": "DYNAMIC"})
+
+
+def test_ensure_persona_list_pages_past_100_lists_and_caches_names(mock_hubspot):
+    names = [f"Other list {i}" for i in range(230)]
+    names[215] = "[Auto] Persona: ops"
+    names[10] = "[Auto] Persona: founder"
+    _add_lists(mock_hubspot, names)
+
+    res = hc.ensure_persona_list("ops")
+    assert (res["status"], res["list_id"], res["created"]) == ("ok", "1215", False)
+    assert mock_hubspot.stats["requests"] == 3
+
+    # every name seen while paging was cached, so these need no calls at all
+    assert hc.ensure_persona_list("founder")["list_id"] == "1010"
+    assert hc.ensure_persona_list("ops")["cached"] is True
+    assert mock_hubspot.stats["requests"] == 3
+
+
+def test_ensure_persona_list_creates_missing_list_once(mock_hubspot):
+    _add_lists(mock_hubspot, [f"Other list {i}" for i in range(120)])
+    created = hc.ensure_persona_list("creative")
+    assert created["created"] is True
+    assert mock_hubspot.lists[-1]["name"] == "[Auto] Persona: creative"
+    assert hc.ensure_persona_list("creative")["list_id"] == created["list_id"]
+    assert len(mock_hubspot.lists) == 121
+
+    hc.invalidate_cache("list:")
+    assert hc.ensure_persona_list("creative") == {"status": "ok", "list_id": created["list_id"],
+                                                  "name": "[Auto] Persona: creative", "created": False}
+
+
+def test_ensure_persona_property_is_checked_once_per_ttl(mock_hubspot):
+    assert hc.ensure_persona_property()["created"] is True
+    assert hc.ensure_persona_property()["cached"] is True
+    assert mock_hubspot.stats["requests"] == 2  # GET 404, POST
+
+    hc.invalidate_cache("property:")
+    assert hc.ensure_persona_property() == {"status": "ok", "property_name": hc.PERSONA_PROP, "created": False}
+    assert mock_hubspot.stats["requests"] == 3
+
+
+# ===== Pooled session =====
+def test_session_is_built_once_and_shared_across_threads(monkeypatch):
+    monkeypatch.setattr(hc, "_SESSION", None)
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(hc._session())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(s) for s in seen}) == 1
+
+    adapter = seen[0].get_adapter(hc.BASE)
+    assert adapter._pool_maxsize == hc.POOL_SIZE
+    retry = adapter.max_retries
+    assert (retry.connect, retry.read, retry.status) == (hc.CONNECT_RETRIES, 0, 0)
+
+
+def test_calls_reuse_one_pooled_connection(mock_hubspot, monkeypatch):
+    monkeypatch.setattr(hc, "_SESSION", None)
+    mock_hubspot.seed(3)
+    for _ in range(5):
+        assert len(list(hc._iter_search("contacts", [], ["email"]))) == 3
+    pools = hc._session().get_adapter(hc.BASE).poolmanager.pools
+    assert [(pools[k].num_connections, pools[k].num_requests) for k in pools.keys()] == [(1, 5)]
+
+
+def test_refused_connect_is_retried_then_reported_as_never_sent(mock_hubspot, monkeypatch):
+    with socket.socket() as s:  # a port nothing listens on
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(hc, "BASE", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(hc, "CONNECT_RETRIES", 1)
+    monkeypatch.setattr(hc, "_SESSION", None)
+
+    res = hc._single_send_one(123, "a@x.com", {})
+    assert res["retryable"] is True and "ConnectionError" in res["error"]
+
+
+# ===== Parallel single-send =====
+def test_single_send_dispatches_each_recipient_once_in_order(mock_hubspot):
+    addrs = [f"r{i}@x.com" for i in range(40)]
+    seen = []
+    res = hc.single_send_marketing_email(123, addrs, {"k": "v"}, concurrency=8, on_result=seen.append)
+    assert [r["to"] for r in res["results"]] == addrs
+    assert (res["failed"], res["throughput"]["sent"], res["throughput"]["concurrency"]) == ([], 40, 8)
+    assert sorted(r["to"] for r in seen) == sorted(addrs)
+    assert sorted(s["to"] for s in mock_hubspot.sends) == sorted(addrs)
+    assert mock_hubspot.sends[0]["customProperties"] == {"k": "v"}
+
+
+def test_single_send_retries_only_retryable_failures(mock_hubspot, monkeypatch):
+    real = hc._single_send_one
+    flaky = {"b@x.com": 1}
+
+    def send_one(eid, addr, props, retry_statuses):
+        if flaky.get(addr):
+            flaky[addr] -= 1
+            return {"to": addr, "error": {"status": "error", "code": 503}, "retryable": True}
+        return real(eid, addr, props, retry_statuses)
+
+    monkeypatch.setattr(hc, "_single_send_one", send_one)
+    seen = []
+    res = hc.single_send_marketing_email(123, ["a@x.com", "b@x.com", "not-an-email"], retries=1, on_result=seen.append)
+    by_to = {r["to"]: r for r in res["results"]}
+    assert (by_to["a@x.com"]["attempts"], by_to["b@x.com"]["attempts"]) == (1, 2)
+    assert "error" not in by_to["b@x.com"]
+    assert (by_to["not-an-email"]["attempts"], by_to["not-an-email"]["retryable"]) == (1, False)
+    assert res["failed"] == ["not-an-email"]
+    assert len(seen) == 3  # one final outcome each, not one per attempt
+
+
+def test_single_send_with_no_retries_is_one_post_per_recipient(mock_hubspot):
+    mock_hubspot.rate_limit = 1
+    mock_hubspot.hits.append(time.monotonic())  # window already full: the send gets a 429
+    res = hc.single_send_marketing_email(123, ["a@x.com"], retries=0, retry_statuses=())
+    assert (res["failed"], res["results"][0]["retryable"]) == (["a@x.com"], True)
+    assert mock_hubspot.stats["requests"] == 1
+
+
+def test_single_send_simulates_when_sending_is_disabled(mock_hubspot, monkeypatch):
+    monkeypatch.setattr(hc, "SEND_ENABLED", False)
+    res = hc.single_send_marketing_email(123, ["a@x.com"])
+    assert res["mode"] == "simulate" and mock_hubspot.stats["requests"] == 0
+
+
+# ===== Contact id lookup =====
+def test_resolve_contact_ids_batches_per_100_and_caches(mock_hubspot):
+    mock_hubspot.seed(150)
+    emails = [f"user{i}@example.com" for i in range(150)] + [f"new{i}@x.com" for i in range(60)]
+    ids = hc.resolve_contact_ids(emails + [" USER0@example.com "])
+    assert list(ids) == [e.lower() for e in emails]
+    assert ids["user7@example.com"] == mock_hubspot.by_email["user7@example.com"]
+    assert ids["new3@x.com"] is None
+    assert mock_hubspot.stats["requests"] == 3
+
+    assert hc.resolve_contact_ids(emails) == ids
+    assert mock_hubspot.stats["requests"] == 3
+
+
+def test_resolve_contact_ids_rereads_misses_after_their_shorter_ttl(mock_hubspot, monkeypatch):
+    monkeypatch.setattr(hc, "CONTACT_MISS_TTL", 0)
+    assert hc.resolve_contact_ids(["late@x.com"]) == {"late@x.com": None}
+    mock_hubspot.upsert("late@x.com", {})
+    assert hc.resolve_contact_ids(["late@x.com"]) == {"late@x.com": mock_hubspot.by_email["late@x.com"]}
+    assert hc.resolve_contact_ids(["late@x.com"])["late@x.com"]
+    assert mock_hubspot.stats["requests"] == 2
+
+
+def test_resolve_contact_ids_without_auth_finds_nothing(monkeypatch):
+    monkeypatch.setattr(hc, "AUTH_MODE", "private")
+    monkeypatch.setattr(hc, "HUB_TOKEN", "")
+    assert hc.resolve_contact_ids(["a@x.com", "A@x.com"]) == {"a@x.com": None}
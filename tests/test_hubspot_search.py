@@ -0,0 +1,71 @@
+import pytest
+
+import hubspot_client as hc
+import hubspot_mock_server as mock
+
+
+def _walk(sort_prop, filters=(), **kw):
+    return list(hc._iter_search("contacts", list(filters), ["email", "lastmodifieddate"], sort_prop=sort_prop, **kw))
+
+
+def test_search_streams_past_result_cap_without_duplicates(mock_hubspot):
+    mock_hubspot.seed(10_500)
+    by_id = _walk("hs_object_id")
+    assert [h["id"] for h in by_id] == [str(i) for i in range(1, 10_501)]
+
+    # seeding writes several contacts per millisecond, so the restart lands inside tie groups
+    by_modified = _walk("lastmodifieddate")
+    assert len(by_modified) == 10_500 == len({h["id"] for h in by_modified})
+    stamps = [mock._num(h["properties"]["lastmodifieddate"]) for h in by_modified]
+    assert stamps == sorted(stamps)
+
+
+def test_search_pages_through_tie_group_larger_than_cap(mock_hubspot, monkeypatch):
+    monkeypatch.setattr(mock, "SEARCH_RESULT_CAP", 200)
+    monkeypatch.setattr(hc, "SEARCH_RESULT_CAP", 200)
+    mock_hubspot.seed(700)
+    for i, c in enumerate(mock_hubspot.contacts.values()):
+        # 150 contacts before, 450 sharing one timestamp (over two caps), 100 after
+        c["properties"]["lastmodifieddate"] = str(1000 + min(max(i, 149), 150) + max(0, i - 599))
+
+    hits = _walk("lastmodifieddate", page_size=50)
+    ids = [h["id"] for h in hits]
+    assert len(ids) == 700 == len(set(ids))
+    tied = [h["id"] for h in hits if h["properties"]["lastmodifieddate"] == "1150"]
+    assert tied == sorted(tied, key=int) and len(tied) == 450
+
+
+def test_search_filters_apply_across_restarts(mock_hubspot, monkeypatch):
+    monkeypatch.setattr(mock, "SEARCH_RESULT_CAP", 200)
+    monkeypatch.setattr(hc, "SEARCH_RESULT_CAP", 200)
+    mock_hubspot.seed(900)
+    flt = [{"propertyName": hc.PERSONA_PROP, "operator": "EQ", "value": "ops_manager"}]
+    hits = list(hc._iter_search("contacts", flt, ["email", hc.PERSONA_PROP], page_size=30, prefetch=False))
+    assert len(hits) == 300 and {h["properties"][hc.PERSONA_PROP] for h in hits} == {"ops_manager"}
+
+
+def test_search_raises_when_a_tie_restart_makes_no_progress(monkeypatch):
+    monkeypatch.setattr(hc, "SEARCH_RESULT_CAP", 3)
+    page = {
+        "results": [{"id": str(i), "properties": {"lastmodifieddate": "5"}} for i in (1, 2)],
+        "paging": {"next": {"after": "2"}},
+    }
+    # a broken server that ignores the hs_object_id floor and keeps returning the same hits
+    monkeypatch.setattr(hc, "_req", lambda *a, **kw: page)
+    with pytest.raises(RuntimeError, match="no progress"):
+        _walk("lastmodifieddate", page_size=2, prefetch=False)
+
+
+def test_search_walk_builds_restart_requests():
+    walk = hc._SearchWalk("contacts", [], ["email"], page_size=2, sort_prop="lastmodifieddate")
+    state = walk.start()
+    assert walk.body(state)["sorts"] == [{"propertyName": "lastmodifieddate", "direction": "ASCENDING"}]
+
+    tie = {**state, "tie": "5", "id_floor": "9"}
+    body = walk.body(tie)
+    assert body["sorts"] == [{"propertyName": "hs_object_id", "direction": "ASCENDING"}]
+    assert {(f["propertyName"], f["operator"], f["value"]) for f in body["filterGroups"][0]["filters"]} == {
+        ("lastmodifieddate", "GTE", "5"), ("lastmodifieddate", "LTE", "5"), ("hs_object_id", "GT", "9"),
+    }
+    # the tie group ran out: continue strictly after its value
+    assert walk.following(tie, {"results": []}) == {"after": None, "floor": "5", "tie": None, "id_floor": None}
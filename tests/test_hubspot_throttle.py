@@ -0,0 +1,104 @@
+import pytest
+
+import hubspot_client as hc
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Resp:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(hc.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def fresh_limits(clock, monkeypatch):
+    monkeypatch.setattr(hc, "_LIMITER", hc._RateLimiter(100, 10, burst=0.1))
+    monkeypatch.setattr(hc, "_RETRY_BUDGET", hc._RetryBudget(0.5, 2))
+    return hc._LIMITER, hc._RETRY_BUDGET
+
+
+# ===== _RateLimiter =====
+def test_limiter_spends_burst_then_paces(clock):
+    limiter = hc._RateLimiter(100, 10, burst=0.1)  # 10-token burst, then 9 calls/s
+    assert [limiter.reserve() for _ in range(10)] == [0.0] * 10
+    assert limiter.reserve() == pytest.approx(1 / 9)
+    assert limiter.reserve() == pytest.approx(2 / 9)
+
+    clock.now += 1.0  # refills 9 tokens, paying back the debt of 2
+    assert limiter.tokens == -2
+    limiter.reserve()
+    assert limiter.tokens == pytest.approx(6)
+
+
+def test_limiter_follows_rate_limit_headers(clock):
+    limiter = hc._RateLimiter(100, 10, burst=0.1)
+    limiter.observe({
+        "X-HubSpot-RateLimit-Max": "50",
+        "X-HubSpot-RateLimit-Interval-Milliseconds": "1000",
+        "X-HubSpot-RateLimit-Remaining": "2",
+    })
+    assert (limiter.capacity, limiter.rate, limiter.tokens) == (5.0, 45.0, 2.0)
+    limiter.observe({"X-HubSpot-RateLimit-Remaining": "40"})  # never adds tokens
+    assert limiter.tokens == 2.0
+
+
+def test_limiter_pause_holds_every_caller(clock):
+    limiter = hc._RateLimiter(100, 10, burst=0.1)
+    limiter.pause(5)
+    assert limiter.tokens == 0
+    assert limiter.reserve() == pytest.approx(5)
+    clock.now += 5
+    assert limiter.reserve() == 0
+
+
+# ===== _RetryBudget =====
+def test_retry_budget_is_earned_by_calls():
+    budget = hc._RetryBudget(0.5, 2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    for _ in range(10):
+        budget.deposit()
+    assert budget.balance == 2
+
+
+# ===== _retry_delay =====
+def test_retry_delay_gives_up_on_other_statuses(fresh_limits):
+    assert hc._retry_delay(_Resp(400), 0) is None
+    assert hc._retry_delay(_Resp(502), 0, hc._SINGLE_SEND_RETRY_STATUSES) is None
+    assert hc._retry_delay(_Resp(503), hc.MAX_RETRIES) is None
+    assert fresh_limits[1].balance == 2  # refusals spend nothing
+
+
+def test_retry_delay_honors_retry_after(fresh_limits):
+    assert hc._retry_delay(_Resp(503, {"Retry-After": "3"}), 0) == 3
+
+
+def test_retry_delay_on_429_pauses_the_limiter(fresh_limits):
+    limiter, _ = fresh_limits
+    delay = hc._retry_delay(_Resp(429, {"Retry-After": "2"}), 0)
+    assert 2 <= delay <= 2 + hc.RETRY_BACKOFF_BASE / 4
+    assert limiter.reserve() == pytest.approx(delay)
+
+
+def test_retry_delay_stops_when_budget_is_spent(fresh_limits):
+    assert hc._retry_delay(_Resp(503), 0) is not None
+    assert hc._retry_delay(_Resp(503), 0) is not None
+    assert hc._retry_delay(_Resp(503), 0) is None
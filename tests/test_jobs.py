@@ -0,0 +1,48 @@
+import pytest
+
+import contact_mirror as mirror
+import hubspot_client as hc
+import jobs
+import outbox
+
+
+@pytest.fixture
+def send_job(data_dir, mock_hubspot, monkeypatch):
+    monkeypatch.setattr(jobs, "DB_PATH", str(data_dir / "jobs.db"))
+    monkeypatch.setattr(outbox, "DB_PATH", str(data_dir / "crm" / "outbox.db"))
+    monkeypatch.setattr(mirror, "DB_PATH", str(data_dir / "crm" / "contacts.db"))
+    monkeypatch.setattr(outbox, "ensure_worker", lambda: False)
+    calls = []
+    real_send = hc._send
+    monkeypatch.setattr(hc, "_send", lambda method, path, **kw: calls.append(path) or real_send(method, path, **kw))
+
+    def run(personas):
+        return jobs._KINDS["send_personas"](jobs.JobContext("test"), personas, email_id="7", blog_title="AI")
+    run.calls = calls
+    return run
+
+
+def test_send_job_creates_only_unknown_typed_recipients(send_job, mock_hubspot):
+    mock_hubspot.upsert("known@x.com", {hc.PERSONA_PROP: "creative_professional"})
+    res = send_job({"ops": {"newsletter_id": "nl-ops", "recipients": ["known@x.com", "new@x.com"]}})
+
+    assert res["queued"]["ops"]["contacts_created"] == 1
+    assert res["sent"]["ops"] == {"sent": 2}
+    assert send_job.calls.count("/crm/v3/objects/contacts/batch/read") == 1
+    batch = [c for c in send_job.calls if c.endswith("/batch/upsert")]
+    assert len(batch) == 1
+    props = lambda email: mock_hubspot.contacts[mock_hubspot.by_email[email]]["properties"]
+    assert props("new@x.com")[hc.PERSONA_PROP] == "ops_manager"
+    assert props("known@x.com")[hc.PERSONA_PROP] == "creative_professional"  # existing contact untouched
+    assert sorted(s["to"] for s in mock_hubspot.sends) == ["known@x.com", "new@x.com"]
+
+
+def test_send_job_skips_contact_writes_for_mirrored_recipients(send_job, mock_hubspot):
+    mock_hubspot.seed(9)
+    mirror.sync()
+    res = send_job({"founder": {"newsletter_id": "nl-f", "recipients": None}})
+
+    assert res["queued"]["founder"]["contacts_created"] == 0
+    assert res["sent"]["founder"] == {"sent": 3}
+    assert not [c for c in send_job.calls if "/batch/" in c]
+    assert res["logged"] == 3
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import metrics_rollup as rollup
+
+DAY = 86400
+
+
+def _metrics(days, audiences=("founder", "ops")):
+    return pd.DataFrame([
+        {"ts": 1735689600 + d * DAY + h * 3600, "audience": a, "open_rate": (d % 7) / 10 + h / 100}
+        for d in range(days) for h in (1, 13) for a in audiences
+    ])
+
+
+# ===== lttb =====
+def test_lttb_keeps_short_series():
+    assert list(rollup.lttb(np.arange(5), np.arange(5), 10)) == [0, 1, 2, 3, 4]
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(100)
+    y = np.zeros(100)
+    y[37], y[71] = 10, -10
+    keep = rollup.lttb(x, y, 10)
+    assert len(keep) == 10
+    assert keep[0] == 0 and keep[-1] == 99
+    assert list(keep) == sorted(set(keep))
+    assert {37, 71} <= set(keep)
+
+
+# ===== rollup / chart_frame =====
+def test_rollup_means_and_counts_per_bucket():
+    frame = rollup.rollup(_metrics(3), "open_rate", "day")
+    assert list(frame.columns) == ["bucket", "audience", "mean", "count"]
+    assert len(frame) == 6
+    assert set(frame["count"]) == {2}
+    first = frame[frame["audience"] == "founder"].iloc[0]
+    assert first["mean"] == pytest.approx((0.01 + 0.13) / 2)
+    assert rollup.rollup(_metrics(14), "open_rate", "week")["count"].sum() == 56
+
+
+def test_rollup_handles_missing_metric_and_bad_bucket():
+    assert rollup.rollup(_metrics(1), "click_rate").empty
+    with pytest.raises(ValueError):
+        rollup.rollup(_metrics(1), "open_rate", "month")
+
+
+def test_chart_frame_caps_points_per_audience():
+    frame = rollup.chart_frame(_metrics(200), "open_rate", bucket="day", max_points=50)
+    assert frame.groupby("audience").size().to_dict() == {"founder": 50, "ops": 50}
+    assert len(rollup.chart_frame(_metrics(200), "open_rate", max_points=None)) == 400
+
+
+def test_max_points_default_stays_in_widget_range():
+    lo, hi = rollup.POINTS_RANGE
+    assert lo <= rollup.MAX_POINTS <= hi
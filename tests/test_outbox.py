@@ -0,0 +1,182 @@
+import json
+import sqlite3
+import time
+
+import pytest
+
+import outbox
+import storage
+
+
+@pytest.fixture
+def box(data_dir, monkeypatch):
+    monkeypatch.setattr(outbox, "DB_PATH", str(data_dir / "crm" / "outbox.db"))
+    monkeypatch.setattr(outbox.hs, "can_send", lambda: True)
+    conn = outbox._connect()
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def _row(conn, key):
+    return conn.execute("SELECT * FROM outbox WHERE idem_key = ?", (key,)).fetchone()
+
+
+def _enqueue(nl_id, recipients):
+    return outbox.enqueue(nl_id, recipients, email_id="123", audience="founder")
+
+
+# ===== Producer side =====
+def test_enqueue_is_idempotent(box):
+    assert _enqueue("nl-1", ["A@x.com", "a@x.com ", "b@x.com", ""])["enqueued"] == 2
+    again = _enqueue("nl-1", ["a@x.com", "c@x.com"])
+    assert (again["mode"], again["enqueued"], again["duplicates"]) == ("send", 1, 1)
+    assert outbox.status("nl-1") == {"pending": 3}
+
+
+def test_enqueue_skips_recipients_already_in_send_log(box):
+    storage.append_send_log({"ts": time.time(), "newsletter_id": "nl-1", "recipients": ["a@x.com"]})
+    assert _enqueue("nl-1", ["a@x.com", "b@x.com"])["enqueued"] == 1
+
+
+def test_simulated_rows_do_not_block_a_real_send(box, monkeypatch):
+    monkeypatch.setattr(outbox.hs, "can_send", lambda: False)
+    res = _enqueue("nl-1", ["a@x.com"])
+    assert (res["mode"], res["enqueued"]) == ("simulate", 1)
+    assert _row(box, "sim:nl-1:a@x.com")["mode"] == "simulate"
+
+    monkeypatch.setattr(outbox.hs, "can_send", lambda: True)
+    assert _enqueue("nl-1", ["a@x.com"])["enqueued"] == 1
+    assert _enqueue("nl-1", ["a@x.com"])["duplicates"] == 1
+
+
+# ===== Claims and leases =====
+def test_claim_leases_rows_until_expiry(box, monkeypatch):
+    _enqueue("nl-1", ["a@x.com", "b@x.com"])
+    rows = outbox._claim(box, 10)
+    assert [r["recipient"] for r in rows] == ["a@x.com", "b@x.com"]
+    assert _row(box, "nl-1:a@x.com")["state"] == "inflight"
+    assert _row(box, "nl-1:a@x.com")["attempts"] == 1
+    assert outbox._claim(box, 10) == []
+
+    # a crashed worker's lease runs out and the rows are claimable again
+    box.execute("UPDATE outbox SET lease_until = ?", (time.time() - 1,))
+    assert len(outbox._claim(box, 10)) == 2
+    assert _row(box, "nl-1:a@x.com")["attempts"] == 2
+
+
+def test_claim_filters_by_newsletter_and_limit(box):
+    _enqueue("nl-1", ["a@x.com", "b@x.com"])
+    _enqueue("nl-2", ["c@x.com"])
+    assert [r["recipient"] for r in outbox._claim(box, 10, ["nl-2"])] == ["c@x.com"]
+    assert len(outbox._claim(box, 1)) == 1
+
+
+def test_real_rows_wait_while_sending_is_disabled(box, monkeypatch):
+    _enqueue("nl-1", ["a@x.com"])
+    monkeypatch.setattr(outbox.hs, "can_send", lambda: False)
+    _enqueue("nl-2", ["b@x.com"])
+    assert [r["idem_key"] for r in outbox._claim(box, 10)] == ["sim:nl-2:b@x.com"]
+
+
+# ===== _mark =====
+def test_mark_success(box):
+    _enqueue("nl-1", ["a@x.com"])
+    outbox._claim(box, 10)
+    assert outbox._mark(box, "nl-1:a@x.com", {"to": "a@x.com", "response": {"id": 1}}, 1) == "sent"
+    row = _row(box, "nl-1:a@x.com")
+    assert (row["lease_until"], json.loads(row["result"])) == (None, {"id": 1})
+
+
+def test_mark_transient_error_backs_off(box, monkeypatch):
+    monkeypatch.setattr(outbox, "RETRY_BASE_S", 60)
+    _enqueue("nl-1", ["a@x.com"])
+    outbox._claim(box, 10)
+    outcome = {"to": "a@x.com", "error": {"code": 429}, "retryable": True}
+    assert outbox._mark(box, "nl-1:a@x.com", outcome, 1) == "pending"
+    row = _row(box, "nl-1:a@x.com")
+    assert row["next_attempt_at"] - time.time() >= 25
+    assert json.loads(row["last_error"]) == {"code": 429}
+    assert outbox._claim(box, 10) == []
+
+    box.execute("UPDATE outbox SET next_attempt_at = ?", (time.time() - 1,))
+    assert len(outbox._claim(box, 10)) == 1
+
+
+@pytest.mark.parametrize("outcome", [
+    {"to": "a@x.com", "error": {"code": 400}},
+    {"to": "a@x.com", "error": {"code": 500}, "retryable": False},
+    {"to": "a@x.com", "error": "ReadTimeout", "retryable": False},
+])
+def test_mark_permanent_error_fails_first_time(box, outcome):
+    _enqueue("nl-1", ["a@x.com"])
+    outbox._claim(box, 10)
+    assert outbox._mark(box, "nl-1:a@x.com", outcome, 1) == "failed"
+
+
+def test_mark_gives_up_after_max_attempts(box):
+    _enqueue("nl-1", ["a@x.com"])
+    outcome = {"to": "a@x.com", "error": {"code": 503}, "retryable": True}
+    assert outbox._mark(box, "nl-1:a@x.com", outcome, outbox.MAX_ATTEMPTS - 1) == "pending"
+    assert outbox._mark(box, "nl-1:a@x.com", outcome, outbox.MAX_ATTEMPTS) == "failed"
+
+
+def test_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(outbox, "RETRY_BASE_S", 30)
+    monkeypatch.setattr(outbox, "RETRY_CAP_S", 100)
+    assert 15 <= outbox._backoff(1) <= 30
+    assert 50 <= outbox._backoff(10) <= 100
+
+
+# ===== drain =====
+def test_drain_simulates_without_calling_hubspot(box, monkeypatch):
+    monkeypatch.setattr(outbox.hs, "can_send", lambda: False)
+    monkeypatch.setattr(outbox.hs, "single_send_marketing_email", lambda **kw: pytest.fail("called HubSpot"))
+    _enqueue("nl-1", ["a@x.com", "b@x.com"])
+
+    assert outbox.drain() == {"sent": 0, "simulated": 2, "pending": 0, "failed": 0}
+    [record] = storage.read_send_log()
+    assert record["hubspot_result"]["mode"] == "simulate"
+    assert storage.unsent_recipients("nl-1", ["a@x.com"]) == ["a@x.com"]
+
+
+def test_drain_records_each_outcome_and_logs_deliveries(box, monkeypatch):
+    def fake_send(*, email_id, to_addresses, custom_props, concurrency, retries, retry_statuses, on_result):
+        assert (retries, tuple(retry_statuses)) == (0, ())  # the outbox owns retries
+        for addr in to_addresses:
+            if addr.startswith("bad"):
+                on_result({"to": addr, "error": {"code": 400}, "retryable": False})
+            else:
+                on_result({"to": addr, "response": {"status": "ok"}})
+        return {"mode": "send"}
+
+    monkeypatch.setattr(outbox.hs, "single_send_marketing_email", fake_send)
+    _enqueue("nl-1", ["a@x.com", "bad@x.com"])
+
+    assert outbox.drain() == {"sent": 1, "simulated": 0, "pending": 0, "failed": 1}
+    assert outbox.status("nl-1") == {"sent": 1, "failed": 1}
+    [record] = storage.read_send_log()
+    assert record["recipients"] == ["a@x.com"]
+    assert storage.unsent_recipients("nl-1", ["a@x.com", "bad@x.com"]) == ["bad@x.com"]
+    assert outbox.drain()["sent"] == 0  # nothing claimable, nothing logged twice
+    assert len(storage.read_send_log()) == 1
+
+
+def test_deferred_rows_wait_for_the_owners_flush(box, monkeypatch):
+    monkeypatch.setattr(outbox.hs, "can_send", lambda: False)
+    outbox.enqueue("nl-1", ["a@x.com"], email_id="123", defer_log=True)
+    outbox.drain()
+    assert storage.read_send_log() == []
+    assert outbox.flush_send_log(newsletter_ids=["nl-1"]) == 1
+    assert len(storage.read_send_log()) == 1
+
+
+def test_throttled_send_is_one_post_per_attempt(box, mock_hubspot):
+    mock_hubspot.rate_limit = 1
+    mock_hubspot.hits.append(time.monotonic())  # window already full: the send gets a 429
+    _enqueue("nl-1", ["a@x.com"])
+
+    assert outbox.drain() == {"sent": 0, "simulated": 0, "pending": 1, "failed": 0}
+    assert mock_hubspot.stats["throttled"] == 1
+    row = _row(box, "nl-1:a@x.com")
+    assert (row["attempts"], row["next_attempt_at"] > time.time()) == (1, True)
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+import storage
+
+
+# ===== loads =====
+@pytest.mark.parametrize("value", [{"a": 1}, [1, 2], "text", 42, 1.5, True, None])
+def test_loads_reads_any_json_value(value):
+    assert storage.loads(json.dumps(value).encode()) == value
+    assert storage.loads(json.dumps(value)) == value
+
+
+@pytest.mark.parametrize("fmt", ["pretty", "compact"])
+def test_loads_round_trips_json_backends(fmt):
+    obj = {"slug": "ai", "n": [1, 2, 3], "é": "ü"}
+    assert storage.loads(storage.dumps(obj, fmt)) == obj
+
+
+def test_loads_falls_back_to_msgpack():
+    pytest.importorskip("msgpack")
+    obj = {"slug": "ai", "n": [1, 2, 3]}
+    assert storage.loads(storage.dumps(obj, "msgpack")) == obj
+
+
+def test_loads_raises_on_garbage():
+    with pytest.raises(ValueError):
+        storage.loads(b"{not json")
+
+
+def test_read_json_reads_doc_in_any_format(data_dir):
+    pytest.importorskip("msgpack")
+    path = data_dir / "doc.bin"
+    storage.write_doc(path, {"summary": "ok"}, fmt="msgpack")
+    assert storage.read_json(str(path)) == {"summary": "ok"}
+
+
+# ===== Partitions =====
+def _touch_partitions(kind_dir, days):
+    for day in days:
+        (kind_dir / f"date={day}").mkdir(parents=True)
+
+
+def test_list_partitions_prunes_by_date_inclusive(data_dir):
+    perf = data_dir / "perf"
+    _touch_partitions(perf, ["2025-01-01", "2025-01-02", "2025-01-03", "2025-01-04"])
+    (perf / "date=2025-01-05").write_text("not a dir")
+
+    names = lambda parts: [p.rsplit("date=", 1)[1] for p in parts]
+    assert names(storage.list_partitions(str(perf))) == ["2025-01-01", "2025-01-02", "2025-01-03", "2025-01-04"]
+    assert names(storage.list_partitions(str(perf), "2025-01-02", "2025-01-03")) == ["2025-01-02", "2025-01-03"]
+    assert names(storage.list_partitions(str(perf), start="2025-01-04")) == ["2025-01-04"]
+    assert names(storage.list_partitions(str(perf), end="2025-01-01")) == ["2025-01-01"]
+
+
+def test_read_metrics_combines_partitions_and_legacy_file(data_dir):
+    day1, day2 = 1735732800, 1735819200  # 2025-01-01 / 2025-01-02 12:00 UTC
+    storage.append_metrics({"ts": day1, "open_rate": 0.1})
+    storage.append_metrics({"ts": day2, "open_rate": 0.2})
+    storage.append_jsonl(f"{storage.PERF_DIR}/{storage.METRICS_FILE}", {"ts": day1, "open_rate": 0.3})
+
+    assert sorted(r["open_rate"] for r in storage.read_metrics()) == [0.1, 0.2, 0.3]
+    second = storage._day_of_ts(day2)
+    assert [r["open_rate"] for r in storage.read_metrics(start=second)] == [0.2]
+
+
+# ===== Send dedup index =====
+def _send_record(nl_id, recipients, mode="send", ts=1735732800):
+    return {"ts": ts, "newsletter_id": nl_id, "recipients": recipients, "hubspot_result": {"mode": mode}}
+
+
+def test_unsent_recipients_skips_logged_pairs(data_dir):
+    storage.append_send_log(_send_record("nl-1", ["a@x.com"]))
+    assert storage.unsent_recipients("nl-1", ["A@x.com", "b@x.com"]) == ["b@x.com"]
+    assert storage.unsent_recipients("nl-2", ["a@x.com"]) == ["a@x.com"]
+    assert storage.already_sent("nl-1", " a@x.com ")
+
+
+def test_simulated_sends_never_count_as_delivered(data_dir):
+    storage.append_send_logs([_send_record("nl-1", ["a@x.com"], mode="simulate")])
+    assert storage.unsent_recipients("nl-1", ["a@x.com"]) == ["a@x.com"]
+
+
+def test_legacy_records_count_only_successful_results(data_dir):
+    storage.append_send_log({
+        "ts": 1735732800,
+        "newsletter_id": "nl-1",
+        "hubspot_result": {"results": [{"to": "a@x.com", "response": {}}, {"to": "b@x.com", "error": {"code": 400}}]},
+    })
+    assert storage.unsent_recipients("nl-1", ["a@x.com", "b@x.com"]) == ["b@x.com"]
+
+
+def test_send_index_follows_appends_from_other_writers(data_dir):
+    index = storage._SEND_INDEX
+    assert index.unsent("nl-1", ["a@x.com"]) == ["a@x.com"]
+
+    # another process appends to the log file directly; only the new bytes get parsed
+    path = f"{storage.partition_dir(storage.CRM_DIR, '2025-01-01')}/{storage.SEND_LOG_FILE}"
+    storage.append_jsonl(path, _send_record("nl-1", ["a@x.com"]))
+    assert index.unsent("nl-1", ["a@x.com", "b@x.com"]) == ["b@x.com"]
+    offset = index.offsets[path]
+
+    # a partially written last line waits until it is complete
+    with open(path, "ab") as f:
+        f.write(json.dumps(_send_record("nl-1", ["b@x.com"])).encode()[:20])
+    assert index.unsent("nl-1", ["b@x.com"]) == ["b@x.com"]
+    assert index.offsets[path] == offset
+    with open(path, "ab") as f:
+        f.write(json.dumps(_send_record("nl-1", ["b@x.com"])).encode()[20:] + b"\n")
+    assert index.unsent("nl-1", ["b@x.com"]) == []
+
+
+def test_send_index_rereads_truncated_file(data_dir):
+    path = f"{storage.CRM_DIR}/{storage.SEND_LOG_FILE}"
+    storage.append_jsonl(path, _send_record("nl-1", ["a@x.com", "b@x.com"]))
+    index = storage._SEND_INDEX
+    index.refresh()
+    with open(path, "wb") as f:
+        f.write(json.dumps(_send_record("nl-2", ["c@x.com"])).encode() + b"\n")
+    assert index.unsent("nl-2", ["c@x.com"]) == []
+
+
+def test_list_content_files_skips_non_content_json(data_dir):
+    content = data_dir / "content"
+    (content / "date=2025-01-02").mkdir()
+    (content / "date=2025-01-02" / "20250102-ai.json").write_text("{}")
+    (content / "20241231-legacy.json").write_text("{}")
+    (content / "google_docs_index.json").write_text("{}")
+
+    names = lambda files: [f.rsplit("/", 1)[1] for f in files]
+    assert names(storage.list_content_files()) == ["20241231-legacy.json", "20250102-ai.json"]
+    assert names(storage.list_content_files(start="2025-01-01")) == ["20250102-ai.json"]